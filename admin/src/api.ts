@@ -1 +1,2 @@
-export { default } from "@shared/apiClient";
+export { default, fetchAllPages } from "@shared/apiClient";
+export type { Page } from "@shared/apiClient";
@@ -48,7 +48,7 @@ function UsersManagement({ userPermissions = [] }: UsersManagementProps) {
     const fetchUsers = async () => {
         try {
             const res = await api.get(`/api/users/?search=${search}`);
-            setUsers(res.data);
+            setUsers(res.data.results);
         } catch (error) {
             console.error('Error fetching users', error);
         }
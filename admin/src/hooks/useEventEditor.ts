@@ -1,6 +1,6 @@
 import { useState, useEffect, useRef } from "react";
 import { useNavigate } from "react-router-dom";
-import api from "../api";
+import api, { fetchAllPages } from "../api";
 import type { LocationData } from "../components/AddressAutocomplete";
 import { Html5QrcodeScanner } from "html5-qrcode";
 
@@ -95,8 +95,7 @@ export function useEventEditor(id: string | undefined) {
     const fetchAttendees = async () => {
         if (!id) return;
         try {
-            const res = await api.get(`/api/tickets/event/${id}/`);
-            setAttendees(res.data);
+            setAttendees(await fetchAllPages(`/api/tickets/event/${id}/`));
         } catch (err) {
             console.error("Error fetching attendees", err);
         }
@@ -1,6 +1,6 @@
 import { useState, useEffect } from "react";
 import { useNavigate, useSearchParams } from "react-router-dom";
-import api from "../api";
+import api, { fetchAllPages } from "../api";
 import AppSidebar from "../components/Sidebar";
 import { AppUser, hasPermission as checkPermission } from "../utils/permissionUtils";
 import {
@@ -54,9 +54,7 @@ function Dashboard() {
     };
 
     const getEvents = () => {
-        api
-            .get("/api/event/")
-            .then((res) => res.data)
+        fetchAllPages("/api/event/")
             .then((data) => setEvents(data))
             .catch((error) => console.error(error));
     };
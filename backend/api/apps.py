@@ -1,4 +1,45 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+def serves_requests():
+    """
+    Whether this process is a web server rather than the test runner, a
+    management command or the watcher process of the runserver autoreloader.
+    """
+    program = os.path.basename(sys.argv[0]) if sys.argv else ''
+    if program not in ('manage.py', 'django-admin'):
+        return True
+    if sys.argv[1:2] != ['runserver']:
+        return False
+    return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv
+
+
+def web_workers():
+    """Worker processes of the server: gunicorn / uvicorn `-w`, else WEB_CONCURRENCY, else 1."""
+    args = sys.argv[1:]
+    for i, arg in enumerate(args):
+        if arg in ('-w', '--workers') and i + 1 < len(args):
+            return int(args[i + 1])
+        if arg.startswith('--workers='):
+            return int(arg.split('=', 1)[1])
+    return int(os.environ.get('WEB_CONCURRENCY') or 1)
+
+
+def check_shared_cache():
+    """
+    Refuse to serve from several processes over a process-local cache: the
+    admission queues, used admission tokens and catalogue versions would each
+    exist once per process.
+    """
+    if not settings.SHARED_CACHE and web_workers() > 1:
+        raise ImproperlyConfigured(
+            f'{web_workers()} web workers need a shared cache: set REDIS_URL, or run a single worker.'
+        )
 
 
 class ApiConfig(AppConfig):
@@ -6,5 +47,10 @@ class ApiConfig(AppConfig):
     name = 'api'
 
     def ready(self):
+        from api import signals  # noqa: F401
+        # Helper processes (e.g. the PDF export pool) set this to stay passive.
+        if os.environ.get('DISABLE_SCHEDULER') == '1' or not serves_requests():
+            return
+        check_shared_cache()
         from api import scheduler
         scheduler.start()
@@ -0,0 +1,147 @@
+"""
+Cache of the public event catalogue.
+
+`/api/event/public/` and the public event detail are anonymous and identical
+for every visitor, so their rendered JSON is cached under a single catalogue
+version.  The version is bumped whenever something the payload shows changes:
+`Event` / `TicketCategory` saves and deletes (see `signals`) and bulk status
+changes such as `conclude_past_events`.  Old entries are never deleted, they
+simply stop being looked up and expire.
+
+The stock and check-in counters change on every sale and gate scan, exactly
+when the catalogue is busiest, so they do not bump the version themselves:
+`bump_counters` only marks the catalogue stale, and the next read bumps it
+at most once per `COUNTER_LAG` seconds.  Counters shown by the catalogue may
+therefore lag by that much; the purchase path checks stock on its own.
+
+Entries are keyed by the path and the query parameters the view declares in
+`catalogue_params`, so junk parameters cannot mint new cache entries.
+
+The version doubles as the ETag, and the time of the last bump as
+Last-Modified, so a conditional request is answered with 304 from the cache
+alone, before any query runs.
+"""
+import time
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified, QueryDict
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.renderers import JSONRenderer
+
+ENTRY_TTL = 60 * 60
+
+# Longest delay before a counter change shows in the catalogue.
+COUNTER_LAG = 30
+
+_VERSION_KEY = 'catalogue:version'
+_MODIFIED_KEY = 'catalogue:modified'
+_COUNTERS_STALE_KEY = 'catalogue:counters:stale'
+_COUNTERS_THROTTLE_KEY = 'catalogue:counters:throttle'
+
+
+def _incr():
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        # Versions must never repeat after an eviction, so they start from the clock.
+        cache.set(_VERSION_KEY, time.time_ns(), None)
+    cache.set(_MODIFIED_KEY, int(time.time()), None)
+
+
+def bump():
+    """Invalidate every cached catalogue payload."""
+    # Writers bump inside their transaction: bump again after commit so a
+    # reader that rendered the pre-commit rows in between is invalidated too.
+    _incr()
+    transaction.on_commit(_incr)
+
+
+def _mark_counters_stale():
+    cache.set(_COUNTERS_STALE_KEY, True, None)
+
+
+def bump_counters():
+    """Stock or check-in counters changed: shown within COUNTER_LAG seconds."""
+    _mark_counters_stale()
+    transaction.on_commit(_mark_counters_stale)
+
+
+def current():
+    """Return `(version, last_modified)`, initialising them on first use."""
+    found = cache.get_many([_VERSION_KEY, _MODIFIED_KEY, _COUNTERS_STALE_KEY])
+    if found.get(_COUNTERS_STALE_KEY) and cache.add(_COUNTERS_THROTTLE_KEY, True, COUNTER_LAG):
+        cache.delete(_COUNTERS_STALE_KEY)
+        _incr()
+        found = cache.get_many([_VERSION_KEY, _MODIFIED_KEY])
+    if _VERSION_KEY not in found:
+        cache.add(_VERSION_KEY, time.time_ns(), None)
+        found[_VERSION_KEY] = cache.get(_VERSION_KEY)
+    if _MODIFIED_KEY not in found:
+        cache.add(_MODIFIED_KEY, int(time.time()), None)
+        found[_MODIFIED_KEY] = cache.get(_MODIFIED_KEY)
+    return found[_VERSION_KEY], found[_MODIFIED_KEY]
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag in (tag.strip() for tag in if_none_match.split(',')) or if_none_match.strip() == '*'
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return since is not None and last_modified <= since
+
+
+def _with_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Shared caches may store the payload but must revalidate on every use.
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def serve(request, render):
+    """
+    Answer `request` from the catalogue cache.  `render()` is called on a
+    miss and must return a DRF response; only 200s are cached.
+    """
+    version, last_modified = current()
+    etag = f'"{version}"'
+    if _not_modified(request, etag, last_modified):
+        return _with_validators(HttpResponseNotModified(), etag, last_modified)
+
+    key = f'catalogue:{version}:{request.build_absolute_uri()}'
+    content = cache.get(key)
+    if content is None:
+        response = render()
+        if response.status_code != 200:
+            return response
+        content = JSONRenderer().render(response.data)
+        cache.set(key, content, ENTRY_TTL)
+    return _with_validators(HttpResponse(content, content_type='application/json'), etag, last_modified)
+
+
+class CachedCatalogueMixin:
+    """
+    Generic-view mixin serving GET from the catalogue cache.  Authentication
+    is skipped: the payload is the same for everyone, and looking up a token's
+    user would cost a query on every 304.
+    """
+    authentication_classes = []
+    # Query parameters the payload depends on; the others are dropped.
+    catalogue_params = ()
+
+    def catalogue_query(self, params):
+        """Sorted `(name, value)` pairs of `catalogue_params`; override to canonicalise values."""
+        return sorted(
+            (name, value) for name in self.catalogue_params for value in params.getlist(name) if value != ''
+        )
+
+    def get(self, request, *args, **kwargs):
+        # The view renders from the normalised query too, so the cached
+        # payload (e.g. its `next` links) is the same for every requester.
+        query = urlencode(self.catalogue_query(request.query_params))
+        request._request.GET = QueryDict(query)
+        request._request.META['QUERY_STRING'] = query
+        return serve(request, lambda: super(CachedCatalogueMixin, self).get(request, *args, **kwargs))
@@ -1,8 +1,14 @@
 """
-Background scheduler job that auto-concludes events whose date has passed.
+Background scheduler jobs: auto-conclude past events, release expired holds,
+reconcile event availability, prune the ticket PDF cache, run and purge
+queue jobs, rebuild the feed matrix.
 """
+from datetime import timedelta
+
 from django.utils import timezone
+from api import catalogue
 from api.models import Event
+from api.services import event_facets, feed, job_queue, reservations, ticket_export, ticket_pdf, ticket_pdf_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,11 +19,84 @@ def conclude_past_events():
     Mark all PUBLISHED events whose date is in the past as CONCLUDED.
     """
     today = timezone.now().date()
-    updated = Event.objects.filter(
+    past = Event.objects.filter(
         status='PUBLISHED',
         date__isnull=False,
         date__lt=today
-    ).update(status='CONCLUDED')
+    )
+    concluded = list(past.values_list('pk', flat=True))
+    updated = past.update(status='CONCLUDED')
 
     if updated:
+        catalogue.bump()
+        event_facets.refresh_on_commit(event_ids=concluded)
         logger.info(f"Auto-concluded {updated} event(s) past their date.")
+
+
+def release_expired_reservations():
+    """
+    Give the stock of expired cart holds back to their categories.
+    """
+    released = reservations.release_expired()
+
+    if released:
+        logger.info(f"Released {released} expired ticket reservation(s).")
+
+
+def refresh_event_availability():
+    """
+    Bring the availability facet in line with the stock of every event, for
+    sell-outs and restocks that raced past the refresh of `services.inventory`.
+    """
+    changed = event_facets.refresh_availability()
+
+    if changed:
+        logger.info(f"Refreshed the availability of {changed} event(s).")
+
+
+def prune_ticket_pdf_cache():
+    """
+    Keep the on-disk ticket PDF cache under its size budget, drop the
+    pre-scaled ticket images nobody has rendered with lately and expired
+    bulk exports.
+    """
+    removed = ticket_pdf_cache.prune()
+    assets = ticket_pdf.prune_assets()
+    exports = ticket_export.prune()
+
+    if removed:
+        logger.info(f"Pruned {removed} cached ticket PDF(s).")
+    if assets:
+        logger.info(f"Pruned {assets} unused ticket render asset(s).")
+    if exports:
+        logger.info(f"Pruned {exports} expired ticket export(s).")
+
+
+def run_queued_jobs():
+    """
+    Drain the due background jobs, where no `run_jobs` worker is deployed.
+    """
+    ran = 0
+    while batch := job_queue.run_pending():
+        ran += batch
+
+    if ran:
+        logger.info(f"Ran {ran} queued background job(s).")
+
+
+def purge_finished_jobs():
+    """
+    Delete background queue jobs that finished more than a week ago.
+    """
+    purged = job_queue.purge_finished(timezone.now() - timedelta(days=7))
+
+    if purged:
+        logger.info(f"Purged {purged} finished background job(s).")
+
+
+def rebuild_feed_matrix():
+    """
+    Refresh the event-feature matrix of the personalised feed.
+    """
+    if feed.rebuild():
+        logger.info("Rebuilt the feed matrix.")
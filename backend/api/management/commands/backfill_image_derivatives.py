@@ -0,0 +1,39 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.services import image_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Queues responsive derivatives for every stored image that has none (or outdated ones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync', action='store_true', help='Render in this process instead of queueing jobs')
+
+    def handle(self, *args, **options):
+        if options['sync'] and not settings.SHARED_CACHE:
+            # The catalogue version bumped here would never reach the web processes.
+            raise CommandError('--sync needs the cache shared with the web processes (REDIS_URL).')
+        count = 0
+        for label, field in image_derivatives.IMAGE_FIELDS:
+            model = apps.get_model(label)
+            rows = (
+                model._default_manager.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                .only('pk', field, image_derivatives.variants_field(field))
+                .order_by('pk')
+            )
+            for instance in rows.iterator():
+                if image_derivatives.is_current(instance, field):
+                    continue
+                if options['sync']:
+                    image_derivatives.run_job({'model': label, 'pk': instance.pk, 'field': field})
+                else:
+                    image_derivatives.schedule(instance, [field])
+                count += 1
+
+        if options['sync']:
+            self.stdout.write(self.style.SUCCESS(f'Rendered the derivatives of {count} image(s).'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Queued the derivatives of {count} image(s); run_jobs will render them.'
+            ))
@@ -0,0 +1,65 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.models import Event, Ticket, TicketCategory, User
+from api.services import checkin
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures gate check-in throughput: several gates scan the same tickets at once. '
+        'Creates a throwaway event and deletes it afterwards; run it against a development database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gates', type=int, default=6, help='Concurrent scanners')
+        parser.add_argument('--tickets', type=int, default=500, help='Tickets every gate scans')
+
+    def handle(self, *args, **options):
+        gates, count = options['gates'], options['tickets']
+        tag = uuid.uuid4().hex[:8]
+        organizer = User.objects.create_user(username=f'benchmark-{tag}', email=f'benchmark-{tag}@example.com')
+        try:
+            event = Event.objects.create(title=f'Benchmark {tag}', organizer=organizer)
+            category = TicketCategory.objects.create(event=event, name='Benchmark', total_quantity=count)
+            Ticket.objects.bulk_create([Ticket(category=category, owner=organizer) for _ in range(count)])
+            codes = [str(code) for code in Ticket.objects.filter(category=category).values_list('ticket_code', flat=True)]
+            organizer.permission_snapshot
+
+            scans, queries, errors = [], [], []
+            start = threading.Barrier(gates)
+
+            def gate(offset):
+                try:
+                    start.wait()
+                    with CaptureQueriesContext(connection) as captured:
+                        for code in codes[offset:] + codes[:offset]:
+                            scans.append(checkin.check_in(organizer, ticket_code=code).outcome)
+                    queries.append(len(captured))
+                except Exception as exc:
+                    errors.append(exc)
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=gate, args=(i * count // gates,)) for i in range(gates)]
+            began = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - began
+        finally:
+            organizer.delete()
+
+        if errors:
+            self.stderr.write(self.style.ERROR(f'{len(errors)} gate(s) failed: {errors[0]!r}'))
+        admitted = scans.count(checkin.CHECKED_IN)
+        self.stdout.write(
+            f'{len(scans)} scans by {gates} gates in {elapsed:.2f} s: {len(scans) / elapsed * 60:,.0f} scans/min, '
+            f'{sum(queries) / max(len(scans), 1):.1f} queries/scan, {admitted}/{count} admitted'
+        )
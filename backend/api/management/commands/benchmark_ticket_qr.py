@@ -0,0 +1,64 @@
+import time
+import uuid
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+import qrcode
+
+from api.services import ticket_qr
+
+QR_SIZE = 4.5 * cm
+
+
+def draw_png(p, data):
+    """The former rendering: rasterise with PIL, embed the PNG."""
+    qr = qrcode.QRCode(version=1, box_size=10, border=4)
+    qr.add_data(data)
+    qr.make(fit=True)
+    stream = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(stream, format="PNG")
+    stream.seek(0)
+    p.drawImage(ImageReader(stream), 2 * cm, 2 * cm, width=QR_SIZE, height=QR_SIZE)
+
+
+def draw_vector(p, data):
+    ticket_qr.draw_qr(p, data, 2 * cm, 2 * cm, QR_SIZE)
+
+
+class Command(BaseCommand):
+    help = 'Compares the PNG and vector QR renderings of ticket codes: time per code and PDF bytes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=500, help='Ticket codes to render')
+
+    def run(self, draw, codes):
+        """One page per code, as in a bulk export; returns (ms per code, bytes per page)."""
+        buffer = BytesIO()
+        p = canvas.Canvas(buffer, pagesize=A4)
+        started = time.perf_counter()
+        for code in codes:
+            draw(p, code)
+            p.showPage()
+        p.save()
+        elapsed = time.perf_counter() - started
+        return elapsed * 1000 / len(codes), len(buffer.getvalue()) / len(codes)
+
+    def handle(self, *args, **options):
+        codes = [str(uuid.uuid4()) for _ in range(options['count'])]
+        ticket_qr.modules.cache_clear()
+
+        results = [
+            ('png', self.run(draw_png, codes)),
+            ('vector', self.run(draw_vector, codes)),
+            ('vector, cached', self.run(draw_vector, codes)),
+        ]
+        baseline_ms, baseline_bytes = results[0][1]
+        for name, (ms, size) in results:
+            self.stdout.write(
+                f'{name:<15} {ms:8.3f} ms/code  {size:9.0f} B/page  '
+                f'x{baseline_ms / ms:5.1f} faster  {size / baseline_bytes:6.1%} of the size'
+            )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.services import event_facets
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the catalogue facet rows and counts from the events'
+
+    def handle(self, *args, **options):
+        count = event_facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the facets of {count} published event(s).'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.services import event_search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the SQLite full-text event search table (PostgreSQL maintains its index by itself)'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = event_search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} event(s).'))
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from api import catalogue
+from api.models import Ticket, TicketCategory, TicketReservation
+from api.services import event_facets
+
+
+def _ticket_count(**filters):
+    return Coalesce(Subquery(
+        Ticket.objects.filter(category=OuterRef('pk'), **filters)
+        .order_by()
+        .values('category')
+        .annotate(n=Count('id'))
+        .values('n'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def _held_quantity():
+    return Coalesce(Subquery(
+        TicketReservation.objects.filter(category=OuterRef('pk'))
+        .order_by()
+        .values('category')
+        .annotate(n=Sum('quantity'))
+        .values('n'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Recomputes TicketCategory sold/checked-in/allocated counters from the actual Ticket and reservation rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted categories')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = (
+                TicketCategory.objects
+                .annotate(
+                    real_sold=_ticket_count(),
+                    real_checked_in=_ticket_count(is_checked_in=True),
+                    real_held=_held_quantity(),
+                )
+                .exclude(
+                    sold_count=F('real_sold'),
+                    checked_in_count=F('real_checked_in'),
+                    allocated_quantity=F('real_sold') + F('real_held'),
+                )
+            )
+            drifted_ids = list(drifted.values_list('pk', flat=True))
+
+            if drifted_ids and not options['dry_run']:
+                TicketCategory.objects.filter(pk__in=drifted_ids).update(
+                    sold_count=_ticket_count(),
+                    checked_in_count=_ticket_count(is_checked_in=True),
+                    allocated_quantity=_ticket_count() + _held_quantity(),
+                )
+                catalogue.bump_counters()
+                event_facets.refresh_on_commit(category_ids=drifted_ids)
+
+        if not drifted_ids:
+            self.stdout.write(self.style.SUCCESS('All ticket counters are consistent.'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f'{len(drifted_ids)} categor(y/ies) drifted: {drifted_ids}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Reconciled counters of {len(drifted_ids)} categor(y/ies).'
+            ))
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.services import job_queue
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (ticket PDFs, wallet links, image derivatives); start as many as needed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the due jobs, then exit')
+        parser.add_argument('--batch', type=int, default=10, help='Jobs claimed per round')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+
+    def handle(self, *args, **options):
+        # Finished jobs bump the catalogue and feed versions in the cache; a
+        # process-local one would hide their results from the web processes.
+        if not settings.SHARED_CACHE:
+            raise CommandError(
+                'run_jobs needs the cache shared with the web processes: set REDIS_URL, '
+                'or leave JOB_QUEUE_WORKER unset to run the jobs in the web process.'
+            )
+        self.stdout.write(self.style.SUCCESS('Job worker started.'))
+        try:
+            while True:
+                ran = job_queue.run_pending(options['batch'])
+                if not ran:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write('Job worker stopped.')
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_allocated_quantity(apps, schema_editor):
+    TicketCategory = apps.get_model('api', 'TicketCategory')
+    Ticket = apps.get_model('api', 'Ticket')
+
+    sold = (
+        Ticket.objects.filter(category=OuterRef('pk'))
+        .order_by()
+        .values('category')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    TicketCategory.objects.update(allocated_quantity=Coalesce(Subquery(sold), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_ticketcategory_card_bg_color_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketcategory',
+            name='allocated_quantity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_allocated_quantity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_ticket_counters(apps, schema_editor):
+    TicketCategory = apps.get_model('api', 'TicketCategory')
+    Ticket = apps.get_model('api', 'Ticket')
+
+    def count(**filters):
+        return Coalesce(Subquery(
+            Ticket.objects.filter(category=OuterRef('pk'), **filters)
+            .order_by()
+            .values('category')
+            .annotate(n=Count('id'))
+            .values('n')
+        ), 0)
+
+    TicketCategory.objects.update(sold_count=count(), checked_in_count=count(is_checked_in=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_ticketcategory_admission_rate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketcategory',
+            name='checked_in_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ticketcategory',
+            name='sold_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ticket_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:01
+
+from collections import Counter
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Exists, F, Min, OuterRef
+
+
+def _price_band(price):
+    if price is None:
+        return ''
+    if price <= 0:
+        return 'free'
+    if price <= Decimal('20'):
+        return 'under_20'
+    if price <= Decimal('50'):
+        return '20_50'
+    return 'over_50'
+
+
+def backfill_event_facets(apps, schema_editor):
+    Event = apps.get_model('api', 'Event')
+    EventFacets = apps.get_model('api', 'EventFacets')
+    FacetCount = apps.get_model('api', 'FacetCount')
+    TicketCategory = apps.get_model('api', 'TicketCategory')
+
+    in_stock = TicketCategory.objects.filter(event=OuterRef('pk'), total_quantity__gt=F('allocated_quantity'))
+    rows = (
+        Event.objects.filter(status='PUBLISHED')
+        .annotate(min_price=Min('ticket_categories__price'), available=Exists(in_stock))
+        .values('id', 'date', 'country_code', 'min_price', 'available')
+    )
+    facets, counts = [], Counter()
+    for row in rows:
+        band = _price_band(row['min_price'])
+        facets.append(EventFacets(
+            event_id=row['id'], date=row['date'], country_code=row['country_code'],
+            min_price=row['min_price'], price_band=band, available=row['available'],
+        ))
+        counts['availability', 'available' if row['available'] else 'sold_out'] += 1
+        if row['date']:
+            counts['month', row['date'].strftime('%Y-%m')] += 1
+        if row['country_code']:
+            counts['country', row['country_code']] += 1
+        if band:
+            counts['price', band] += 1
+
+    EventFacets.objects.bulk_create(facets)
+    FacetCount.objects.bulk_create(
+        [FacetCount(facet=facet, value=value, count=count) for (facet, value), count in counts.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_event_status_lat_lng_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventFacets',
+            fields=[
+                ('event', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='facets', serialize=False, to='api.event')),
+                ('date', models.DateField(blank=True, null=True)),
+                ('country_code', models.CharField(blank=True, default='', max_length=2)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('price_band', models.CharField(blank=True, choices=[('free', 'Gratuito'), ('under_20', 'Fino a 20 €'), ('20_50', 'Da 20 a 50 €'), ('over_50', 'Oltre 50 €')], default='', max_length=10)),
+                ('available', models.BooleanField(default=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['country_code', 'date'], name='facets_country_date_idx'), models.Index(fields=['price_band', 'date'], name='facets_price_date_idx'), models.Index(fields=['available', 'date'], name='facets_available_date_idx'), models.Index(fields=['date'], name='facets_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('facet', 'value'), name='facet_count_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_event_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_ticket_event(apps, schema_editor):
+    Ticket = apps.get_model('api', 'Ticket')
+    TicketCategory = apps.get_model('api', 'TicketCategory')
+    Ticket.objects.update(
+        event=Subquery(TicketCategory.objects.filter(pk=OuterRef('category_id')).values('event_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='event',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='api.event'),
+        ),
+        migrations.RunPython(backfill_ticket_event, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='ticket',
+            name='event',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='api.event'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['event', '-purchase_date', '-id'], name='ticket_event_purchase_idx'),
+        ),
+    ]
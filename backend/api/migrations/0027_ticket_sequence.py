@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_ticket_sequence(apps, schema_editor):
+    Ticket = apps.get_model('api', 'Ticket')
+    TicketSequence = apps.get_model('api', 'TicketSequence')
+    last, batch = {}, []
+    for ticket in Ticket.objects.order_by('id').only('id', 'event_id').iterator(chunk_size=2000):
+        last[ticket.event_id] = ticket.sequence = last.get(ticket.event_id, 0) + 1
+        batch.append(ticket)
+        if len(batch) == 2000:
+            Ticket.objects.bulk_update(batch, ['sequence'])
+            batch = []
+    Ticket.objects.bulk_update(batch, ['sequence'])
+    TicketSequence.objects.bulk_create(
+        [TicketSequence(event_id=event_id, last=value) for event_id, value in last.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_ticket_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketSequence',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ticket_sequence', serialize=False, to='api.event')),
+                ('last', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='sequence',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['event', 'sequence'], name='ticket_event_sequence_idx'),
+        ),
+        migrations.RunPython(backfill_ticket_sequence, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from . import permission_cache
+from .permission_snapshot import PermissionSnapshot
 import string
 import secrets
 import uuid
@@ -50,6 +53,8 @@ class User(AbstractUser):
     onboarding_completed = models.BooleanField(default=False)
     location = models.CharField(max_length=500, blank=True, null=True)
     music_preferences = models.JSONField(default=list, blank=True)
+    # Resized copies of the avatar (api.services.image_derivatives)
+    avatar_variants = models.JSONField(default=dict, blank=True)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -70,20 +75,32 @@ class User(AbstractUser):
             self.email = self.email.lower()
         super().save(*args, **kwargs)
 
+    @property
+    def permission_snapshot(self):
+        """Roles and codenames loaded once per instance (i.e. once per request)."""
+        snapshot = self.__dict__.get('_permission_snapshot')
+        if snapshot is None:
+            snapshot = PermissionSnapshot.load(self)
+            self.__dict__['_permission_snapshot'] = snapshot
+        return snapshot
+
+    def refresh_permission_snapshot(self):
+        self.__dict__.pop('_permission_snapshot', None)
+
     @property
     def is_super_admin(self):
-        return self.is_superuser or self.roles.filter(name='Super Admin').exists()
+        return self.is_superuser or self.permission_snapshot.is_super_admin
 
     def get_all_permissions(self):
         if self.is_super_admin:
-            return list(AppPermission.objects.values_list('codename', flat=True))
+            return permission_cache.get_all_codenames(
+                lambda: AppPermission.objects.values_list('codename', flat=True)
+            )
 
-        return list(AppPermission.objects.filter(roles__users=self).values_list('codename', flat=True).distinct())
+        return sorted(self.permission_snapshot.codenames)
 
     def has_app_permission(self, codename):
-        if self.is_super_admin:
-            return True
-        return self.roles.filter(permissions__codename=codename).exists()
+        return self.is_superuser or self.permission_snapshot.has_permission(codename)
 
 @receiver(post_save, sender=User)
 def assign_base_role(sender, instance, created, **kwargs):
@@ -160,6 +177,10 @@ class Event(models.Model):
     poster_image = models.ImageField(upload_to='events/posters/', null=True, blank=True)
     hero_image = models.ImageField(upload_to='events/heroes/', null=True, blank=True)
     organizer_logo = models.ImageField(upload_to='events/logos/', null=True, blank=True)
+    # Resized copies of the images above (api.services.image_derivatives)
+    poster_image_variants = models.JSONField(default=dict, blank=True)
+    hero_image_variants = models.JSONField(default=dict, blank=True)
+    organizer_logo_variants = models.JSONField(default=dict, blank=True)
 
     # Styling
     background_color = models.CharField(max_length=7, default='#FFFFFF')
@@ -174,6 +195,16 @@ class Event(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     organizer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='organized_events')
 
+    class Meta:
+        # Composite keys backing the keyset pagination orderings (api.pagination)
+        indexes = [
+            models.Index(fields=['status', 'date', 'id'], name='event_status_date_id_idx'),
+            models.Index(fields=['-created_at', '-id'], name='event_created_id_idx'),
+            models.Index(fields=['organizer', '-created_at', '-id'], name='event_org_created_id_idx'),
+            # Bounding-box prefilter of services.nearby
+            models.Index(fields=['status', 'latitude', 'longitude'], name='event_status_lat_lng_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -191,6 +222,12 @@ class TicketCategory(models.Model):
     description = models.TextField(blank=True, default='')
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     total_quantity = models.PositiveIntegerField(default=0)
+    # Stock counters, maintained by api.services.inventory; never derived from COUNT(*)
+    allocated_quantity = models.PositiveIntegerField(default=0)
+    sold_count = models.PositiveIntegerField(default=0)
+    checked_in_count = models.PositiveIntegerField(default=0)
+    # Buyers admitted per second through the waiting room; empty = no queue
+    admission_rate = models.PositiveIntegerField(null=True, blank=True)
 
     # Sale dates
     sale_start_date = models.DateField(null=True, blank=True)
@@ -200,6 +237,7 @@ class TicketCategory(models.Model):
 
     # Aesthetics
     logo = models.ImageField(upload_to='tickets/logos/', null=True, blank=True)
+    logo_variants = models.JSONField(default=dict, blank=True)
     card_bg_type = models.CharField(max_length=20, choices=[('solid', 'Fisso'), ('gradient', 'Gradiente')], default='solid')
     card_bg_color = models.CharField(max_length=7, default='#FFFFFF')
     card_bg_color2 = models.CharField(max_length=7, default='#FFFFFF')
@@ -207,21 +245,174 @@ class TicketCategory(models.Model):
     def __str__(self):
         return f"{self.name} - {self.event.title}"
 
-    @property
-    def sold_count(self):
-        return self.tickets.count()
-
     @property
     def remaining_quantity(self):
-        return max(0, self.total_quantity - self.sold_count)
+        return max(0, self.total_quantity - self.allocated_quantity)
+
+class TicketSequence(models.Model):
+    """
+    Per-event counter numbering the event's tickets (`Ticket.sequence`).  It
+    is incremented by the transaction creating the tickets, and the row lock
+    it takes until commit makes the numbers follow the commit order, which
+    ids do not (see api.services.manifest).
+    """
+    event = models.OneToOneField(Event, on_delete=models.CASCADE, primary_key=True, related_name='ticket_sequence')
+    last = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def take(cls, event_id, count):
+        """Reserve `count` numbers of the event and return the first; call inside the creating transaction."""
+        rows = cls.objects.filter(pk=event_id)
+        if not rows.update(last=models.F('last') + count):
+            cls.objects.bulk_create([cls(event_id=event_id)], ignore_conflicts=True)
+            rows.update(last=models.F('last') + count)
+        return rows.values_list('last', flat=True).get() - count + 1
+
+
+class TicketQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        by_event = {}
+        for ticket in objs:
+            ticket.fill_event()
+            if not ticket.sequence:
+                by_event.setdefault(ticket.event_id, []).append(ticket)
+        with transaction.atomic(savepoint=False):
+            for event_id in sorted(by_event):
+                first = TicketSequence.take(event_id, len(by_event[event_id]))
+                for offset, ticket in enumerate(by_event[event_id]):
+                    ticket.sequence = first + offset
+            return super().bulk_create(objs, *args, **kwargs)
+
 
 class Ticket(models.Model):
     category = models.ForeignKey(TicketCategory, on_delete=models.CASCADE, related_name='tickets')
+    # Copy of category.event, so an event's tickets are a single index range
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='tickets', editable=False)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tickets')
     ticket_code = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     is_checked_in = models.BooleanField(default=False)
     checked_in_at = models.DateTimeField(null=True, blank=True)
     purchase_date = models.DateTimeField(auto_now_add=True)
+    # Number within the event in commit order, from TicketSequence
+    sequence = models.PositiveBigIntegerField(default=0, editable=False)
+
+    class Meta:
+        # Composite keys backing the keyset pagination orderings (api.pagination)
+        indexes = [
+            models.Index(fields=['owner', '-purchase_date', '-id'], name='ticket_owner_purchase_idx'),
+            models.Index(fields=['category', '-purchase_date', '-id'], name='ticket_cat_purchase_idx'),
+            models.Index(fields=['event', '-purchase_date', '-id'], name='ticket_event_purchase_idx'),
+            # Manifest deltas (api.services.manifest)
+            models.Index(fields=['event', 'sequence'], name='ticket_event_sequence_idx'),
+        ]
+
+    objects = TicketQuerySet.as_manager()
 
     def __str__(self):
         return f"Ticket {self.ticket_code} - {self.owner.email}"
+
+    def fill_event(self):
+        if self.event_id is None:
+            self.event_id = self.category.event_id
+
+    def save(self, *args, **kwargs):
+        self.fill_event()
+        if self._state.adding and not self.sequence:
+            with transaction.atomic(savepoint=False):
+                self.sequence = TicketSequence.take(self.event_id, 1)
+                super().save(*args, **kwargs)
+            return
+        super().save(*args, **kwargs)
+
+
+class TicketReservation(models.Model):
+    """A time-boxed hold on category stock, turned into tickets on confirm."""
+    category = models.ForeignKey(TicketCategory, on_delete=models.CASCADE, related_name='reservations')
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ticket_reservations')
+    quantity = models.PositiveIntegerField(default=1)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Reservation {self.quantity}x {self.category_id} - {self.owner_id}"
+
+
+class BackgroundJob(models.Model):
+    """A unit of work for the `run_jobs` worker (see api.services.job_queue)."""
+    STATUS_CHOICES = [
+        ('PENDING', 'In attesa'),
+        ('RUNNING', 'In esecuzione'),
+        ('DONE', 'Completato'),
+        ('FAILED', 'Fallito'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    # Deduplication key: enqueueing the same work twice returns the existing job
+    key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    result = models.JSONField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after', 'id'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class EventFacets(models.Model):
+    """
+    Facet values of a PUBLISHED event, kept by api.services.event_facets.
+    Not a real foreign key: the row outlives its event until the refresh that
+    removes it from the counts.
+    """
+    PRICE_BAND_CHOICES = [
+        ('free', 'Gratuito'),
+        ('under_20', 'Fino a 20 €'),
+        ('20_50', 'Da 20 a 50 €'),
+        ('over_50', 'Oltre 50 €'),
+    ]
+
+    event = models.OneToOneField(
+        Event, on_delete=models.DO_NOTHING, db_constraint=False, primary_key=True, related_name='facets',
+    )
+    date = models.DateField(null=True, blank=True)
+    country_code = models.CharField(max_length=2, blank=True, default='')
+    # Cheapest ticket; empty for events without categories
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    price_band = models.CharField(max_length=10, choices=PRICE_BAND_CHOICES, blank=True, default='')
+    # Some category still has stock
+    available = models.BooleanField(default=False)
+
+    class Meta:
+        # Each facet filter narrows by its value, then ranges over the date.
+        indexes = [
+            models.Index(fields=['country_code', 'date'], name='facets_country_date_idx'),
+            models.Index(fields=['price_band', 'date'], name='facets_price_date_idx'),
+            models.Index(fields=['available', 'date'], name='facets_available_date_idx'),
+            models.Index(fields=['date'], name='facets_date_idx'),
+        ]
+
+
+class FacetCount(models.Model):
+    """Number of PUBLISHED events per facet value, updated incrementally with EventFacets."""
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='facet_count_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.facet}={self.value}: {self.count}"
@@ -0,0 +1,152 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are addressed by the sort key of the last row served, e.g.
+`(purchase_date, id)`, so fetching page 1000 is the same index range scan as
+fetching page 1:
+
+    WHERE purchase_date <= :last_date
+      AND (purchase_date < :last_date OR (purchase_date = :last_date AND id < :last_id))
+    ORDER BY purchase_date DESC, id DESC LIMIT n
+
+The first conjunct is implied by the second; it is there as the bound the
+planner can start the range scan from.  No OFFSET, no COUNT.  Each ordering
+is backed by a composite index declared on the model, and the ORDER BY
+matches it: NULLS LAST is only requested for nullable fields, since a plain
+DESC index sorts NULLs first.
+
+Every list response is a page, `{"next": ..., "results": [...]}`: `page_size`
+rows (at most `max_page_size`, default `page_size`) and the URL of the next
+page, or null after the last one.  Clients wanting the whole list follow
+`next`.
+"""
+import base64
+import json
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    # Sort key, most significant first; must end with a unique field.
+    ordering = ('-id',)
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    invalid_cursor_message = 'Cursor non valido.'
+
+    def _fields(self, model):
+        return [(name.lstrip('-'), name.startswith('-'), model._meta.get_field(name.lstrip('-')))
+                for name in self.ordering]
+
+    def _order_by(self, fields):
+        order = []
+        for name, descending, field in fields:
+            nulls_last = True if field.null else None
+            order.append(F(name).desc(nulls_last=nulls_last) if descending else F(name).asc(nulls_last=nulls_last))
+        return order
+
+    def _encode(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def _decode(self, cursor, fields):
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(raw) != len(fields):
+                raise ValueError
+            return [None if value is None else field.to_python(value)
+                    for value, (_, _, field) in zip(raw, fields)]
+        except (ValueError, TypeError, json.JSONDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _after(self, fields, values):
+        """Rows strictly after `values` in the (nulls last) sort order."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending, field), value in zip(fields, values):
+            if value is None:
+                beyond = Q(pk__in=[])            # nothing sorts after NULL
+                same = Q(**{f'{name}__isnull': True})
+            else:
+                beyond = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+                if field.null:
+                    beyond |= Q(**{f'{name}__isnull': True})
+                same = Q(**{name: value})
+            condition |= equal & beyond
+            equal &= same
+
+        # Redundant leading bound (`a <= x`), the seek start of the index range scan.
+        (name, descending, field), value = fields[0], values[0]
+        if value is not None:
+            bound = Q(**{f"{name}__{'lte' if descending else 'gte'}": value})
+            if field.null:
+                bound |= Q(**{f'{name}__isnull': True})
+            condition &= bound
+        return condition
+
+    def _cursor_values(self, obj, fields):
+        return [
+            None if field.value_from_object(obj) is None else field.value_to_string(obj)
+            for _, _, field in fields
+        ]
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        fields = self._fields(queryset.model)
+        queryset = queryset.order_by(*self._order_by(fields))
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self._after(fields, self._decode(cursor, fields)))
+
+        page_size = self.get_page_size(request)
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        page = rows[:page_size]
+        self.next_cursor = self._encode(self._cursor_values(page[-1], fields)) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class EventDatePagination(KeysetPagination):
+    ordering = ('date', 'id')
+
+
+class EventCreatedPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class TicketPurchasePagination(KeysetPagination):
+    ordering = ('-purchase_date', '-id')
+
+
+class UserPagination(KeysetPagination):
+    ordering = ('id',)
@@ -0,0 +1,139 @@
+"""
+Cross-request cache of users' RBAC state.
+
+Entries live in the default Django cache (local memory, or Redis when
+REDIS_URL is configured) and are stamped with version counters:
+
+* one counter per user, bumped when `User.roles` changes on the user side;
+* one counter per role, bumped when the role is renamed/deleted, its
+  permissions change, or users are removed from it on the role side;
+* one global counter, bumped when the `AppPermission` table changes.
+
+An entry is valid only while every stamp it was built with is still current,
+so a role change invalidates exactly the users holding that role.
+
+Loading is guarded the other way round too: `load_stamps` is read before the
+roles are queried and `set_user_permissions` drops the entry if any of them
+moved meanwhile.  Role-side changes also bump an "any role" counter for this,
+since the user's role ids are only known once the query ran.
+
+Bumps only reach the processes sharing the cache.  With a process-local
+cache (no REDIS_URL) another worker would keep honouring a revoked role
+until its entry expires, so entries then live LOCAL_ENTRY_TTL seconds only.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+SHARED_ENTRY_TTL = 10 * 60
+LOCAL_ENTRY_TTL = 5
+ENTRY_TTL = SHARED_ENTRY_TTL if settings.SHARED_CACHE else LOCAL_ENTRY_TTL
+
+_GLOBAL_VERSION_KEY = 'rbac:v:global'
+_ROLES_VERSION_KEY = 'rbac:v:roles'
+
+
+def _user_version_key(user_id):
+    return f'rbac:v:user:{user_id}'
+
+
+def _role_version_key(role_id):
+    return f'rbac:v:role:{role_id}'
+
+
+def _entry_key(user_id):
+    return f'rbac:perms:{user_id}'
+
+
+def _new_stamp():
+    # Stamps must never repeat after an eviction, so they start from the clock.
+    return time.time_ns()
+
+
+def _current_stamps(keys):
+    """Return the current stamp of each key, initialising missing ones."""
+    stamps = cache.get_many(keys)
+    for key in keys:
+        if key not in stamps:
+            cache.add(key, _new_stamp(), None)
+            stamps[key] = cache.get(key)
+    return stamps
+
+
+def _incr(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_stamp(), None)
+
+
+def _bump(keys):
+    # Signals fire inside the writing transaction: bump again after commit so
+    # a reader that cached the pre-commit rows in between is invalidated too.
+    _incr(keys)
+    transaction.on_commit(lambda: _incr(keys))
+
+
+def bump_users(user_ids):
+    _bump([_user_version_key(user_id) for user_id in user_ids])
+
+
+def bump_roles(role_ids):
+    # "Any role" first: a loader that sees a new role stamp must see it moved.
+    _bump([_ROLES_VERSION_KEY, *(_role_version_key(role_id) for role_id in role_ids)])
+
+
+def bump_global():
+    _bump([_GLOBAL_VERSION_KEY])
+
+
+def get_user_permissions(user_id):
+    """Return cached `(role_names, codenames)` for the user, or None."""
+    user_key, entry_key = _user_version_key(user_id), _entry_key(user_id)
+    found = cache.get_many([entry_key, user_key])
+    entry = found.get(entry_key)
+    if entry is None or entry['user_stamp'] != found.get(user_key):
+        return None
+
+    if entry['role_stamps']:
+        current = cache.get_many(list(entry['role_stamps']))
+        if current != entry['role_stamps']:
+            return None
+    return entry['role_names'], entry['codenames']
+
+
+def load_stamps(user_id):
+    """Stamps to read before querying the user's roles, for `set_user_permissions`."""
+    return _current_stamps([_user_version_key(user_id), _ROLES_VERSION_KEY, _GLOBAL_VERSION_KEY])
+
+
+def set_user_permissions(user_id, role_ids, role_names, codenames, stamps):
+    """
+    Cache what was loaded after `stamps = load_stamps(user_id)`.  Returns
+    False, storing nothing, when a change was recorded while loading.
+    """
+    role_keys = [_role_version_key(role_id) for role_id in role_ids]
+    role_stamps = _current_stamps(role_keys)
+    if cache.get_many(list(stamps)) != stamps:
+        return False
+    cache.set(_entry_key(user_id), {
+        'user_stamp': stamps[_user_version_key(user_id)],
+        'role_stamps': role_stamps,
+        'role_names': list(role_names),
+        'codenames': list(codenames),
+    }, ENTRY_TTL)
+    return True
+
+
+def get_all_codenames(loader):
+    """Full codename list (what super admins receive), cached per global stamp."""
+    stamp = _current_stamps([_GLOBAL_VERSION_KEY])[_GLOBAL_VERSION_KEY]
+    key = f'rbac:all:{stamp}'
+    codenames = cache.get(key)
+    if codenames is None:
+        codenames = list(loader())
+        cache.set(key, codenames, ENTRY_TTL)
+    return codenames
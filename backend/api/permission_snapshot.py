@@ -0,0 +1,110 @@
+"""
+Per-request snapshot of a user's RBAC state.
+
+`User.is_super_admin` and `User.has_app_permission` are evaluated many times
+while a single request goes through permission classes and `get_queryset`.
+The snapshot loads the user's role names and permission codenames with one
+query and answers every later check from memory.  Since DRF authenticates a
+fresh `User` instance per request, caching the snapshot on the instance
+scopes it to the request.  Snapshots are also shared across requests through
+`permission_cache`, so a warm cache answers without any query at all.
+"""
+import threading
+
+from . import permission_cache
+
+SUPER_ADMIN_ROLE = 'Super Admin'
+
+_stats_lock = threading.Lock()
+_stats = {'loads': 0, 'cache_hits': 0, 'prefetched': 0, 'lookups': 0}
+
+
+def snapshot_stats():
+    """Process-wide counters: snapshots loaded, lookups served, queries saved."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['queries_saved'] = max(0, stats['lookups'] - stats['loads'])
+    return stats
+
+
+def reset_snapshot_stats():
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+def _record(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+class PermissionSnapshot:
+    """Immutable view of a user's roles and codenames, with usage counters."""
+
+    __slots__ = ('role_names', 'codenames', 'lookups', 'from_cache')
+
+    def __init__(self, role_names, codenames, from_cache=False):
+        self.role_names = frozenset(role_names)
+        self.codenames = frozenset(codenames)
+        self.lookups = 0
+        self.from_cache = from_cache
+
+    @classmethod
+    def load(cls, user):
+        """
+        Build from prefetched `roles__permissions` when the queryset loaded
+        them, else read the shared cache, else run a single roles LEFT JOIN
+        permissions query.
+        """
+        prefetched = cls._from_prefetched(user)
+        if prefetched is not None:
+            _record('prefetched')
+            return prefetched
+
+        cached = permission_cache.get_user_permissions(user.pk)
+        if cached is not None:
+            _record('cache_hits')
+            return cls(*cached, from_cache=True)
+
+        stamps = permission_cache.load_stamps(user.pk)
+        role_ids, role_names, codenames = set(), set(), set()
+        for role_id, role_name, codename in user.roles.values_list('id', 'name', 'permissions__codename'):
+            role_ids.add(role_id)
+            role_names.add(role_name)
+            if codename:
+                codenames.add(codename)
+        permission_cache.set_user_permissions(user.pk, role_ids, role_names, codenames, stamps)
+        _record('loads')
+        return cls(role_names, codenames)
+
+    @classmethod
+    def _from_prefetched(cls, user):
+        roles = getattr(user, '_prefetched_objects_cache', {}).get('roles')
+        if roles is None:
+            return None
+        role_names, codenames = set(), set()
+        for role in roles:
+            permissions = getattr(role, '_prefetched_objects_cache', {}).get('permissions')
+            if permissions is None:
+                return None
+            role_names.add(role.name)
+            codenames.update(permission.codename for permission in permissions)
+        return cls(role_names, codenames, from_cache=True)
+
+    @property
+    def queries_saved(self):
+        """Every lookup not paid for by this snapshot's own load saved one query."""
+        return self.lookups if self.from_cache else max(0, self.lookups - 1)
+
+    def _count(self):
+        self.lookups += 1
+        _record('lookups')
+
+    @property
+    def is_super_admin(self):
+        self._count()
+        return SUPER_ADMIN_ROLE in self.role_names
+
+    def has_permission(self, codename):
+        self._count()
+        return SUPER_ADMIN_ROLE in self.role_names or codename in self.codenames
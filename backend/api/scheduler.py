@@ -13,7 +13,15 @@ scheduler = BackgroundScheduler(timezone=settings.TIME_ZONE)
 
 
 def start():
-    from api.jobs import conclude_past_events
+    from api.jobs import (
+        conclude_past_events,
+        prune_ticket_pdf_cache,
+        purge_finished_jobs,
+        rebuild_feed_matrix,
+        refresh_event_availability,
+        release_expired_reservations,
+        run_queued_jobs,
+    )
 
     scheduler.add_job(
         conclude_past_events,
@@ -22,5 +30,54 @@ def start():
         max_instances=1,
         replace_existing=True,
     )
+    scheduler.add_job(
+        release_expired_reservations,
+        trigger=IntervalTrigger(minutes=1),
+        id="release_expired_reservations",
+        max_instances=1,
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        refresh_event_availability,
+        trigger=IntervalTrigger(minutes=5),
+        id="refresh_event_availability",
+        max_instances=1,
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        prune_ticket_pdf_cache,
+        trigger=IntervalTrigger(minutes=15),
+        id="prune_ticket_pdf_cache",
+        max_instances=1,
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        purge_finished_jobs,
+        trigger=IntervalTrigger(hours=6),
+        id="purge_finished_jobs",
+        max_instances=1,
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        rebuild_feed_matrix,
+        trigger=IntervalTrigger(minutes=5),
+        id="rebuild_feed_matrix",
+        max_instances=1,
+        replace_existing=True,
+    )
+    if settings.JOB_QUEUE_IN_PROCESS:
+        scheduler.add_job(
+            run_queued_jobs,
+            trigger=IntervalTrigger(seconds=2),
+            id="run_queued_jobs",
+            max_instances=1,
+            replace_existing=True,
+        )
     scheduler.start()
-    logger.info("APScheduler started – conclude_past_events runs every 30 min.")
+    logger.info(
+        "APScheduler started – conclude_past_events runs every 30 min, "
+        "release_expired_reservations every minute, refresh_event_availability every 5 min, "
+        "prune_ticket_pdf_cache every 15 min, "
+        "purge_finished_jobs every 6 h, rebuild_feed_matrix every 5 min"
+        + (", run_queued_jobs every 2 s." if settings.JOB_QUEUE_IN_PROCESS else ".")
+    )
@@ -14,8 +14,13 @@ from .user_serializers import (
 from .ticket_serializers import (
     TicketCategorySerializer,
     TicketSerializer,
+    TicketPurchaseLineSerializer,
+    TicketBulkPurchaseSerializer,
+    TicketReservationSerializer,
+    TicketScanSerializer,
+    TicketScanBatchSerializer,
 )
-from .event_serializers import EventSerializer
+from .event_serializers import EventSerializer, NearbyEventSerializer
 
 __all__ = [
     'AppPermissionSerializer',
@@ -29,5 +34,11 @@ __all__ = [
     'AffiliateSerializer',
     'TicketCategorySerializer',
     'TicketSerializer',
+    'TicketPurchaseLineSerializer',
+    'TicketBulkPurchaseSerializer',
+    'TicketReservationSerializer',
+    'TicketScanSerializer',
+    'TicketScanBatchSerializer',
     'EventSerializer',
+    'NearbyEventSerializer',
 ]
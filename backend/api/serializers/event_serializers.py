@@ -1,11 +1,15 @@
 from rest_framework import serializers
 from ..models import Event
+from .image_fields import SrcsetField
 from .ticket_serializers import TicketCategorySerializer
 
 
 class EventSerializer(serializers.ModelSerializer):
     organizer_name = serializers.SerializerMethodField()
     ticket_categories = TicketCategorySerializer(many=True, read_only=True)
+    poster_image_srcset = SrcsetField('poster_image')
+    hero_image_srcset = SrcsetField('hero_image')
+    organizer_logo_srcset = SrcsetField('organizer_logo')
 
     class Meta:
         model = Event
@@ -14,10 +18,13 @@ class EventSerializer(serializers.ModelSerializer):
             'latitude', 'longitude', 'country_code',
             'date', 'start_time', 'end_time',
             'poster_image', 'hero_image', 'organizer_logo',
+            'poster_image_srcset', 'hero_image_srcset', 'organizer_logo_srcset',
             'background_color', 'google_wallet_class_id', 'ticket_clauses',
             'status', 'organizer', 'organizer_name', 'created_at', 'ticket_categories',
         ]
         read_only_fields = ['organizer', 'created_at', 'google_wallet_class_id']
+        # Relations read by SerializerMethodFields (see query_plan)
+        select_related = ['organizer']
 
     def get_organizer_name(self, obj):
         return f"{obj.organizer.first_name} {obj.organizer.last_name}".strip() or obj.organizer.username
@@ -58,3 +65,14 @@ class EventSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         return Event.objects.create(**validated_data)
+
+
+class NearbyEventSerializer(EventSerializer):
+    """EventSerializer plus the distance annotated by `services.nearby`."""
+    distance_km = serializers.SerializerMethodField()
+
+    class Meta(EventSerializer.Meta):
+        fields = EventSerializer.Meta.fields + ['distance_km']
+
+    def get_distance_km(self, obj):
+        return round(obj.distance_km, 2)
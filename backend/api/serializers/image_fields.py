@@ -0,0 +1,18 @@
+from rest_framework import serializers
+from ..services import image_derivatives
+
+
+class SrcsetField(serializers.Field):
+    """
+    Read-only `srcset` strings of the derivatives of `image_field`
+    (see services.image_derivatives), or null until they are generated.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return image_derivatives.srcset(instance, self.image_field, self.context.get('request'))
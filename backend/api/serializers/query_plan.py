@@ -0,0 +1,114 @@
+"""
+Derive `select_related` / `prefetch_related` plans from serializer fields.
+
+Walking the declared fields of a serializer tells us exactly which relations
+serialization will touch:
+
+* dotted sources (`source='category.event.title'`) and nested single
+  serializers follow forward/one-to-one relations -> `select_related`;
+* nested `many=True` serializers and readable many-related fields follow
+  to-many relations -> `Prefetch`, whose queryset gets its own derived plan;
+* `SerializerMethodField`s are opaque, so a serializer may list the
+  relations they read in `Meta.select_related` / `Meta.prefetch_related`.
+
+With the plan applied, a list endpoint runs a fixed number of queries no
+matter how many rows the page holds.
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+QueryPlan = namedtuple('QueryPlan', ['select_related', 'prefetch_related'])
+
+
+def _relation(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
+
+
+def _single_valued_path(model, attrs):
+    """Longest prefix of `attrs` made of FK / one-to-one hops, and the model it reaches."""
+    path = []
+    for attr in attrs:
+        field = _relation(model, attr)
+        if field is None or not (field.many_to_one or field.one_to_one):
+            break
+        path.append(attr)
+        model = field.related_model
+    return path, model
+
+
+def _collect(serializer, model, prefix, select, prefetch):
+    meta = getattr(serializer, 'Meta', None)
+    select.update(prefix + path for path in getattr(meta, 'select_related', ()))
+    prefetch.extend((prefix + path, None, None) for path in getattr(meta, 'prefetch_related', ()))
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        attrs = field.source_attrs
+
+        if isinstance(field, serializers.ListSerializer) or isinstance(field, serializers.ManyRelatedField):
+            hops, owner = _single_valued_path(model, attrs[:-1])
+            relation = _relation(owner, attrs[len(hops)]) if len(hops) == len(attrs) - 1 else None
+            if relation is None:
+                continue
+            if hops:
+                select.add(prefix + '__'.join(hops))
+            lookup = prefix + '__'.join(attrs)
+            child = getattr(field, 'child', None)
+            if isinstance(child, serializers.ModelSerializer):
+                prefetch.append((lookup, relation.related_model, type(child)))
+            else:
+                prefetch.append((lookup, None, None))
+            continue
+
+        if isinstance(field, serializers.RelatedField) and field.use_pk_only_optimization():
+            attrs = attrs[:-1]   # `<fk>_id` is read straight from the row
+        hops, related_model = _single_valued_path(model, attrs)
+        if not hops:
+            continue
+        path = '__'.join(hops)
+        select.add(prefix + path)
+        if isinstance(field, serializers.ModelSerializer) and len(hops) == len(attrs):
+            _collect(field, related_model, f'{prefix}{path}__', select, prefetch)
+
+
+@lru_cache(maxsize=None)
+def build_query_plan(serializer_class, model):
+    select, prefetch = set(), []
+    _collect(serializer_class(), model, '', select, prefetch)
+    # Drop paths already implied by a longer one.
+    select = {path for path in select if not any(other.startswith(path + '__') for other in select)}
+    return QueryPlan(tuple(sorted(select)), tuple(prefetch))
+
+
+def optimize_queryset(queryset, serializer_class):
+    """Return `queryset` with the relations `serializer_class` reads loaded up front."""
+    plan = build_query_plan(serializer_class, queryset.model)
+    if plan.select_related:
+        queryset = queryset.select_related(*plan.select_related)
+    for lookup, related_model, child_class in plan.prefetch_related:
+        if child_class is None:
+            queryset = queryset.prefetch_related(lookup)
+        else:
+            inner = optimize_queryset(related_model._default_manager.all(), child_class)
+            queryset = queryset.prefetch_related(Prefetch(lookup, queryset=inner))
+    return queryset
+
+
+class OptimizedQuerysetMixin:
+    """
+    Generic-view mixin applying the serializer's query plan.  Hooked into
+    `filter_queryset` so views keep overriding `get_queryset` freely.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return optimize_queryset(queryset, self.get_serializer_class())
@@ -1,18 +1,22 @@
 from rest_framework import serializers
-from ..models import TicketCategory, Ticket
+from ..models import TicketCategory, Ticket, TicketReservation
+from .image_fields import SrcsetField
 
 
 class TicketCategorySerializer(serializers.ModelSerializer):
     remaining_quantity = serializers.ReadOnlyField()
     sold_count = serializers.ReadOnlyField()
+    checked_in_count = serializers.ReadOnlyField()
+    logo_srcset = SrcsetField('logo')
 
     class Meta:
         model = TicketCategory
         fields = [
             'id', 'name', 'description', 'price', 'total_quantity',
-            'remaining_quantity', 'sold_count',
+            'remaining_quantity', 'sold_count', 'checked_in_count',
             'sale_start_date', 'sale_start_time', 'sale_end_date', 'sale_end_time',
-            'logo', 'card_bg_type', 'card_bg_color', 'card_bg_color2',
+            'logo', 'logo_srcset', 'card_bg_type', 'card_bg_color', 'card_bg_color2',
+            'admission_rate',
         ]
 
 
@@ -45,3 +49,47 @@ class TicketSerializer(serializers.ModelSerializer):
 
     def get_owner_name(self, obj):
         return f"{obj.owner.first_name} {obj.owner.last_name}".strip() or obj.owner.username
+
+
+class TicketPurchaseLineSerializer(serializers.Serializer):
+    category = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class TicketBulkPurchaseSerializer(serializers.Serializer):
+    """A group order: several `(category, quantity)` lines bought in one go."""
+    MAX_TICKETS_PER_ORDER = 50
+
+    lines = TicketPurchaseLineSerializer(many=True, allow_empty=False)
+
+    def validate_lines(self, lines):
+        quantities = {}
+        for line in lines:
+            quantities[line['category']] = quantities.get(line['category'], 0) + line['quantity']
+        if sum(quantities.values()) > self.MAX_TICKETS_PER_ORDER:
+            raise serializers.ValidationError(
+                f"Puoi acquistare al massimo {self.MAX_TICKETS_PER_ORDER} biglietti per ordine."
+            )
+        return quantities
+
+
+class TicketReservationSerializer(serializers.ModelSerializer):
+    quantity = serializers.IntegerField(min_value=1, max_value=TicketBulkPurchaseSerializer.MAX_TICKETS_PER_ORDER)
+
+    class Meta:
+        model = TicketReservation
+        fields = ['id', 'category', 'quantity', 'expires_at', 'created_at']
+        read_only_fields = ['expires_at', 'created_at']
+
+
+class TicketScanSerializer(serializers.Serializer):
+    # Kept as text: malformed codes are reported per scan, not for the whole batch.
+    ticket_code = serializers.CharField(max_length=64)
+    scanned_at = serializers.DateTimeField(required=False)
+
+
+class TicketScanBatchSerializer(serializers.Serializer):
+    """Scans queued by an offline gate, flushed in one request."""
+    MAX_SCANS_PER_BATCH = 1000
+
+    scans = TicketScanSerializer(many=True, allow_empty=False, max_length=MAX_SCANS_PER_BATCH)
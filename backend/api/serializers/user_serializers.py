@@ -2,6 +2,7 @@ from django.contrib.auth import get_user_model
 from django.utils import timezone
 from rest_framework import serializers
 from ..models import Role, OrganizerProfile
+from .image_fields import SrcsetField
 from .permission_serializers import RoleSerializer
 
 User = get_user_model()
@@ -30,12 +31,13 @@ class UserSerializer(serializers.ModelSerializer):
     affiliated_to_username = serializers.SerializerMethodField()
     affiliated_to_code = serializers.CharField(write_only=True, required=False, allow_blank=True)
     organizer_profile = OrganizerProfileSerializer(read_only=True)
+    avatar_srcset = SrcsetField('avatar')
 
     class Meta:
         model = User
         fields = [
             'id', 'username', 'email', 'first_name', 'last_name',
-            'phone_number', 'bio', 'avatar', 'password',
+            'phone_number', 'bio', 'avatar', 'avatar_srcset', 'password',
             'roles_details', 'role_ids', 'all_permissions', 'is_super_admin',
             'affiliate_code', 'affiliated_to_username', 'affiliated_to_code', 'affiliation_date',
             'onboarding_completed', 'location', 'music_preferences',
@@ -46,6 +48,8 @@ class UserSerializer(serializers.ModelSerializer):
             'email': {'required': True},
             'affiliate_code': {'required': False},
         }
+        # Relations read by SerializerMethodFields (see query_plan)
+        select_related = ['affiliated_to']
 
     def get_all_permissions(self, obj):
         return obj.get_all_permissions()
@@ -211,6 +215,8 @@ class AdminOnboardingSerializer(serializers.Serializer):
 
 
 class AffiliateSerializer(serializers.ModelSerializer):
+    avatar_srcset = SrcsetField('avatar')
+
     class Meta:
         model = User
-        fields = ['id', 'username', 'avatar', 'affiliation_date']
+        fields = ['id', 'username', 'avatar', 'avatar_srcset', 'affiliation_date']
@@ -0,0 +1,139 @@
+"""
+Waiting room for high-demand ticket categories.
+
+Categories with an `admission_rate` only accept purchases carrying a queue
+token.  Joining the queue takes a ticket number from an atomic cache counter
+and turns it into an admission time: the n-th buyer of the current burst is
+admitted `n / rate` seconds after the burst started.  The admission time is
+signed into the token itself, so polling the queue position needs neither the
+database nor the cache.
+
+An admission is good for one purchase: `claim` marks it used with an atomic
+`cache.add` before the purchase runs, and `release` hands it back if the
+purchase fails.
+
+The queue counters, bursts and used-token markers are only one queue when
+every web process shares the cache; the app refuses to start several
+workers without REDIS_URL (`apps.check_shared_cache`).
+"""
+import math
+import time
+
+from django.core import signing
+from django.core.cache import cache
+
+TOKEN_SALT = 'api.admission'
+
+# How long an admitted buyer may keep using the token to check out.
+ADMISSION_WINDOW = 10 * 60
+
+# Tokens carry their admission time, so a used marker only has to outlive it.
+USED_TTL = ADMISSION_WINDOW + 60
+
+
+class NotAdmitted(Exception):
+    """The token is missing, invalid, for another buyer, or not yet due."""
+
+
+def _tail_key(category_id):
+    return f'admission:{category_id}:tail'
+
+
+def _burst_key(category_id):
+    return f'admission:{category_id}:burst'
+
+
+def _used_key(data):
+    return f"admission:{data['c']}:used:{data['n']}:{data['a']}"
+
+
+def _next_number(category_id):
+    key = _tail_key(category_id)
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add and incr: start over, numbers only need to grow.
+        cache.set(key, 1, None)
+        return 1
+
+
+def _burst(category, number, now):
+    """`(started_at, first_number)` of the burst `number` belongs to."""
+    key = _burst_key(category.id)
+    burst = cache.get(key)
+    if burst is None:
+        cache.add(key, (now, number), None)
+        return cache.get(key) or (now, number)
+
+    started_at, first_number = burst
+    if started_at + (number - first_number) / category.admission_rate >= now:
+        return burst
+    # Everyone before us has already been admitted: a new burst starts.  Only
+    # one joiner may start the burst following a given one, the others join it.
+    successor_key = f'{key}:after:{first_number}'
+    if cache.add(successor_key, (now, number), ADMISSION_WINDOW):
+        cache.set(key, (now, number), None)
+        return now, number
+    return cache.get(successor_key) or (now, number)
+
+
+def join(category, user):
+    """Queue `user` for `category` and return a signed token."""
+    now = time.time()
+    number = _next_number(category.id)
+    started_at, first_number = _burst(category, number, now)
+    admit_at = max(now, started_at + (number - first_number) / category.admission_rate)
+
+    return signing.dumps(
+        {'c': category.id, 'u': user.id, 'n': number, 'a': admit_at, 'r': category.admission_rate},
+        salt=TOKEN_SALT,
+    )
+
+
+def _load(token):
+    try:
+        return signing.loads(token, salt=TOKEN_SALT)
+    except (signing.BadSignature, TypeError):
+        raise NotAdmitted()
+
+
+def status(token):
+    """Queue position and retry hint for a token, computed from the token alone."""
+    data = _load(token)
+    wait = max(0.0, data['a'] - time.time())
+    return {
+        'category': data['c'],
+        'admitted': wait == 0,
+        'position': math.ceil(wait * data['r']),
+        'retry_after': math.ceil(wait),
+    }
+
+
+def check(token, category_id, user):
+    """Raise NotAdmitted unless `token` lets `user` buy from `category_id` now."""
+    if not token:
+        raise NotAdmitted()
+    data = _load(token)
+    now = time.time()
+    if data['c'] != category_id or data['u'] != user.id:
+        raise NotAdmitted()
+    if not data['a'] <= now <= data['a'] + ADMISSION_WINDOW:
+        raise NotAdmitted()
+    return data
+
+
+def claim(token, category_id, user):
+    """
+    `check` the token and mark its admission used; returns the claim for
+    `release`.  Raises NotAdmitted when it was already used.
+    """
+    key = _used_key(check(token, category_id, user))
+    if not cache.add(key, user.id, USED_TTL):
+        raise NotAdmitted()
+    return key
+
+
+def release(claim):
+    """Make a claimed admission usable again (the purchase did not go through)."""
+    cache.delete(claim)
@@ -0,0 +1,222 @@
+"""
+Facets of the public catalogue: month, country, price band, availability.
+
+Every PUBLISHED event has an `EventFacets` row with its facet values, and
+`FacetCount` holds the number of events per facet value, so the counts shown
+next to the catalogue are read from a few dozen rows instead of grouping the
+events on every request.
+
+Both tables are maintained incrementally by `refresh(event_ids)`: it
+recomputes the facet values of those events, compares them with the stored
+row and applies only the difference to the counts, holding the row locks of
+the events and their facet rows so concurrent refreshes of an event apply
+their differences one after the other.  It runs after commit of
+whatever changed the events, scheduled by `refresh_on_commit` from the
+`Event` / `TicketCategory` signals, the bulk status changes of the scheduler
+and the stock changes of `services.inventory` that sell a category out or
+bring it back, so the purchase transaction itself does not wait on it.
+`refresh_availability()` catches the availability flips those missed, and
+`rebuild()` recomputes everything from scratch.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Exists, F, Min, OuterRef
+from django.utils.dateparse import parse_date
+
+from .. import catalogue
+from ..models import Event, EventFacets, FacetCount, TicketCategory
+
+FACETS = ('month', 'country', 'price', 'availability')
+
+# (band, highest price included), cheapest first; the last band is open-ended.
+PRICE_BANDS = (
+    ('free', Decimal('0')),
+    ('under_20', Decimal('20')),
+    ('20_50', Decimal('50')),
+    ('over_50', None),
+)
+
+# The facet values only depend on these fields.
+EVENT_FIELDS = frozenset({'status', 'date', 'country_code'})
+CATEGORY_FIELDS = frozenset({'event', 'price', 'total_quantity', 'allocated_quantity'})
+
+
+def price_band(min_price):
+    if min_price is None:
+        return ''
+    for band, ceiling in PRICE_BANDS:
+        if ceiling is None or min_price <= ceiling:
+            return band
+
+
+def _keys(row):
+    """The `(facet, value)` pairs `row` is counted under."""
+    if row is None:
+        return []
+    keys = [('availability', 'available' if row.available else 'sold_out')]
+    if row.date:
+        keys.append(('month', row.date.strftime('%Y-%m')))
+    if row.country_code:
+        keys.append(('country', row.country_code))
+    if row.price_band:
+        keys.append(('price', row.price_band))
+    return keys
+
+
+def _compute(event_ids):
+    """Fresh `EventFacets` (unsaved) of the PUBLISHED events among `event_ids`."""
+    in_stock = TicketCategory.objects.filter(event=OuterRef('pk'), total_quantity__gt=F('allocated_quantity'))
+    events = (
+        Event.objects.filter(status='PUBLISHED')
+        .annotate(min_price=Min('ticket_categories__price'), available=Exists(in_stock))
+        .values('id', 'date', 'country_code', 'min_price', 'available')
+    )
+    if event_ids is not None:
+        events = events.filter(pk__in=event_ids)
+    return {
+        row['id']: EventFacets(
+            event_id=row['id'], date=row['date'], country_code=row['country_code'],
+            min_price=row['min_price'], price_band=price_band(row['min_price']), available=row['available'],
+        )
+        for row in events
+    }
+
+
+def _same(old, new):
+    return (old.date, old.country_code, old.min_price, old.price_band, old.available) == \
+        (new.date, new.country_code, new.min_price, new.price_band, new.available)
+
+
+def _apply(deltas):
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    FacetCount.objects.bulk_create(
+        [FacetCount(facet=facet, value=value) for facet, value in deltas], ignore_conflicts=True,
+    )
+    for (facet, value), delta in deltas.items():
+        FacetCount.objects.filter(facet=facet, value=value).update(count=F('count') + delta)
+
+
+def refresh(event_ids):
+    """Bring the facets of `event_ids` up to date; returns how many changed."""
+    event_ids = set(event_ids)
+    if not event_ids:
+        return 0
+    with transaction.atomic():
+        # Lock the events first: an event without a facet row yet has no row
+        # to lock, and two refreshes of it would both count it.
+        list(Event.objects.select_for_update().filter(pk__in=event_ids).order_by('pk').values_list('pk', flat=True))
+        old = EventFacets.objects.select_for_update().in_bulk(event_ids)
+        new = _compute(event_ids)
+        deltas = Counter()
+        changed, gone = [], []
+        for event_id in event_ids:
+            before, after = old.get(event_id), new.get(event_id)
+            if (before is None and after is None) or (before and after and _same(before, after)):
+                continue
+            deltas.subtract(_keys(before))
+            deltas.update(_keys(after))
+            if after is None:
+                gone.append(event_id)
+            else:
+                changed.append(after)
+
+        if gone:
+            EventFacets.objects.filter(pk__in=gone).delete()
+        if changed:
+            EventFacets.objects.bulk_create(
+                changed, update_conflicts=True, unique_fields=['event'],
+                update_fields=['date', 'country_code', 'min_price', 'price_band', 'available'],
+            )
+        _apply(deltas)
+        if deltas:
+            catalogue.bump_counters()
+    return len(changed) + len(gone)
+
+
+def refresh_on_commit(event_ids=(), category_ids=()):
+    """Schedule `refresh` for these events, and the events of these categories, after commit."""
+    event_ids, category_ids = set(event_ids), set(category_ids)
+
+    def run():
+        ids = set(event_ids)
+        if category_ids:
+            ids.update(TicketCategory.objects.filter(pk__in=category_ids).values_list('event_id', flat=True))
+        refresh(ids)
+
+    if event_ids or category_ids:
+        transaction.on_commit(run)
+
+
+def refresh_availability():
+    """Refresh the events whose stored availability disagrees with their stock; returns how many changed."""
+    in_stock = TicketCategory.objects.filter(event=OuterRef('event'), total_quantity__gt=F('allocated_quantity'))
+    stale = (
+        EventFacets.objects.annotate(in_stock=Exists(in_stock))
+        .exclude(available=F('in_stock'))
+        .values_list('event_id', flat=True)
+    )
+    return refresh(stale)
+
+
+def rebuild():
+    """Recompute every facet row and count from the events; returns the number of PUBLISHED events."""
+    with transaction.atomic():
+        rows = _compute(None)
+        EventFacets.objects.all().delete()
+        EventFacets.objects.bulk_create(rows.values())
+        totals = Counter(key for row in rows.values() for key in _keys(row))
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create(
+            [FacetCount(facet=facet, value=value, count=count) for (facet, value), count in totals.items()]
+        )
+        catalogue.bump()
+    return len(rows)
+
+
+def counts():
+    """`{facet: {value: count}}` over the PUBLISHED events; empty values are left out."""
+    result = {facet: {} for facet in FACETS}
+    rows = FacetCount.objects.filter(count__gt=0).order_by('facet', 'value').values_list('facet', 'value', 'count')
+    for facet, value, count in rows:
+        result[facet][value] = count
+    return result
+
+
+def _date_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f"Data non valida per '{name}': usa il formato AAAA-MM-GG.")
+    return parsed
+
+
+def filter_events(events, params):
+    """
+    Narrow `events` by the facet filters in `params`: `date_from` / `date_to`
+    (ISO dates, inclusive), `country`, `price` (a band) and `available=1`.
+    Raises ValueError with a message for the client on invalid values.
+    """
+    filters = {}
+    date_from, date_to = _date_param(params, 'date_from'), _date_param(params, 'date_to')
+    if date_from:
+        filters['facets__date__gte'] = date_from
+    if date_to:
+        filters['facets__date__lte'] = date_to
+    if params.get('country'):
+        filters['facets__country_code'] = params['country'].upper()
+    if params.get('price'):
+        if params['price'] not in dict(PRICE_BANDS):
+            raise ValueError(f"Fascia di prezzo non valida. Valori ammessi: {[band for band, _ in PRICE_BANDS]}")
+        filters['facets__price_band'] = params['price']
+    if params.get('available') in ('1', 'true'):
+        filters['facets__available'] = True
+    return events.filter(**filters) if filters else events
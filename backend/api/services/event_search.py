@@ -0,0 +1,119 @@
+"""
+Ranked full-text search over the published events.
+
+Title, location and description are indexed, weighted in that order.  Each
+word of the query matches as a prefix, so results narrow as the user types;
+all words must match.
+
+* PostgreSQL - a GIN index on the `to_tsvector` expression below (migration
+  0022).  The index is part of the table, so it follows every write.
+* SQLite (the local fallback) - an FTS5 table, `api_event_search`, keyed by
+  the event id.  It is kept in sync by `index` / `unindex`, called from the
+  `Event` save and delete signals; `rebuild()` repopulates it after bulk
+  `update()`s, which send no signals.
+
+The `simple` configuration is used on PostgreSQL: without stemming, prefix
+queries behave the same on both backends.
+"""
+import re
+
+from django.db import connection
+
+from ..models import Event
+
+FTS_TABLE = 'api_event_search'
+
+INDEXED_FIELDS = ('title', 'location', 'description')
+
+# Must match the indexed expression of migration 0022 to use the index.
+PG_VECTOR = (
+    "setweight(to_tsvector('simple', title), 'A') || "
+    "setweight(to_tsvector('simple', location), 'B') || "
+    "setweight(to_tsvector('simple', description), 'C')"
+)
+
+# bm25() weights of the FTS5 columns, in INDEXED_FIELDS order.
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+
+MAX_TERMS = 8
+MAX_RESULTS = 50
+
+
+def terms(query):
+    """The words of `query`, lower-cased, at most MAX_TERMS of them."""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def _pg_search(words, limit):
+    tsquery = ' & '.join(f"'{word}':*" for word in words)
+    sql = f"""
+        SELECT e.id
+        FROM api_event e, to_tsquery('simple', %s) query
+        WHERE e.status = 'PUBLISHED' AND ({PG_VECTOR}) @@ query
+        ORDER BY ts_rank_cd({PG_VECTOR}, query) DESC, e.id
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [tsquery, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fts_search(words, limit):
+    match = ' '.join(f'"{word}"*' for word in words)
+    weights = ', '.join(map(str, FTS_WEIGHTS))
+    sql = f"""
+        SELECT e.id
+        FROM {FTS_TABLE} s JOIN api_event e ON e.id = s.rowid
+        WHERE {FTS_TABLE} MATCH %s AND e.status = 'PUBLISHED'
+        ORDER BY bm25({FTS_TABLE}, {weights}), e.id
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search(query, limit=MAX_RESULTS):
+    """Ids of the published events matching `query`, best match first."""
+    words = terms(query)
+    if not words:
+        return []
+    if connection.vendor == 'postgresql':
+        return _pg_search(words, limit)
+    return _fts_search(words, limit)
+
+
+def _uses_fts():
+    return connection.vendor == 'sqlite'
+
+
+def index(event):
+    """Insert or refresh `event` in the FTS5 table; a no-op on PostgreSQL."""
+    if not _uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [event.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, location, description) VALUES (%s, %s, %s, %s)',
+            [event.pk, event.title, event.location, event.description],
+        )
+
+
+def unindex(event_id):
+    if not _uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [event_id])
+
+
+def rebuild():
+    """Repopulate the FTS5 table from scratch; returns the number of events indexed."""
+    if not _uses_fts():
+        return Event.objects.count()
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, location, description) '
+            'SELECT id, title, location, description FROM api_event'
+        )
+        return cursor.rowcount
@@ -0,0 +1,64 @@
+"""
+Process pool rendering ticket PDFs for bulk exports.
+
+Workers are spawned (not forked from the threaded server process) and set up
+Django themselves, so this module must not import models at import time.
+They render through `ticket_pdf_cache`, sharing its files with single-ticket
+downloads, and receive tickets with their category, event and owner already
+loaded, so they never query the database.
+"""
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    os.environ['DISABLE_SCHEDULER'] = '1'
+    import django
+    django.setup()
+
+
+def render(ticket):
+    from .ticket_pdf_cache import open_pdf
+    with open_pdf(ticket) as pdf:
+        return pdf.read()
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def render_all(tickets, workers):
+    """
+    Yield `(ticket, pdf_bytes)` in input order.  At most two renders per
+    worker are in flight, so memory stays bounded however many tickets the
+    iterable holds.  `workers=0` renders in the calling process.
+    """
+    if not workers:
+        for ticket in tickets:
+            yield ticket, render(ticket)
+        return
+
+    pool = _get_pool(workers)
+    window = deque()
+    for ticket in tickets:
+        window.append((ticket, pool.submit(render, ticket)))
+        if len(window) >= 2 * workers:
+            done, future = window.popleft()
+            yield done, future.result()
+    while window:
+        done, future = window.popleft()
+        yield done, future.result()
@@ -0,0 +1,300 @@
+"""
+Personalised "for you" event feed.
+
+Events are described by a precomputed feature matrix, `FeedMatrix`:
+
+* `tags` - one row per upcoming PUBLISHED event, one column per term of the
+  vocabulary, which is every genre users picked at onboarding
+  (`User.music_preferences`) and every event type organizers declared
+  (`OrganizerProfile.event_types`).  An event has a term when its organizer
+  declared it or when it appears in the title, description or category
+  names;
+* `locations` and `days` - the lower-cased location and the date of each
+  event, for the proximity and "coming soon" parts of the score.
+
+A user's feed is then a handful of vectorised operations over the matrix: a
+dot product of `tags` with the user's preference vector, a substring test of
+the user's city against `locations`, and a decay on the days left.
+
+The matrix is built by the `rebuild_feed_matrix` scheduler job and shared
+through the cache; each process keeps a deserialised copy until a newer
+build is published.  Requests never build it: until the first build is
+published, users get the `popular` events instead.
+
+Rebuilds are incremental and gated on two stamps the signals bump: the
+content stamp (`bump_content`, on saves of the event fields listed in
+EVENT_FIELDS / CATEGORY_FIELDS and of organizer event types; sales and
+scans do not touch it) and the vocabulary stamp (`bump_vocabulary`, on
+preference changes), behind which the scanned vocabulary is cached.  A tick
+with neither changed costs two cache reads, and only events whose text,
+organizer or date changed are featurised again.  Feeds are cached per user
+for `FEED_TTL` seconds, keyed by their preferences, so a repeat visit is a
+single cache lookup.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..models import Event, OrganizerProfile, TicketCategory, User
+
+FEED_TTL = 120
+MAX_RESULTS = 50
+
+# Score weights: shared tags dominate, then being in the user's city, then how soon.
+TAG_WEIGHT = 1.0
+LOCAL_WEIGHT = 0.5
+SOON_WEIGHT = 0.25
+# Days over which the "soon" bonus halves.
+SOON_HALF_LIFE = 30
+
+# Terms are matched as phrases of up to this many words.
+MAX_TERM_WORDS = 3
+
+# Saves touching only other fields leave the matrix as it is.
+EVENT_FIELDS = frozenset({'title', 'description', 'location', 'date', 'status', 'organizer'})
+CATEGORY_FIELDS = frozenset({'name', 'event'})
+
+_MATRIX_KEY = 'feed:matrix'
+_BUILT_KEY = 'feed:built_at'
+_CONTENT_KEY = 'feed:content'
+_VOCABULARY_STAMP_KEY = 'feed:vocabulary:stamp'
+_VOCABULARY_KEY = 'feed:vocabulary'
+
+FeedMatrix = namedtuple('FeedMatrix', [
+    'built_at',       # time_ns of the build, identifies the matrix across processes
+    'version',        # content stamp the matrix was built from
+    'vocabulary',     # tuple of terms, the columns of `tags`
+    'event_ids',      # int64[n]
+    'signatures',     # tuple of per-event hashes of the featurised fields
+    'tags',           # uint8[n, len(vocabulary)]
+    'tag_norms',      # float32[n], sqrt of the number of tags, at least 1
+    'locations',      # str[n], normalised
+    'days',           # float64[n], date as a day ordinal, NaN if undated
+])
+
+_local = None
+_local_lock = threading.Lock()
+
+
+def normalise(text):
+    """Lower-case `text` and strip its accents, so 'Città' matches 'citta'."""
+    text = unicodedata.normalize('NFKD', text or '').lower()
+    return ''.join(char for char in text if not unicodedata.combining(char)).strip()
+
+
+def _phrases(text):
+    """Every run of 1..MAX_TERM_WORDS consecutive words of `text`."""
+    words = re.findall(r'\w+', normalise(text))
+    return {
+        ' '.join(words[start:start + size])
+        for size in range(1, MAX_TERM_WORDS + 1)
+        for start in range(len(words) - size + 1)
+    }
+
+
+def _terms(values):
+    if not isinstance(values, list):
+        return set()
+    return {' '.join(re.findall(r'\w+', normalise(value))) for value in values if isinstance(value, str)} - {''}
+
+
+def _stamp(key):
+    stamp = cache.get(key)
+    if stamp is None:
+        # A new stamp after an eviction: at worst one needless rebuild.
+        cache.add(key, time.time_ns(), None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def _bump(key):
+    cache.set(key, time.time_ns(), None)
+    # Again after commit, so a rebuild that read the pre-commit rows in between is redone.
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), None))
+
+
+def bump_content():
+    """Something the matrix is built from changed: rebuild on the next tick."""
+    _bump(_CONTENT_KEY)
+
+
+def bump_vocabulary():
+    """A user's or organizer's terms changed: rescan the vocabulary on the next tick."""
+    _bump(_VOCABULARY_STAMP_KEY)
+
+
+def _scan_vocabulary():
+    terms = set()
+    for values in User.objects.exclude(music_preferences=[]).values_list('music_preferences', flat=True):
+        terms |= _terms(values)
+    for values in OrganizerProfile.objects.exclude(event_types=[]).values_list('event_types', flat=True):
+        terms |= _terms(values)
+    return tuple(sorted(terms))
+
+
+def vocabulary():
+    """Every genre users picked and event type organizers declared; scanned once per vocabulary stamp."""
+    # Stamp first: a change during the scan leaves the stored copy behind the new stamp.
+    stamp = _stamp(_VOCABULARY_STAMP_KEY)
+    cached = cache.get(_VOCABULARY_KEY)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    terms = _scan_vocabulary()
+    cache.set(_VOCABULARY_KEY, (stamp, terms), None)
+    return terms
+
+
+def _candidates():
+    """Feature inputs of the upcoming (or undated) PUBLISHED events."""
+    today = timezone.now().date()
+    events = list(
+        Event.objects.filter(status='PUBLISHED')
+        .exclude(date__lt=today)
+        .values('id', 'title', 'description', 'location', 'date', 'organizer__organizer_profile__event_types')
+        .order_by('id')
+    )
+    names = {}
+    categories = TicketCategory.objects.filter(event__in=[event['id'] for event in events])
+    for event_id, name in categories.values_list('event_id', 'name'):
+        names.setdefault(event_id, []).append(name)
+    for event in events:
+        event['categories'] = names.get(event['id'], [])
+        event['event_types'] = event.pop('organizer__organizer_profile__event_types') or []
+    return events
+
+
+def _signature(event):
+    fields = [event['title'], event['description'], event['location'], str(event['date']),
+              event['event_types'], event['categories']]
+    return hashlib.sha1(json.dumps(fields, default=str).encode()).hexdigest()
+
+
+def _tag_row(event, vocabulary):
+    present = _terms(event['event_types']) | _phrases(
+        ' \n '.join([event['title'], event['description'], *event['categories']])
+    )
+    return np.fromiter((term in present for term in vocabulary), dtype=np.uint8, count=len(vocabulary))
+
+
+def build(previous=None, version=None, terms=None):
+    """
+    A FeedMatrix of the current catalogue.  Rows of `previous` whose event
+    is unchanged are reused when the vocabulary is the same.
+    """
+    version = _stamp(_CONTENT_KEY) if version is None else version
+    terms = vocabulary() if terms is None else terms
+    events = _candidates()
+    reusable = {}
+    if previous is not None and previous.vocabulary == terms:
+        reusable = {
+            (event_id, signature): row
+            for row, (event_id, signature) in enumerate(zip(previous.event_ids.tolist(), previous.signatures))
+        }
+
+    signatures = [_signature(event) for event in events]
+    tags = np.zeros((len(events), len(terms)), dtype=np.uint8)
+    for row, (event, signature) in enumerate(zip(events, signatures)):
+        old = reusable.get((event['id'], signature))
+        tags[row] = previous.tags[old] if old is not None else _tag_row(event, terms)
+
+    return FeedMatrix(
+        built_at=time.time_ns(),
+        version=version,
+        vocabulary=terms,
+        event_ids=np.array([event['id'] for event in events], dtype=np.int64),
+        signatures=tuple(signatures),
+        tags=tags,
+        tag_norms=np.maximum(np.sqrt(tags.sum(axis=1, dtype=np.float32)), 1),
+        locations=np.array([normalise(event['location']) for event in events], dtype=str),
+        days=np.array([event['date'].toordinal() if event['date'] else np.nan for event in events], dtype=np.float64),
+    )
+
+
+def rebuild():
+    """Refresh the shared matrix if its content or vocabulary changed; returns True when rebuilt."""
+    previous = cache.get(_MATRIX_KEY)
+    version, terms = _stamp(_CONTENT_KEY), vocabulary()
+    if previous is not None and (previous.version, previous.vocabulary) == (version, terms):
+        return False
+    matrix = build(previous, version, terms)
+    cache.set(_MATRIX_KEY, matrix, None)
+    cache.set(_BUILT_KEY, matrix.built_at, None)
+    return True
+
+
+def current_matrix():
+    """This process's copy of the shared matrix, or None until the first build is published."""
+    global _local
+    built_at = cache.get(_BUILT_KEY)
+    local = _local
+    if local is not None and local.built_at == built_at:
+        return local
+    with _local_lock:
+        _local = cache.get(_MATRIX_KEY)
+        return _local
+
+
+def popular(limit=MAX_RESULTS):
+    """Ids of the upcoming PUBLISHED events selling best, for when there is no matrix yet."""
+    return list(
+        Event.objects.filter(status='PUBLISHED')
+        .exclude(date__lt=timezone.now().date())
+        .annotate(sold=Coalesce(Sum('ticket_categories__sold_count'), 0))
+        .order_by('-sold', 'date', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+
+
+def _user_city(user):
+    city = normalise((user.location or '').split(',')[0])
+    return city if len(city) >= 3 else ''
+
+
+def scores(matrix, preferences, city='', today=None):
+    """Score of every event of `matrix` for a user with `preferences` living in `city`."""
+    today = (today or timezone.now().date()).toordinal()
+    wanted = _terms(preferences)
+    user = np.fromiter((term in wanted for term in matrix.vocabulary), dtype=np.float32,
+                       count=len(matrix.vocabulary))
+
+    score = TAG_WEIGHT * (matrix.tags @ user) / matrix.tag_norms / max(np.sqrt(user.sum()), 1)
+    if city:
+        score += LOCAL_WEIGHT * (np.char.find(matrix.locations, city) >= 0)
+    days_left = matrix.days - today
+    soon = np.where(np.isnan(days_left), 0, 0.5 ** (np.maximum(days_left, 0) / SOON_HALF_LIFE))
+    score += SOON_WEIGHT * soon
+    # Events that took place since the matrix was built drop out.
+    return np.where(days_left < 0, -np.inf, score)
+
+
+def _cache_key(user):
+    profile = json.dumps([user.music_preferences, user.location], default=str)
+    return f'feed:user:{user.pk}:{hashlib.sha1(profile.encode()).hexdigest()[:16]}'
+
+
+def for_user(user, limit=MAX_RESULTS):
+    """Ids of the events recommended to `user`, best first."""
+    key = _cache_key(user)
+    ids = cache.get(key)
+    if ids is None:
+        matrix = current_matrix()
+        if matrix is None:
+            return popular(limit)   # not cached: the personalised feed takes over once built
+        score = scores(matrix, user.music_preferences, _user_city(user))
+        count = min(MAX_RESULTS, len(score))
+        top = np.argpartition(-score, count - 1)[:count] if count else np.array([], dtype=np.int64)
+        top = top[np.lexsort((matrix.event_ids[top], -score[top]))]
+        ids = [int(matrix.event_ids[i]) for i in top if np.isfinite(score[i])]
+        cache.set(key, ids, FEED_TTL)
+    return ids[:limit]
@@ -1,48 +1,113 @@
+"""
+Google Wallet "Add to Wallet" links.
+
+The issuer credentials live in Secret Manager.  They are fetched and parsed
+once into a `WalletSigner` - issuer e-mail and ID plus the loaded RSA key -
+which is kept in memory for `CREDENTIALS_TTL` seconds, so building a link is
+pure CPU work: a JSON payload and one RS256 signature.  `refresh_signer()`
+drops the cached signer right away, e.g. after rotating the key.
+
+Locally and in tests `GOOGLE_WALLET_CREDENTIALS_FILE` can point to the
+service account JSON instead; the issuer ID then comes from the
+`GOOGLE_WALLET_ISSUER_ID` environment variable.
+"""
 import json
 import os
+import threading
 import time
 import traceback
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import urljoin
 
 import jwt
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from django.conf import settings
 from google.cloud import secretmanager
 
 
 PROJECT_ID = "getinvolved-4767937"
 
+CREDENTIALS_FILE = getattr(settings, 'GOOGLE_WALLET_CREDENTIALS_FILE', os.environ.get('GOOGLE_WALLET_CREDENTIALS_FILE'))
+CREDENTIALS_TTL = getattr(settings, 'GOOGLE_WALLET_CREDENTIALS_TTL', 3600)
+
+WalletSigner = namedtuple('WalletSigner', ['client_email', 'issuer_id', 'private_key', 'loaded_at'])
+
+_signer = None
+_signer_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _secret_client():
+    return secretmanager.SecretManagerServiceClient()
+
 
 def _get_google_secret(secret_id: str, version_id: str = "latest") -> str | None:
     """Fetch a secret from Google Secret Manager, falling back to env vars."""
     try:
-        client = secretmanager.SecretManagerServiceClient()
         name = f"projects/{PROJECT_ID}/secrets/{secret_id}/versions/{version_id}"
-        response = client.access_secret_version(request={"name": name})
+        response = _secret_client().access_secret_version(request={"name": name})
         return response.payload.data.decode("UTF-8")
     except Exception:
         traceback.print_exc()
         return os.environ.get(secret_id)
 
 
-def generate_google_wallet_url(ticket, request) -> str:
-    """
-    Build a signed Google Wallet JWT for the given ticket and return the
-    'Add to Wallet' URL.  Raises ValueError on configuration errors and
-    RuntimeError on signing failures.
-    """
-    # --- Load credentials ---
-    creds_str = _get_google_secret('GOOGLE_WALLET_CREDENTIALS')
+def _read_credentials():
+    if CREDENTIALS_FILE:
+        with open(CREDENTIALS_FILE, encoding='utf-8') as f:
+            return f.read(), os.environ.get('GOOGLE_WALLET_ISSUER_ID')
+    return _get_google_secret('GOOGLE_WALLET_CREDENTIALS'), _get_google_secret('GOOGLE_WALLET_ISSUER_ID')
+
+
+def _load_signer():
+    creds_str, issuer_id_raw = _read_credentials()
     if not creds_str:
         raise ValueError("Credenziali Google Wallet assenti.")
 
     creds_str = creds_str.strip('\'"').replace('\\n', '\n')
     try:
         creds = json.loads(creds_str, strict=False)
+        client_email = creds['client_email']
+        private_key = load_pem_private_key(creds['private_key'].encode(), password=None)
     except Exception as exc:
         raise ValueError(f"Errore lettura Google Wallet Credentials: {exc}") from exc
 
-    issuer_id_raw = _get_google_secret('GOOGLE_WALLET_ISSUER_ID')
     if not issuer_id_raw:
         raise ValueError("GOOGLE_WALLET_ISSUER_ID assente.")
-    issuer_id = issuer_id_raw.strip('\'"')
+
+    return WalletSigner(client_email, issuer_id_raw.strip('\'"'), private_key, time.monotonic())
+
+
+def get_signer():
+    """The cached `WalletSigner`, loaded again once older than `CREDENTIALS_TTL`."""
+    global _signer
+    signer = _signer
+    if signer is not None and time.monotonic() - signer.loaded_at < CREDENTIALS_TTL:
+        return signer
+    with _signer_lock:
+        # Another thread may have loaded it while this one waited.
+        if _signer is None or time.monotonic() - _signer.loaded_at >= CREDENTIALS_TTL:
+            _signer = _load_signer()
+        return _signer
+
+
+def refresh_signer():
+    """Forget the cached credentials; the next link loads them again."""
+    global _signer
+    with _signer_lock:
+        _signer = None
+
+
+def generate_google_wallet_url(ticket, base_url) -> str:
+    """
+    Build a signed Google Wallet JWT for the given ticket and return the
+    'Add to Wallet' URL.  `base_url` is the site root the images and the
+    origin are resolved against.  Raises ValueError on configuration errors
+    and RuntimeError on signing failures.
+    """
+    signer = get_signer()
+    issuer_id = signer.issuer_id
 
     event = ticket.category.event
     class_id = f"{issuer_id}.{event.google_wallet_class_id}"
@@ -54,7 +119,7 @@ def generate_google_wallet_url(ticket, request) -> str:
     def _public_url(field):
         if not field:
             return None
-        url = request.build_absolute_uri(field.url)
+        url = urljoin(base_url, field.url)
         if 'localhost' in url or '127.0.0.1' in url:
             return None
         return url
@@ -98,11 +163,11 @@ def generate_google_wallet_url(ticket, request) -> str:
 
     # --- JWT payload ---
     claims = {
-        "iss": creds['client_email'],
+        "iss": signer.client_email,
         "aud": "google",
         "typ": "savetowallet",
         "iat": int(time.time()),
-        "origins": [request.build_absolute_uri("/").rstrip("/")],
+        "origins": [base_url.rstrip("/")],
         "payload": {
             "eventTicketClasses": [new_class],
             "eventTicketObjects": [new_object],
@@ -110,7 +175,7 @@ def generate_google_wallet_url(ticket, request) -> str:
     }
 
     try:
-        signed_jwt = jwt.encode(claims, creds['private_key'], algorithm="RS256")
+        signed_jwt = jwt.encode(claims, signer.private_key, algorithm="RS256")
         if isinstance(signed_jwt, bytes):
             signed_jwt = signed_jwt.decode('utf-8')
     except Exception as exc:
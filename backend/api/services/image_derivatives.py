@@ -0,0 +1,172 @@
+"""
+Responsive derivatives of uploaded images.
+
+Every image in `IMAGE_FIELDS` gets resized copies at `WIDTHS` in each of
+`FORMATS` (AVIF only where Pillow can encode it), written under
+`MEDIA_ROOT/derived/`.  They are produced by `run_jobs` workers: saving a
+model whose image changed queues an `image_derivatives` job (see `signals`),
+and `backfill_image_derivatives` queues the existing media.
+
+What was generated is recorded on the row itself, in the `<field>_variants`
+JSON field next to the image: the source name it was made from, the
+original size and the derivative names per format.  Serializers turn it into
+`srcset` strings (`SrcsetField`) without touching the storage, and ignore it
+while it still describes a previous upload.
+"""
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+from .. import catalogue
+from . import job_queue
+
+WIDTHS = (320, 640, 1280)
+
+# Best first: the order <picture> sources should be listed in.
+FORMATS = tuple(fmt for fmt in ('avif', 'webp', 'jpeg') if fmt != 'avif' or features.check('avif'))
+
+QUALITY = {'avif': 55, 'webp': 75, 'jpeg': 80}
+
+DERIVED_DIR = 'derived'
+
+# (model label, image field) pairs that get derivatives; `<field>_variants` holds the result.
+IMAGE_FIELDS = (
+    ('api.Event', 'poster_image'),
+    ('api.Event', 'hero_image'),
+    ('api.Event', 'organizer_logo'),
+    ('api.TicketCategory', 'logo'),
+    ('api.User', 'avatar'),
+)
+
+# Models whose images appear in the cached public catalogue.
+CATALOGUE_MODELS = {'api.Event', 'api.TicketCategory'}
+
+
+def variants_field(field):
+    return f'{field}_variants'
+
+
+def fields_of(model):
+    label = model._meta.label
+    return [field for model_label, field in IMAGE_FIELDS if model_label == label]
+
+
+def is_current(instance, field):
+    """True when the recorded variants describe the image the row holds now."""
+    name = getattr(instance, field).name
+    return not name or (getattr(instance, variants_field(field)) or {}).get('source') == name
+
+
+def derivative_name(source, width, fmt):
+    # The full source name, extension included: photo.jpg and photo.png must not share copies.
+    return f'{DERIVED_DIR}/{source}.{width}w.{"jpg" if fmt == "jpeg" else fmt}'
+
+
+def _encode(image, fmt):
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        # JPEG has no alpha: flatten onto white.
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    content = ContentFile(b'')
+    image.save(content, format=fmt.upper(), quality=QUALITY[fmt], optimize=fmt == 'jpeg')
+    return content
+
+
+def render(source):
+    """Write the derivatives of the stored image `source`; returns its variants record."""
+    with default_storage.open(source) as f, Image.open(f) as original:
+        original = ImageOps.exif_transpose(original)
+        original = original.convert('RGBA' if 'A' in original.getbands() or original.mode == 'P' else 'RGB')
+    width, height = original.size
+
+    # Never upscale: widths past the original collapse into one copy at full size.
+    widths = sorted({min(target, width) for target in WIDTHS})
+    srcset = {}
+    for fmt in FORMATS:
+        srcset[fmt] = []
+        for target in widths:
+            resized = original if target == width else original.resize(
+                (target, max(1, round(height * target / width))), Image.Resampling.LANCZOS,
+            )
+            name = derivative_name(source, target, fmt)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, _encode(resized, fmt))
+            srcset[fmt].append([target, name])
+    return {'source': source, 'width': width, 'height': height, 'srcset': srcset}
+
+
+def _names(variants):
+    return {name for entries in (variants or {}).get('srcset', {}).values() for _, name in entries}
+
+
+def delete(variants, keep=None):
+    """Remove the derivative files of `variants`, except those also in `keep`."""
+    for name in _names(variants) - _names(keep):
+        default_storage.delete(name)
+
+
+def schedule(instance, fields=None):
+    """
+    Queue derivatives for the images of `instance` they are missing for;
+    returns the jobs.  A finished job for the same upload is run again.
+    """
+    label = instance._meta.label
+    jobs = []
+    for field in fields_of(type(instance)) if fields is None else fields:
+        if is_current(instance, field):
+            continue
+        source = getattr(instance, field).name
+        job = job_queue.enqueue(
+            'image_derivatives',
+            {'model': label, 'pk': instance.pk, 'field': field},
+            key=f'image_derivatives:{label}:{instance.pk}:{field}:{source}',
+        )
+        if job.status in ('DONE', 'FAILED'):
+            job_queue.retry(job)
+        jobs.append(job)
+    return jobs
+
+
+def run_job(payload):
+    """Job handler: render the derivatives of one image field and record them on its row."""
+    model = apps.get_model(payload['model'])
+    field = payload['field']
+    instance = model._default_manager.filter(pk=payload['pk']).first()
+    if instance is None or is_current(instance, field):
+        return None
+    source = getattr(instance, field).name
+    variants = render(source)
+
+    # The image may have been replaced while rendering: only record a match.
+    updated = model._default_manager.filter(pk=instance.pk, **{field: source}).update(
+        **{variants_field(field): variants},
+    )
+    if not updated:
+        delete(variants)
+        return None
+    delete(getattr(instance, variants_field(field)), keep=variants)
+    if payload['model'] in CATALOGUE_MODELS:
+        catalogue.bump()
+    return {'formats': list(variants['srcset']), 'widths': [w for w, _ in variants['srcset'][FORMATS[0]]]}
+
+
+def srcset(instance, field, request=None):
+    """
+    `{"width", "height", "<format>": "<url> <w>w, ..."}` for the image in
+    `field`, or None when it has no derivatives yet.
+    """
+    if not getattr(instance, field).name or not is_current(instance, field):
+        return None
+    variants = getattr(instance, variants_field(field))
+
+    def url(name):
+        url = default_storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+
+    result = {'width': variants['width'], 'height': variants['height']}
+    for fmt, entries in variants['srcset'].items():
+        result[fmt] = ', '.join(f'{url(name)} {width}w' for width, name in entries)
+    return result
@@ -0,0 +1,135 @@
+"""
+Ticket stock accounting.
+
+`TicketCategory` carries three counters maintained here:
+
+* `allocated_quantity` - units taken out of stock (sold tickets + live holds);
+* `sold_count` - tickets issued;
+* `checked_in_count` - tickets validated at the gate.
+
+Each change is a single UPDATE with F() expressions.  Taking stock is a
+conditional UPDATE, so a reservation either fits in the remaining stock and
+is applied atomically, or touches no row at all.  This keeps purchases O(1)
+(no COUNT over tickets) and makes overselling impossible regardless of how
+many requests race for the last units.  Call these functions inside the
+transaction that creates/deletes the tickets so counters and rows commit
+together; `reconcile_ticket_counters` repairs any drift.
+
+The counters are shown in the public catalogue, so every change marks it
+stale (`catalogue.bump_counters`, throttled).  The availability facet of the
+event (see `event_facets`) only moves when a category sells out or comes back
+in stock, so only those changes refresh it, after commit: taking and giving
+back stock first try an UPDATE limited to the rows that stay on the same side
+of zero, and only fall back to the plain UPDATE (and the refresh) when that
+touches nothing.  An ordinary purchase therefore stays one UPDATE and never
+waits on the event row lock of a refresh; flips a race lets through are
+caught by the scheduler (`event_facets.refresh_availability`).
+"""
+from django.db import transaction
+from django.db.models import F, PositiveIntegerField, Value
+from django.db.models.functions import Greatest
+
+from .. import catalogue
+from ..models import Ticket, TicketCategory
+from . import event_facets
+
+
+class OutOfStock(Exception):
+    """The category cannot cover the requested quantity."""
+
+    def __init__(self, category_id, quantity):
+        self.category_id = category_id
+        self.quantity = quantity
+        super().__init__(f"Category {category_id} cannot cover {quantity} ticket(s).")
+
+
+def decrement(field, quantity):
+    """`field - quantity`, floored at zero so drift can never break the CHECK constraint."""
+    return Greatest(F(field) - quantity, Value(0), output_field=PositiveIntegerField())
+
+
+def _take(category_id, quantity, sold):
+    if quantity <= 0:
+        raise ValueError("quantity must be positive")
+    changes = {'allocated_quantity': F('allocated_quantity') + quantity}
+    if sold:
+        changes['sold_count'] = F('sold_count') + quantity
+    category = TicketCategory.objects.filter(pk=category_id)
+    if category.filter(allocated_quantity__lt=F('total_quantity') - quantity).update(**changes):
+        catalogue.bump_counters()
+        return
+    if not category.filter(allocated_quantity__lte=F('total_quantity') - quantity).update(**changes):
+        raise OutOfStock(category_id, quantity)
+    # The last units of the category.
+    catalogue.bump_counters()
+    event_facets.refresh_on_commit(category_ids=[category_id])
+
+
+def _give_back(category_id, changes):
+    """Apply `changes` returning stock to a category, refreshing its facets if it was sold out."""
+    category = TicketCategory.objects.filter(pk=category_id)
+    if not category.filter(allocated_quantity__lt=F('total_quantity')).update(**changes):
+        if category.update(**changes):
+            event_facets.refresh_on_commit(category_ids=[category_id])
+    catalogue.bump_counters()
+
+
+def reserve(category_id, quantity=1):
+    """Hold `quantity` units (no ticket yet) or raise OutOfStock."""
+    _take(category_id, quantity, sold=False)
+
+
+def purchase(category_id, quantity=1):
+    """Take `quantity` units for tickets issued right away, or raise OutOfStock."""
+    _take(category_id, quantity, sold=True)
+
+
+def purchase_many(quantities):
+    """
+    Purchase `{category_id: quantity}` all-or-nothing.  Must run inside a
+    transaction: the first category that cannot cover its line raises
+    OutOfStock and the rollback returns what was already taken.  Categories
+    are locked in id order so concurrent group orders cannot deadlock.
+    """
+    for category_id in sorted(quantities):
+        purchase(category_id, quantities[category_id])
+
+
+def confirm_reserved(category_id, quantity):
+    """Held units became tickets: stock is already allocated, count the sale."""
+    TicketCategory.objects.filter(pk=category_id).update(sold_count=F('sold_count') + quantity)
+    catalogue.bump_counters()
+
+
+def release(category_id, quantity=1):
+    """Give `quantity` held units back to stock."""
+    if quantity <= 0:
+        raise ValueError("quantity must be positive")
+    _give_back(category_id, {'allocated_quantity': decrement('allocated_quantity', quantity)})
+
+
+def record_check_ins(counts):
+    """Add `{category_id: n}` newly validated tickets to the check-in counters."""
+    counts = {category_id: count for category_id, count in counts.items() if count}
+    for category_id, count in counts.items():
+        TicketCategory.objects.filter(pk=category_id).update(
+            checked_in_count=F('checked_in_count') + count,
+        )
+    if counts:
+        catalogue.bump_counters()
+
+
+def refund(ticket):
+    """Delete `ticket` and give its unit back to stock. False if already gone."""
+    with transaction.atomic():
+        deleted, _ = Ticket.objects.filter(pk=ticket.pk).delete()
+        if not deleted:
+            return False
+        changes = {
+            'allocated_quantity': decrement('allocated_quantity', 1),
+            'sold_count': decrement('sold_count', 1),
+        }
+        if ticket.is_checked_in:
+            changes['checked_in_count'] = decrement('checked_in_count', 1)
+        _give_back(ticket.category_id, changes)
+    return True
@@ -0,0 +1,138 @@
+"""
+Database-backed background job queue.
+
+Jobs are `BackgroundJob` rows, so enqueueing is part of the caller's
+transaction (a job for a ticket exists exactly when the ticket does) and no
+broker is needed.  `python manage.py run_jobs` workers claim due jobs with
+`SELECT ... FOR UPDATE SKIP LOCKED`, so any number of them can run side by
+side; a job whose worker died is claimed again once its lease expires.
+
+Handlers are referenced by dotted path in `HANDLERS`, take the job payload
+and return a JSON-serialisable result.  A failing job is retried with
+exponential backoff up to `MAX_ATTEMPTS`, then marked FAILED.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from ..models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {
+    'ticket_pdf': 'api.services.ticket_artifacts.render_pdf',
+    'ticket_wallet': 'api.services.ticket_artifacts.sign_wallet_url',
+    'image_derivatives': 'api.services.image_derivatives.run_job',
+    'ticket_export': 'api.services.ticket_export.run_job',
+}
+
+MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = timedelta(seconds=10)
+
+# A RUNNING job not finished within this long is assumed lost and re-run.
+LEASE = timedelta(minutes=5)
+
+
+def enqueue(kind, payload, key=None):
+    """
+    Queue a job and return it.  With a `key`, an existing job for the same key
+    is returned as it is, whatever its status; see `retry`.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    if key is None:
+        return BackgroundJob.objects.create(kind=kind, payload=payload)
+
+    job = BackgroundJob.objects.filter(key=key).first()
+    if job is None:
+        try:
+            with transaction.atomic():
+                return BackgroundJob.objects.create(kind=kind, key=key, payload=payload)
+        except IntegrityError:
+            job = BackgroundJob.objects.get(key=key)
+    return job
+
+
+def enqueue_many(jobs):
+    """Queue `(kind, key, payload)` triples in one INSERT, skipping keys already queued."""
+    BackgroundJob.objects.bulk_create(
+        [BackgroundJob(kind=kind, key=key, payload=payload) for kind, key, payload in jobs],
+        ignore_conflicts=True,
+    )
+
+
+def retry(job, payload=None):
+    """Put a finished job back in the queue, from scratch."""
+    job.status = 'PENDING'
+    job.attempts = 0
+    job.run_after = timezone.now()
+    job.result = None
+    if payload is not None:
+        job.payload = payload
+    job.save(update_fields=['status', 'attempts', 'run_after', 'result', 'payload'])
+
+
+def claim(limit=10):
+    """Mark up to `limit` due jobs as RUNNING for this worker and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            BackgroundJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status='PENDING', run_after__lte=now)
+                | Q(status='RUNNING', locked_at__lt=now - LEASE)
+            )
+            .order_by('run_after', 'id')[:limit]
+        )
+        if jobs:
+            BackgroundJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status='RUNNING', locked_at=now, attempts=F('attempts') + 1,
+            )
+            for job in jobs:
+                job.status, job.locked_at = 'RUNNING', now
+                job.attempts += 1
+    return jobs
+
+
+def run(job):
+    """Execute a claimed job and record its outcome."""
+    try:
+        result = import_string(HANDLERS[job.kind])(job.payload)
+    except Exception as exc:
+        logger.warning("Job %s failed (attempt %s): %s", job, job.attempts, exc)
+        job.last_error = str(exc) or traceback.format_exc(limit=1)
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = 'FAILED'
+            job.finished_at = timezone.now()
+        else:
+            job.status = 'PENDING'
+            job.run_after = timezone.now() + RETRY_BASE_DELAY * 2 ** (job.attempts - 1)
+        job.save(update_fields=['status', 'last_error', 'finished_at', 'run_after'])
+        return False
+
+    job.status = 'DONE'
+    job.result = result
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'finished_at'])
+    return True
+
+
+def run_pending(limit=10):
+    """Claim and run one batch of due jobs; returns how many ran."""
+    jobs = claim(limit)
+    for job in jobs:
+        run(job)
+    return len(jobs)
+
+
+def purge_finished(older_than):
+    """Delete DONE and FAILED jobs finished before `older_than`; returns the count."""
+    deleted, _ = BackgroundJob.objects.filter(
+        status__in=['DONE', 'FAILED'], finished_at__lt=older_than,
+    ).delete()
+    return deleted
@@ -0,0 +1,161 @@
+"""
+Live check-in dashboard feed.
+
+Organizers watching an event subscribe to an in-process hub instead of
+polling the ticket list.  The hub keeps, per watched event, the check-in
+and sales counts of each category plus the last few scans, seeded from the
+`TicketCategory` counters (one small query, no ticket rows) and then updated
+incrementally by `publish`, which the check-in path calls after commit.
+
+Subscribers are asyncio queues living on the ASGI event loop, while
+check-ins run in worker threads, so the hub is guarded by a lock and hands
+messages over with `call_soon_threadsafe`.  Boards are dropped when their
+last subscriber leaves, and every subscriber resyncs from the counters every
+`RESYNC_INTERVAL` seconds, which also picks up scans handled by other worker
+processes and refunds.
+
+EventSource cannot send an Authorization header, and a JWT in the query
+string ends up in access logs, so a stream is opened with a stream ticket:
+a random, single-use credential bound to one user and event that lives in
+the shared cache for TICKET_TTL seconds.  Streams end after STREAM_LIFETIME
+seconds with a `reconnect` event; the dashboard then asks for a new ticket.
+"""
+import secrets
+import threading
+from collections import deque
+
+from django.core.cache import cache
+
+from ..models import TicketCategory
+
+RECENT_SCANS = 20
+RESYNC_INTERVAL = 15
+TICKET_TTL = 30
+STREAM_LIFETIME = 300
+
+
+def _ticket_key(ticket):
+    return f'live:ticket:{ticket}'
+
+
+def issue_ticket(user, event_id):
+    """A stream ticket letting `user` open one feed of the event."""
+    ticket = secrets.token_urlsafe(24)
+    cache.set(_ticket_key(ticket), (user.pk, event_id), TICKET_TTL)
+    return ticket
+
+
+def redeem_ticket(ticket, event_id):
+    """Consume a stream ticket; returns its user id, or None if unknown, used, expired or for another event."""
+    key = _ticket_key(ticket)
+    grant = cache.get(key)
+    # Only the request whose delete removed the key may use it.
+    if grant is None or not cache.delete(key):
+        return None
+    user_id, granted_event_id = grant
+    return user_id if granted_event_id == event_id else None
+
+
+class EventBoard:
+    def __init__(self, event_id):
+        self.event_id = event_id
+        self.categories = {}
+        self.recent = deque(maxlen=RECENT_SCANS)
+
+    def load(self):
+        self.categories = {
+            row['id']: row
+            for row in TicketCategory.objects.filter(event_id=self.event_id)
+            .order_by('id')
+            .values('id', 'name', 'sold_count', 'checked_in_count')
+        }
+
+    def snapshot(self):
+        return {
+            'event': self.event_id,
+            'checked_in': sum(row['checked_in_count'] for row in self.categories.values()),
+            'sold': sum(row['sold_count'] for row in self.categories.values()),
+            'categories': list(self.categories.values()),
+            'recent': list(self.recent),
+        }
+
+
+class CheckInHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._boards = {}
+        self._category_events = {}
+        self._subscribers = {}
+
+    def subscribe(self, event_id, loop, queue):
+        """Start feeding `queue` (owned by `loop`); returns the current snapshot."""
+        board = EventBoard(event_id)
+        board.load()
+        with self._lock:
+            if event_id in self._boards:
+                board = self._boards[event_id]
+            else:
+                self._track(board)
+            self._subscribers.setdefault(event_id, set()).add((loop, queue))
+            return board.snapshot()
+
+    def unsubscribe(self, event_id, loop, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(event_id, set())
+            subscribers.discard((loop, queue))
+            if not subscribers:
+                self._subscribers.pop(event_id, None)
+                board = self._boards.pop(event_id, None)
+                for category_id in board.categories if board else ():
+                    self._category_events.pop(category_id, None)
+
+    def resync(self, event_id):
+        """Reload the board from the counters; returns the fresh snapshot."""
+        board = EventBoard(event_id)
+        board.load()
+        with self._lock:
+            current = self._boards.get(event_id)
+            if current is None:
+                return board.snapshot()
+            board.recent = current.recent
+            for category_id in current.categories:
+                self._category_events.pop(category_id, None)
+            self._track(board)
+            return board.snapshot()
+
+    def _track(self, board):
+        self._boards[board.event_id] = board
+        for category_id in board.categories:
+            self._category_events[category_id] = board.event_id
+
+    def publish(self, results):
+        """Record successful `checkin.CheckIn` results and notify subscribers."""
+        with self._lock:
+            for result in results:
+                event_id = self._category_events.get(result.category_id)
+                if event_id is None:
+                    continue   # nobody is watching this event
+                board = self._boards[event_id]
+                category = board.categories[result.category_id]
+                category['checked_in_count'] += 1
+                scan = {
+                    'ticket_id': result.ticket_id,
+                    'category': result.category_id,
+                    'category_name': result.category_name,
+                    'owner_name': result.owner_name,
+                    'checked_in_at': result.checked_in_at.isoformat(),
+                }
+                board.recent.appendleft(scan)
+                message = {
+                    'scan': scan,
+                    'category_checked_in': category['checked_in_count'],
+                    'checked_in': sum(row['checked_in_count'] for row in board.categories.values()),
+                }
+                for loop, queue in self._subscribers.get(event_id, ()):
+                    try:
+                        loop.call_soon_threadsafe(queue.put_nowait, message)
+                    except RuntimeError:
+                        pass   # loop closed under a disconnecting client
+
+
+hub = CheckInHub()
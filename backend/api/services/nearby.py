@@ -0,0 +1,70 @@
+"""
+"Events near me" without PostGIS.
+
+A query runs in two steps, both in the database:
+
+1. a bounding box around the point, as plain ranges on `latitude` and
+   `longitude`, which the `(status, latitude, longitude)` index answers
+   without touching events elsewhere in the world;
+2. the exact great-circle (haversine) distance of the few events in the
+   box, computed with Django's math functions - native on PostgreSQL,
+   registered by Django on SQLite - then filtered and sorted by it.
+
+The box is the exact one of the circle (the longitude span widens towards
+the poles), wraps across the antimeridian and covers every longitude when
+the circle contains a pole.
+"""
+import math
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt
+
+from ..models import Event
+
+EARTH_RADIUS_KM = 6371.0088
+
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 500
+MAX_RESULTS = 100
+
+
+def bounding_box(lat, lng, radius_km):
+    """`Q` selecting the coordinates within the box enclosing the circle."""
+    angular = radius_km / EARTH_RADIUS_KM
+    lat_min, lat_max = lat - math.degrees(angular), lat + math.degrees(angular)
+    if lat_min <= -90 or lat_max >= 90:
+        return Q(latitude__range=(max(lat_min, -90), min(lat_max, 90)), longitude__isnull=False)
+
+    delta = math.degrees(math.asin(math.sin(angular) / math.cos(math.radians(lat))))
+    lng_min, lng_max = lng - delta, lng + delta
+    box = Q(latitude__range=(lat_min, lat_max))
+    if lng_min < -180:
+        return box & (Q(longitude__gte=lng_min + 360) | Q(longitude__lte=lng_max))
+    if lng_max > 180:
+        return box & (Q(longitude__gte=lng_min) | Q(longitude__lte=lng_max - 360))
+    return box & Q(longitude__range=(lng_min, lng_max))
+
+
+def haversine_km(lat, lng):
+    """Expression for the distance in km between each event and `(lat, lng)`."""
+    phi = Radians(Cast(F('latitude'), FloatField()))
+    lam = Radians(Cast(F('longitude'), FloatField()))
+    phi0, lam0 = math.radians(lat), math.radians(lng)
+    a = (
+        Power(Sin((phi - phi0) / 2), 2)
+        + math.cos(phi0) * Cos(phi) * Power(Sin((lam - lam0) / 2), 2)
+    )
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(a))
+
+
+def events_near(lat, lng, radius_km=DEFAULT_RADIUS_KM, limit=MAX_RESULTS, queryset=None):
+    """Published events within `radius_km` of `(lat, lng)`, nearest first, with `distance_km`."""
+    if queryset is None:
+        queryset = Event.objects.all()
+    return (
+        queryset
+        .filter(bounding_box(lat, lng, radius_km), status='PUBLISHED')
+        .annotate(distance_km=haversine_km(lat, lng))
+        .filter(distance_km__lte=radius_km)
+        .order_by('distance_km', 'id')[:limit]
+    )
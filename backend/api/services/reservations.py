@@ -0,0 +1,127 @@
+"""
+Time-boxed cart reservations.
+
+A hold takes stock out of `TicketCategory.allocated_quantity` immediately
+(see `inventory`), so a buyer sitting on the checkout screen cannot lose the
+tickets to later buyers.  Confirming turns the hold into `Ticket` rows without
+touching stock again; cancelling or letting it expire gives the stock back.
+
+Expired holds are released in bulk by `release_expired`, which the scheduler
+runs every minute in every web process: the expired rows are claimed with
+`SELECT ... FOR UPDATE SKIP LOCKED`, so two sweepers never release the same
+hold twice, then one UPDATE over the touched categories and one DELETE of
+the claimed rows.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, When
+from django.utils import timezone
+
+from .. import catalogue
+from ..models import Ticket, TicketCategory, TicketReservation
+from . import event_facets, inventory
+
+HOLD_TTL = timedelta(minutes=getattr(settings, 'TICKET_HOLD_MINUTES', 10))
+
+# Holds are only swept once they have been expired for this long, so a
+# confirm that claimed a hold right before its deadline has finished its
+# transaction before the sweeper counts the hold as released stock.
+SWEEP_GRACE = timedelta(seconds=60)
+
+# Holds released per transaction: a backlog is swept in short transactions
+# walking the expires_at index, not one long write lock.
+SWEEP_BATCH = 500
+
+
+class ReservationExpired(Exception):
+    """The hold no longer exists or its deadline has passed."""
+
+
+def hold(category_id, owner, quantity=1):
+    """Reserve stock for `owner` until `HOLD_TTL` from now. Raises OutOfStock."""
+    with transaction.atomic():
+        inventory.reserve(category_id, quantity)
+        return TicketReservation.objects.create(
+            category_id=category_id,
+            owner=owner,
+            quantity=quantity,
+            expires_at=timezone.now() + HOLD_TTL,
+        )
+
+
+def _claim(reservation):
+    """Delete the hold if still live; False when it expired or was already used."""
+    deleted, _ = TicketReservation.objects.filter(
+        pk=reservation.pk, expires_at__gt=timezone.now(),
+    ).delete()
+    return bool(deleted)
+
+
+def confirm(reservation):
+    """Turn a live hold into tickets. The stock is already allocated."""
+    with transaction.atomic():
+        if not _claim(reservation):
+            raise ReservationExpired()
+        inventory.confirm_reserved(reservation.category_id, reservation.quantity)
+        return Ticket.objects.bulk_create([
+            Ticket(category=reservation.category, owner=reservation.owner)
+            for _ in range(reservation.quantity)
+        ])
+
+
+def cancel(reservation):
+    """Give a live hold back to stock. Expired holds are left to the sweeper."""
+    with transaction.atomic():
+        if _claim(reservation):
+            inventory.release(reservation.category_id, reservation.quantity)
+
+
+def release_expired(now=None):
+    """Release every hold expired for longer than SWEEP_GRACE; returns the count."""
+    cutoff = (now or timezone.now()) - SWEEP_GRACE
+    released = 0
+    while True:
+        batch = _release_batch(cutoff)
+        released += batch
+        if batch < SWEEP_BATCH:
+            return released
+
+
+def _release_batch(cutoff):
+    """Release up to SWEEP_BATCH of the oldest expired holds in one transaction; returns the count."""
+    with transaction.atomic():
+        # Rows another sweeper holds are skipped: it releases them itself.
+        claimed = list(
+            TicketReservation.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(expires_at__lte=cutoff)
+            .order_by('expires_at')
+            .values_list('id', 'category_id', 'quantity', 'category__allocated_quantity', 'category__total_quantity')
+            [:SWEEP_BATCH]
+        )
+        if not claimed:
+            return 0
+        totals = Counter()
+        # Only categories coming back from sold out can change an event's availability.
+        restocked = set()
+        for _, category_id, quantity, allocated, total in claimed:
+            totals[category_id] += quantity
+            if allocated >= total:
+                restocked.add(category_id)
+
+        TicketCategory.objects.filter(pk__in=totals).update(
+            allocated_quantity=Case(
+                *[
+                    When(pk=category_id, then=inventory.decrement('allocated_quantity', quantity))
+                    for category_id, quantity in totals.items()
+                ],
+                default=F('allocated_quantity'),
+                output_field=PositiveIntegerField(),
+            )
+        )
+        deleted, _ = TicketReservation.objects.filter(pk__in=[row[0] for row in claimed]).delete()
+        catalogue.bump_counters()
+        event_facets.refresh_on_commit(category_ids=restocked)
+    return deleted
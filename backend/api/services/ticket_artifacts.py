@@ -0,0 +1,99 @@
+"""
+Pre-generated ticket artifacts: the PDF and the Google Wallet link.
+
+Both are produced by `run_jobs` workers through the job queue, scheduled in
+the purchase transaction, so download requests only look up a finished
+result: the PDF is the `ticket_pdf_cache` file, the wallet link is the
+result of the ticket's job.  Job keys embed the render fingerprint, so
+editing the event or category schedules fresh artifacts on next download.
+A job that failed for good is reported with its stored error until
+FAILED_RETRY_AFTER has passed; only the first download after that queues
+it again.
+"""
+import math
+from datetime import timedelta
+
+from django.utils import timezone
+
+from ..models import Ticket
+from . import job_queue, ticket_pdf_cache
+from .google_wallet import generate_google_wallet_url
+
+FAILED_RETRY_AFTER = timedelta(minutes=10)
+
+
+class ArtifactFailed(Exception):
+    """Generation failed for good; it is queued again after `retry_after` seconds."""
+
+    def __init__(self, error, retry_after):
+        super().__init__(error)
+        self.retry_after = retry_after
+
+
+def _pdf_key(ticket):
+    return f'ticket_pdf:{ticket.pk}:{ticket_pdf_cache.fingerprint(ticket)}'
+
+
+def _wallet_key(ticket):
+    return f'ticket_wallet:{ticket.pk}:{ticket_pdf_cache.fingerprint(ticket)}'
+
+
+def schedule(tickets, base_url):
+    """Queue both artifacts of freshly sold `tickets`."""
+    job_queue.enqueue_many(
+        job
+        for ticket in tickets
+        for job in (
+            ('ticket_pdf', _pdf_key(ticket), {'ticket': ticket.pk}),
+            ('ticket_wallet', _wallet_key(ticket), {'ticket': ticket.pk, 'base_url': base_url}),
+        )
+    )
+
+
+def _job(kind, key, payload, rerun_done=False):
+    job = job_queue.enqueue(kind, payload, key=key)
+    if job.status == 'FAILED':
+        wait = (job.finished_at + FAILED_RETRY_AFTER - timezone.now()).total_seconds()
+        if wait > 0:
+            raise ArtifactFailed(job.last_error, math.ceil(wait))
+        job_queue.retry(job, payload)
+    elif rerun_done and job.status == 'DONE':
+        job_queue.retry(job, payload)
+    return job
+
+
+def open_pdf(ticket):
+    """The ticket's PDF as an open file, or None while it is being generated."""
+    try:
+        return ticket_pdf_cache.open_cached(ticket)
+    except FileNotFoundError:
+        # A finished job whose file was pruned since has to render it again.
+        _job('ticket_pdf', _pdf_key(ticket), {'ticket': ticket.pk}, rerun_done=True)
+        return None
+
+
+def wallet_url(ticket, base_url):
+    """The ticket's 'Add to Google Wallet' URL, or None while it is being signed."""
+    job = _job('ticket_wallet', _wallet_key(ticket), {'ticket': ticket.pk, 'base_url': base_url})
+    if job.status == 'DONE':
+        return job.result['url']
+    return None
+
+
+# ----- job handlers -----
+
+def _load(ticket_id):
+    return Ticket.objects.select_related('category__event', 'owner').filter(pk=ticket_id).first()
+
+
+def render_pdf(payload):
+    ticket = _load(payload['ticket'])
+    if ticket is not None:   # refunded in the meantime
+        ticket_pdf_cache.open_pdf(ticket).close()
+
+
+def sign_wallet_url(payload):
+    ticket = _load(payload['ticket'])
+    if ticket is None:
+        return None
+    return {'url': generate_google_wallet_url(ticket, payload['base_url'])}
@@ -0,0 +1,132 @@
+"""
+Bulk ticket export for box-office printing.
+
+Two formats, both built on `ticket_pdf`:
+
+* `zip` - one PDF per ticket, rendered in the `export_pool` processes and
+  written into a ZIP archive that is streamed as entries complete; only the
+  render window and the current entry are ever held in memory;
+* `pdf` - a single multi-page document.  No byte of it can be sent before
+  the last page is drawn, so it is built by a `run_jobs` worker into
+  EXPORT_DIR (`schedule_pdf`) and downloaded once the job is done; images
+  shared by the tickets are embedded once for the whole document.  Files
+  older than EXPORT_MAX_AGE are removed by `prune`.
+"""
+import os
+import tempfile
+import time
+import uuid
+import zipfile
+
+from django.conf import settings
+
+from ..models import Event, Ticket
+from . import export_pool, job_queue
+from .ticket_pdf import write_tickets_pdf
+
+FORMATS = ('zip', 'pdf')
+
+WORKERS = getattr(settings, 'TICKET_EXPORT_WORKERS', 2)
+
+# Tickets fetched from the database per round trip.
+CHUNK = 200
+
+EXPORT_DIR = getattr(settings, 'TICKET_EXPORT_DIR', os.path.join(settings.MEDIA_ROOT, 'ticket_exports'))
+EXPORT_MAX_AGE = 24 * 3600
+
+
+class ExportFailed(Exception):
+    """The export job failed for good."""
+
+
+def export_queryset(event, category_id=None):
+    tickets = Ticket.objects.filter(event=event)
+    if category_id is not None:
+        tickets = tickets.filter(category_id=category_id)
+    return tickets.select_related('category__event', 'owner').order_by('category_id', 'id')
+
+
+def entry_name(ticket):
+    return f'Ticket_{ticket.ticket_code}.pdf'
+
+
+class _Chunks:
+    """Write-only, unseekable sink: ZipFile falls back to data descriptors."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(tickets, workers=None):
+    """Yield the bytes of a ZIP holding one PDF per ticket, as they are produced."""
+    workers = WORKERS if workers is None else workers
+    sink = _Chunks()
+    # PDFs are already compressed; storing them keeps the archive cheap to build.
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for ticket, pdf in export_pool.render_all(tickets, workers):
+            archive.writestr(entry_name(ticket), pdf)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def schedule_pdf(event, category_id=None):
+    """Queue the multi-page PDF of the event's tickets (or a category's); returns the job."""
+    payload = {'event': event.pk, 'category': category_id, 'file': f'{uuid.uuid4().hex}.pdf'}
+    return job_queue.enqueue('ticket_export', payload)
+
+
+def open_pdf(job):
+    """The finished export of `job` as an open file, or None while it is being built."""
+    if job.status == 'FAILED':
+        raise ExportFailed(job.last_error)
+    if job.status != 'DONE':
+        return None
+    return open(os.path.join(EXPORT_DIR, job.result['file']), 'rb')
+
+
+def prune(max_age=EXPORT_MAX_AGE):
+    """Delete exports older than `max_age` seconds; returns how many."""
+    if not os.path.isdir(EXPORT_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+# ----- job handler -----
+
+def run_job(payload):
+    event = Event.objects.filter(pk=payload['event']).first()
+    if event is None:
+        raise ExportFailed('Evento non trovato')
+    tickets = export_queryset(event, payload['category']).iterator(chunk_size=CHUNK)
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    # Written to a temp name and renamed, so a download never sees a partial file.
+    fd, tmp_path = tempfile.mkstemp(dir=EXPORT_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            write_tickets_pdf(tickets, output)
+        os.replace(tmp_path, os.path.join(EXPORT_DIR, payload['file']))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return {'file': payload['file']}
@@ -1,29 +1,51 @@
+"""
+Ticket PDF rendering.
+
+Everything that only depends on the event and category (colours, hero,
+poster and logo) is prepared once as a `RenderTemplate` and shared by every
+ticket of that category: images are decoded and scaled once to the size they
+are drawn at, and written next to the media as small files.  JPEG copies are
+embedded in the PDF as-is, without decoding, so per ticket only the text and
+the QR code are actually rendered; the QR code is drawn as vector shapes
+by `ticket_qr`.  Templates are cached per version of their image files, and
+pre-scaled copies nobody has used for ASSETS_MAX_AGE are removed by
+`prune_assets`.
+"""
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
 from io import BytesIO
+import hashlib
 import os
+import tempfile
+import threading
+import time
 
+from django.conf import settings
+from PIL import Image
+from reportlab import rl_config
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
+from reportlab.lib.units import cm, inch
 from reportlab.lib import colors
-from reportlab.lib.utils import ImageReader
-import qrcode
 
+from .ticket_qr import draw_qr
+
+ASSETS_DIR = getattr(settings, 'TICKET_RENDER_ASSETS_DIR', os.path.join(settings.MEDIA_ROOT, 'ticket_render'))
+# Pre-scaled copies not used for this long are deleted by `prune_assets`.
+ASSETS_MAX_AGE = 7 * 24 * 3600
+
+# Resolution of the pre-scaled images; print quality for an A4 ticket.
+RENDER_DPI = 150
+
+HERO_BOX = (19 * cm, 8 * cm)
+POSTER_BOX = (5 * cm, 6.5 * cm)
+LOGO_BOX = (2 * cm, 2 * cm)
+
+RenderTemplate = namedtuple('RenderTemplate', ['primary_color', 'contrast_color', 'hero', 'poster', 'logo'])
 
-def generate_ticket_pdf(ticket) -> BytesIO:
-    """Generate a PDF ticket and return a BytesIO buffer ready to be served."""
-    event = ticket.category.event
 
-    # --- QR Code ---
-    qr = qrcode.QRCode(version=1, box_size=10, border=4)
-    qr.add_data(ticket.ticket_code)
-    qr.make(fit=True)
-    img_qr = qr.make_image(fill_color="black", back_color="white")
-    qr_stream = BytesIO()
-    img_qr.save(qr_stream, format="PNG")
-    qr_stream.seek(0)
-
-    # --- Colors from category ---
-    bg_color_hex = ticket.category.card_bg_color or '#6200EA'
+def _parse_colors(bg_color_hex):
     try:
         hex_c = bg_color_hex.lstrip('#')
         if len(hex_c) == 3:
@@ -34,10 +56,158 @@ def generate_ticket_pdf(ticket) -> BytesIO:
     except Exception:
         primary_color = colors.HexColor('#6200EA')
         contrast_color = colors.white
+    return primary_color, contrast_color
+
+
+_a85_lock = threading.Lock()
+_a85_users = 0
+_a85_saved = None
+
+
+@contextmanager
+def _binary_streams():
+    """
+    Have ReportLab embed streams as binary instead of ASCII85 text, whose
+    pure Python encoder would otherwise dominate the render time of every
+    ticket.  ReportLab only reads the process-wide `rl_config.useA85` flag,
+    so it is switched off for as long as one of our canvases is drawing an
+    image or writing its document, and restored once the last one is done.
+    """
+    global _a85_users, _a85_saved
+    with _a85_lock:
+        if not _a85_users:
+            _a85_saved, rl_config.useA85 = rl_config.useA85, 0
+        _a85_users += 1
+    try:
+        yield
+    finally:
+        with _a85_lock:
+            _a85_users -= 1
+            if not _a85_users:
+                rl_config.useA85 = _a85_saved
+
+
+class TicketCanvas(canvas.Canvas):
+    """A canvas writing binary image and page streams (see `_binary_streams`)."""
+
+    def drawImage(self, *args, **kwargs):
+        with _binary_streams():
+            return super().drawImage(*args, **kwargs)
+
+    def save(self):
+        with _binary_streams():
+            super().save()
+
+
+def _prescaled(source, box, fit):
+    """
+    Path of a copy of the image `source` (see `image_source`) scaled to `box`
+    (points) at RENDER_DPI, created on first use.  `fit` keeps the aspect
+    ratio inside the box, otherwise the image is stretched to fill it.
+    Images with transparency are kept as PNG, everything else becomes JPEG.
+    Returns None if the image is missing or unreadable, in which case it is
+    not drawn.
+    """
+    if not source:
+        return None
+    path, mtime, length = source
+    size = tuple(max(1, round(side / inch * RENDER_DPI)) for side in box)
+    key = hashlib.sha1(f'{path}:{mtime}:{length}:{size}:{fit}'.encode()).hexdigest()
+
+    try:
+        with Image.open(path) as img:
+            transparent = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+            scaled = os.path.join(ASSETS_DIR, f'{key}.png' if transparent else f'{key}.jpg')
+            if os.path.exists(scaled):
+                os.utime(scaled)   # in use: keep it out of prune_assets' reach
+                return scaled
+            img = img.convert('RGBA' if transparent else 'RGB')
+            if fit:
+                img.thumbnail(size, Image.LANCZOS)
+            else:
+                img = img.resize(size, Image.LANCZOS)
+            os.makedirs(ASSETS_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=ASSETS_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as tmp:
+                if transparent:
+                    img.save(tmp, format='PNG', optimize=True)
+                else:
+                    img.save(tmp, format='JPEG', quality=85)
+            os.replace(tmp_path, scaled)
+            return scaled
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+@lru_cache(maxsize=256)
+def _build_template(bg_color_hex, hero_source, poster_source, logo_source):
+    primary_color, contrast_color = _parse_colors(bg_color_hex)
+    return RenderTemplate(
+        primary_color,
+        contrast_color,
+        hero=_prescaled(hero_source, HERO_BOX, fit=False),
+        poster=_prescaled(poster_source, POSTER_BOX, fit=True),
+        logo=_prescaled(logo_source, LOGO_BOX, fit=True),
+    )
+
+
+def image_source(field):
+    """
+    `(path, mtime, size)` of the file behind an image field, or None if it
+    is missing.  Part of the template cache key, so a file replaced in place
+    is picked up.
+    """
+    if not field:
+        return None
+    try:
+        stat = os.stat(field.path)
+    except FileNotFoundError:
+        return None
+    return field.path, stat.st_mtime_ns, stat.st_size
+
+
+def render_template(category):
+    """The shared, per-category part of the ticket, built once per version of its inputs."""
+    event = category.event
+    poster = image_source(event.poster_image)
+    key = (
+        category.card_bg_color or '#6200EA',
+        image_source(event.hero_image) or poster,
+        poster,
+        image_source(category.logo) or image_source(event.organizer_logo),
+    )
+    template = _build_template(*key)
+    if not all(os.path.exists(path) for path in template[2:] if path):
+        # A long-lived template whose copies prune_assets removed meanwhile.
+        _build_template.cache_clear()
+        template = _build_template(*key)
+    return template
+
+
+def prune_assets(max_age=ASSETS_MAX_AGE):
+    """Delete pre-scaled copies unused for `max_age` seconds; returns how many."""
+    if not os.path.isdir(ASSETS_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(ASSETS_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def draw_ticket(p, ticket):
+    """Draw `ticket` on the current page of canvas `p`."""
+    event = ticket.category.event
+    template = render_template(ticket.category)
+
+    primary_color, contrast_color = template.primary_color, template.contrast_color
 
     # --- Canvas ---
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
     width, height = A4
 
     t_width = 19 * cm
@@ -59,15 +229,9 @@ def generate_ticket_pdf(ticket) -> BytesIO:
     p.setFillColor(primary_color)
     p.rect(margin_x, margin_y + t_height - 8 * cm, t_width, 8 * cm, fill=1, stroke=0)
 
-    hero_img = None
-    if event.hero_image and os.path.exists(event.hero_image.path):
-        hero_img = event.hero_image.path
-    elif event.poster_image and os.path.exists(event.poster_image.path):
-        hero_img = event.poster_image.path
-
-    if hero_img:
+    if template.hero:
         try:
-            p.drawImage(hero_img, margin_x, margin_y + t_height - 8 * cm,
+            p.drawImage(template.hero, margin_x, margin_y + t_height - 8 * cm,
                         width=t_width, height=8 * cm, preserveAspectRatio=False)
             p.setFillColor(colors.Color(0, 0, 0, alpha=0.3))
             p.rect(margin_x, margin_y + t_height - 8 * cm, t_width, 8 * cm, fill=1, stroke=0)
@@ -86,14 +250,10 @@ def generate_ticket_pdf(ticket) -> BytesIO:
     p.setFillColor(colors.whitesmoke)
     p.rect(margin_x, margin_y + t_height - 16 * cm, t_width, 8 * cm, fill=1, stroke=0)
 
-    poster_img = None
-    if event.poster_image and os.path.exists(event.poster_image.path):
-        poster_img = event.poster_image.path
-
     text_start_x = margin_x + 1 * cm
-    if poster_img:
+    if template.poster:
         try:
-            p.drawImage(poster_img, margin_x + 1 * cm, margin_y + t_height - 15 * cm,
+            p.drawImage(template.poster, margin_x + 1 * cm, margin_y + t_height - 15 * cm,
                         width=5 * cm, height=6.5 * cm, preserveAspectRatio=True, anchor='c')
             text_start_x += 5.5 * cm
         except Exception:
@@ -178,9 +338,7 @@ def generate_ticket_pdf(ticket) -> BytesIO:
     p.rect(margin_x, margin_y, t_width, t_height - 19 * cm, fill=1, stroke=0)
 
     qr_size = 4.5 * cm
-    p.drawImage(ImageReader(qr_stream),
-                margin_x + t_width / 2 - qr_size / 2, margin_y + 2.5 * cm,
-                width=qr_size, height=qr_size)
+    draw_qr(p, ticket.ticket_code, margin_x + t_width / 2 - qr_size / 2, margin_y + 2.5 * cm, qr_size)
 
     p.setFont("Helvetica", 9)
     p.setFillColor(colors.darkgrey)
@@ -190,15 +348,9 @@ def generate_ticket_pdf(ticket) -> BytesIO:
     p.setFillColor(colors.black)
     p.drawCentredString(margin_x + t_width / 2, margin_y + 1.2 * cm, str(ticket.ticket_code))
 
-    logo_to_draw = None
-    if ticket.category.logo:
-        logo_to_draw = ticket.category.logo.path
-    elif event.organizer_logo:
-        logo_to_draw = event.organizer_logo.path
-
-    if logo_to_draw and os.path.exists(logo_to_draw):
+    if template.logo:
         try:
-            p.drawImage(logo_to_draw, margin_x + 1 * cm, margin_y + 0.5 * cm,
+            p.drawImage(template.logo, margin_x + 1 * cm, margin_y + 0.5 * cm,
                         width=2 * cm, height=2 * cm, preserveAspectRatio=True, anchor='sw', mask='auto')
         except Exception:
             pass
@@ -211,8 +363,19 @@ def generate_ticket_pdf(ticket) -> BytesIO:
     p.drawCentredString(width / 2, margin_y - 1 * cm,
                         "Mostra questo biglietto all'ingresso. Conservalo con cura.")
 
-    p.showPage()
+
+def write_tickets_pdf(tickets, fileobj):
+    """Write `tickets` to `fileobj` as one PDF, a page per ticket.  Shared images are embedded once."""
+    p = TicketCanvas(fileobj, pagesize=A4)
+    for ticket in tickets:
+        draw_ticket(p, ticket)
+        p.showPage()
     p.save()
 
+
+def generate_ticket_pdf(ticket) -> BytesIO:
+    """Generate a PDF ticket and return a BytesIO buffer ready to be served."""
+    buffer = BytesIO()
+    write_tickets_pdf([ticket], buffer)
     buffer.seek(0)
     return buffer
@@ -0,0 +1,126 @@
+"""
+On-disk cache of rendered ticket PDFs.
+
+A ticket's PDF only changes when something drawn on it changes, so files are
+addressed by the ticket code plus a fingerprint of every rendered field
+(event, category, owner name, and the path, mtime and size of each image
+file, so an image replaced under the same name is picked up).  Editing the event simply
+produces a new address; the stale file of that ticket is removed when the
+new one is written, and anything else unused ages out through `prune`, which
+keeps the directory under `TICKET_PDF_CACHE_MAX_BYTES` by deleting the least
+recently served files.  Files are written to a temp name and renamed into
+place, so concurrent downloads never see a partial PDF.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+
+from .ticket_pdf import generate_ticket_pdf, image_source
+
+# Bump when the layout in ticket_pdf changes, to invalidate every cached file.
+RENDER_VERSION = 3
+
+CACHE_DIR = getattr(settings, 'TICKET_PDF_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, 'ticket_pdfs'))
+MAX_BYTES = getattr(settings, 'TICKET_PDF_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+
+# Pruning stops once the cache is back under this share of MAX_BYTES.
+PRUNE_TARGET = 0.9
+
+
+def fingerprint(ticket):
+    """Hash of everything `generate_ticket_pdf` draws for `ticket`."""
+    category = ticket.category
+    event = category.event
+    owner = ticket.owner
+    rendered = [
+        RENDER_VERSION,
+        event.title, event.location, str(event.date), str(event.start_time),
+        image_source(event.hero_image), image_source(event.poster_image), image_source(event.organizer_logo),
+        category.name, f'{category.price:.2f}', category.card_bg_color, image_source(category.logo),
+        owner.first_name, owner.last_name, owner.username,
+    ]
+    return hashlib.sha256(json.dumps(rendered).encode()).hexdigest()[:24]
+
+
+def path_for(ticket):
+    code = str(ticket.ticket_code)
+    return os.path.join(CACHE_DIR, code[:2], f'{code}-{fingerprint(ticket)}.pdf')
+
+
+def _write(path, ticket):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    buffer = generate_ticket_pdf(ticket)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(buffer.getbuffer())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    # Drop renders of this ticket made before the last edit.
+    prefix = f'{ticket.ticket_code}-'
+    for entry in os.scandir(directory):
+        if entry.name.startswith(prefix) and entry.path != path:
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def open_cached(ticket):
+    """Open the ticket's cached PDF; raises FileNotFoundError if it is not rendered yet."""
+    path = path_for(ticket)
+    pdf = open(path, 'rb')
+    # The mtime doubles as "last served" for pruning.
+    os.utime(path)
+    return pdf
+
+
+def open_pdf(ticket):
+    """
+    Return an open binary file with the ticket's PDF, rendering it on a miss.
+    `ticket` should come with `category__event` and `owner` loaded.
+    """
+    try:
+        return open_cached(ticket)
+    except FileNotFoundError:
+        path = path_for(ticket)
+        _write(path, ticket)
+        return open(path, 'rb')
+
+
+def prune(max_bytes=MAX_BYTES):
+    """Delete least recently served files until the cache fits; returns how many."""
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+    files, total = [], 0
+    for shard in os.scandir(CACHE_DIR):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes * PRUNE_TARGET:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,80 @@
+"""
+Ticket QR codes drawn as vector shapes.
+
+Instead of rasterising the code to a PNG and embedding the image, the module
+matrix is drawn straight onto the ReportLab canvas as one filled path.  Dark
+modules are merged into horizontal runs, and identical runs on consecutive
+rows into a single rectangle, so a ticket code takes a couple of hundred
+path operators instead of an image stream; the result is sharp at any zoom.
+
+The rectangles only depend on the ticket code, so they are cached: a ticket
+downloaded again, or exported in bulk after the first download, skips the
+Reed-Solomon encoding entirely.
+"""
+from functools import lru_cache
+
+from reportlab.lib import colors
+import qrcode
+
+# Quiet zone around the code, in modules, as the previous PNG rendering had.
+BORDER = 4
+
+
+def _runs(row):
+    """`(start, length)` of each stretch of dark modules in `row`."""
+    runs = []
+    start = None
+    for x, dark in enumerate(row):
+        if dark and start is None:
+            start = x
+        elif not dark and start is not None:
+            runs.append((start, x - start))
+            start = None
+    if start is not None:
+        runs.append((start, len(row) - start))
+    return runs
+
+
+def _merge(matrix):
+    """Cover the dark modules of `matrix` with `(x, y, width, height)` rectangles."""
+    rects = []
+    open_runs = {}   # (start, length) -> first row of the rectangle being grown
+    for y, row in enumerate(matrix):
+        runs = set(_runs(row))
+        for run in list(open_runs):
+            if run not in runs:
+                top = open_runs.pop(run)
+                rects.append((run[0], top, run[1], y - top))
+        for run in runs:
+            open_runs.setdefault(run, y)
+    for run, top in open_runs.items():
+        rects.append((run[0], top, run[1], len(matrix) - top))
+    return tuple(sorted(rects, key=lambda rect: (rect[1], rect[0])))
+
+
+@lru_cache(maxsize=4096)
+def modules(data):
+    """`(size, rects)` for `data`: side of the matrix in modules, quiet zone included."""
+    qr = qrcode.QRCode(border=BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    return len(matrix), _merge(matrix)
+
+
+def draw_qr(p, data, x, y, size):
+    """Draw the QR code of `data` on canvas `p` as a `size` square at `(x, y)`."""
+    count, rects = modules(str(data))
+    module = size / count
+
+    p.saveState()
+    p.setFillColor(colors.white)
+    p.rect(x, y, size, size, fill=1, stroke=0)
+
+    path = p.beginPath()
+    for col, row, width, height in rects:
+        # Matrix rows run top-down, PDF coordinates bottom-up.
+        path.rect(x + col * module, y + size - (row + height) * module, width * module, height * module)
+    p.setFillColor(colors.black)
+    p.drawPath(path, fill=1, stroke=0)
+    p.restoreState()
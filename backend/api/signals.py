@@ -0,0 +1,181 @@
+"""
+Signal receivers that keep derived state (caches, counters) in sync with the
+models.  Connected from `ApiConfig.ready`.
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import catalogue, permission_cache
+from .services import event_facets, event_search, feed, image_derivatives
+from .models import AppPermission, Event, OrganizerProfile, Role, TicketCategory, User
+
+
+# ---------------------------------------------------------------------------
+# RBAC permission cache
+# ---------------------------------------------------------------------------
+
+@receiver(m2m_changed, sender=User.roles.through)
+def user_roles_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, User):
+        instance.refresh_permission_snapshot()
+        permission_cache.bump_users([instance.pk])
+    elif action == 'post_add':
+        # role.users.add(...): the new members' entries don't reference the role yet.
+        permission_cache.bump_users(pk_set)
+    else:
+        permission_cache.bump_roles([instance.pk])
+
+
+@receiver(m2m_changed, sender=Role.permissions.through)
+def role_permissions_changed(sender, instance, action, pk_set, **kwargs):
+    if action == 'pre_clear' and isinstance(instance, AppPermission):
+        # pk_set is None on clear; remember the affected roles before they go.
+        instance._cleared_role_ids = list(instance.roles.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Role):
+        permission_cache.bump_roles([instance.pk])
+    elif action == 'post_clear':
+        permission_cache.bump_roles(getattr(instance, '_cleared_role_ids', []))
+    else:
+        permission_cache.bump_roles(pk_set)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def role_changed(sender, instance, **kwargs):
+    permission_cache.bump_roles([instance.pk])
+
+
+@receiver(pre_delete, sender=AppPermission)
+def app_permission_deleting(sender, instance, **kwargs):
+    permission_cache.bump_roles(list(instance.roles.values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=AppPermission)
+def app_permission_saved(sender, instance, created, **kwargs):
+    if not created:
+        # A renamed codename changes the cached sets of every role holding it.
+        permission_cache.bump_roles(list(instance.roles.values_list('id', flat=True)))
+    permission_cache.bump_global()
+
+
+@receiver(post_delete, sender=AppPermission)
+def app_permission_deleted(sender, instance, **kwargs):
+    permission_cache.bump_global()
+
+
+# ---------------------------------------------------------------------------
+# Public catalogue cache
+# ---------------------------------------------------------------------------
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=TicketCategory)
+@receiver(post_delete, sender=TicketCategory)
+def catalogue_changed(sender, instance, **kwargs):
+    catalogue.bump()
+
+
+# ---------------------------------------------------------------------------
+# Event search index
+# ---------------------------------------------------------------------------
+
+@receiver(post_save, sender=Event)
+def event_search_saved(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(event_search.INDEXED_FIELDS):
+        return
+    event_search.index(instance)
+
+
+@receiver(post_delete, sender=Event)
+def event_search_deleted(sender, instance, **kwargs):
+    event_search.unindex(instance.pk)
+
+
+# ---------------------------------------------------------------------------
+# Catalogue facets
+# ---------------------------------------------------------------------------
+
+@receiver(post_save, sender=Event)
+def event_facets_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not event_facets.EVENT_FIELDS & set(update_fields):
+        return
+    event_facets.refresh_on_commit(event_ids=[instance.pk])
+
+
+@receiver(post_delete, sender=Event)
+def event_facets_deleted(sender, instance, **kwargs):
+    event_facets.refresh_on_commit(event_ids=[instance.pk])
+
+
+@receiver(post_save, sender=TicketCategory)
+def category_facets_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not event_facets.CATEGORY_FIELDS & set(update_fields):
+        return
+    event_facets.refresh_on_commit(event_ids=[instance.event_id])
+
+
+@receiver(post_delete, sender=TicketCategory)
+def category_facets_deleted(sender, instance, **kwargs):
+    event_facets.refresh_on_commit(event_ids=[instance.event_id])
+
+
+# ---------------------------------------------------------------------------
+# Personalised feed matrix
+# ---------------------------------------------------------------------------
+
+@receiver(post_save, sender=Event)
+def feed_event_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not feed.EVENT_FIELDS & set(update_fields):
+        return
+    feed.bump_content()
+
+
+@receiver(post_save, sender=TicketCategory)
+def feed_category_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not feed.CATEGORY_FIELDS & set(update_fields):
+        return
+    feed.bump_content()
+
+
+@receiver(post_delete, sender=Event)
+@receiver(post_delete, sender=TicketCategory)
+def feed_content_deleted(sender, instance, **kwargs):
+    feed.bump_content()
+
+
+@receiver(post_save, sender=OrganizerProfile)
+@receiver(post_delete, sender=OrganizerProfile)
+def feed_event_types_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'event_types' not in update_fields:
+        return
+    # Event types are terms of the vocabulary and tags of the organizer's events.
+    feed.bump_vocabulary()
+    feed.bump_content()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def feed_preferences_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'music_preferences' not in update_fields:
+        return
+    feed.bump_vocabulary()
+
+
+# ---------------------------------------------------------------------------
+# Responsive image derivatives
+# ---------------------------------------------------------------------------
+
+@receiver(post_save, sender=Event)
+@receiver(post_save, sender=TicketCategory)
+@receiver(post_save, sender=User)
+def images_saved(sender, instance, update_fields=None, **kwargs):
+    fields = image_derivatives.fields_of(sender)
+    if update_fields is not None:
+        fields = [field for field in fields if field in update_fields]
+    if fields:
+        image_derivatives.schedule(instance, fields)
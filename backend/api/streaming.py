@@ -0,0 +1,47 @@
+"""
+Streaming bodies that stay streamed under both handlers.
+
+Django's ASGI handler reads a *sync* iterator of a `StreamingHttpResponse`
+(and the file behind a `FileResponse`) with `sync_to_async(list)`, holding
+the whole body in memory before the first byte goes out, while the WSGI
+handler does the same to an *async* iterator.  Views therefore hand their
+generators to `stream`, which keeps them as they are for WSGI requests and
+wraps them for ASGI requests in an async iterator that pulls one chunk at a
+time from the request's sync thread (the same thread that owns its
+database connection).
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+_DONE = object()
+
+
+def is_asgi(request):
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def stream(request, iterable):
+    """`iterable` as a response body suited to the handler serving `request`."""
+    if not is_asgi(request):
+        return iterable
+    return _pull(iter(iterable))
+
+
+async def _pull(iterator):
+    step = sync_to_async(next)
+    try:
+        while (chunk := await step(iterator, _DONE)) is not _DONE:
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def stream_file(request, response):
+    """Re-point a `FileResponse` at an async reader of its file under ASGI."""
+    if is_asgi(request) and response.file_to_stream is not None:
+        filelike = response.file_to_stream
+        # block_size is read per chunk: the ASGI handler raises it after the view returns.
+        response.streaming_content = _pull(iter(lambda: filelike.read(response.block_size), b''))
+    return response
@@ -1,3 +1,1797 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from io import BytesIO, StringIO
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection, transaction
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+import jwt
+from PIL import Image
+from reportlab import rl_config
+import qrcode
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import catalogue, permission_cache
+from .models import (
+    AppPermission, BackgroundJob, Event, EventFacets, OrganizerProfile, PermissionCategory, Role, Ticket,
+    TicketCategory, TicketReservation, User,
+)
+from .jobs import conclude_past_events, prune_ticket_pdf_cache, run_queued_jobs
+from .pagination import EventDatePagination
+from .permission_snapshot import reset_snapshot_stats, snapshot_stats
+from .serializers import EventSerializer, UserSerializer
+from .services import admission, checkin, event_facets, feed, google_wallet, image_derivatives, inventory, job_queue, live_checkins, manifest, nearby, reservations, ticket_artifacts, ticket_export, ticket_pdf, ticket_pdf_cache, ticket_qr
+
+
+def make_user(username):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', password='x')
+
+
+def make_category(total_quantity=10, **event_fields):
+    organizer = make_user(f'organizer{Event.objects.count()}')
+    event = Event.objects.create(title='Evento', organizer=organizer, **event_fields)
+    return TicketCategory.objects.create(event=event, name='Standard', total_quantity=total_quantity)
+
+
+class PermissionSnapshotTests(TestCase):
+    def setUp(self):
+        category = PermissionCategory.objects.create(name='Test')
+        self.view = AppPermission.objects.create(name='Vedi', codename='test_view', category=category)
+        self.edit = AppPermission.objects.create(name='Modifica', codename='test_edit', category=category)
+        self.role = Role.objects.create(name='Staff')
+        self.role.permissions.set([self.view, self.edit])
+        self.user = make_user('staff')
+        self.user.roles.set([self.role])
+        cache.clear()
+        reset_snapshot_stats()
+
+    def fresh(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_every_check_is_answered_by_one_query(self):
+        user = self.fresh()
+        with self.assertNumQueries(1):
+            self.assertFalse(user.is_super_admin)
+            self.assertTrue(user.has_app_permission('test_view'))
+            self.assertFalse(user.has_app_permission('test_delete'))
+            self.assertEqual(user.get_all_permissions(), ['test_edit', 'test_view'])
+
+        # is_super_admin twice (once inside get_all_permissions), two codename lookups
+        self.assertEqual(user.permission_snapshot.lookups, 4)
+        self.assertEqual(user.permission_snapshot.queries_saved, 3)
+        self.assertEqual(snapshot_stats(), {
+            'loads': 1, 'cache_hits': 0, 'prefetched': 0, 'lookups': 4, 'queries_saved': 3,
+        })
+
+    def test_later_requests_are_served_from_the_shared_cache(self):
+        self.fresh().has_app_permission('test_view')
+        user = self.fresh()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_app_permission('test_edit'))
+            self.assertFalse(user.is_super_admin)
+        self.assertEqual(user.permission_snapshot.queries_saved, 2)
+        stats = snapshot_stats()
+        self.assertEqual((stats['loads'], stats['cache_hits'], stats['queries_saved']), (1, 1, 2))
+
+    def test_prefetched_roles_need_no_query(self):
+        user = User.objects.prefetch_related('roles__permissions').get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_app_permission('test_view'))
+        self.assertEqual(snapshot_stats()['prefetched'], 1)
+
+    def test_super_admin_role_grants_everything(self):
+        self.user.roles.add(Role.objects.get_or_create(name='Super Admin')[0])
+        user = self.fresh()
+        with self.assertNumQueries(1):
+            self.assertTrue(user.is_super_admin)
+            self.assertTrue(user.has_app_permission('anything'))
+        self.assertIn('test_edit', user.get_all_permissions())
+
+
+class PermissionCacheInvalidationTests(TestCase):
+    """Each RBAC change drops the cached sets of exactly the users it affects."""
+
+    def setUp(self):
+        category = PermissionCategory.objects.create(name='Test')
+        self.view = AppPermission.objects.create(name='Vedi', codename='test_view', category=category)
+        self.edit = AppPermission.objects.create(name='Modifica', codename='test_edit', category=category)
+        self.role = Role.objects.create(name='Staff')
+        self.role.permissions.set([self.view])
+        self.other_role = Role.objects.create(name='Cassa')
+        self.member = make_user('member')
+        self.member.roles.set([self.role])
+        self.bystander = make_user('bystander')
+        self.bystander.roles.set([self.other_role])
+        cache.clear()
+
+    def warm(self):
+        for user in (self.member, self.bystander):
+            User.objects.get(pk=user.pk).permission_snapshot
+            self.assertIsNotNone(permission_cache.get_user_permissions(user.pk))
+
+    def assertInvalidated(self, *users):
+        for user in (self.member, self.bystander):
+            cached = permission_cache.get_user_permissions(user.pk)
+            if user in users:
+                self.assertIsNone(cached, user.username)
+            else:
+                self.assertIsNotNone(cached, user.username)
+
+    def test_process_local_entries_expire_within_seconds(self):
+        # No REDIS_URL here: other processes would not see the bumps, so entries are short-lived.
+        self.assertFalse(settings.SHARED_CACHE)
+        self.warm()
+        later = time.time() + permission_cache.LOCAL_ENTRY_TTL + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertIsNone(permission_cache.get_user_permissions(self.member.pk))
+
+    def test_user_side_roles_changes(self):
+        for change in (
+            lambda: self.member.roles.add(self.other_role),
+            lambda: self.member.roles.remove(self.other_role),
+            lambda: self.member.roles.clear(),
+        ):
+            self.warm()
+            change()
+            self.assertInvalidated(self.member)
+        self.assertEqual(User.objects.get(pk=self.member.pk).get_all_permissions(), [])
+
+    def test_role_side_roles_changes(self):
+        self.warm()
+        self.other_role.users.add(self.member)
+        self.assertInvalidated(self.member)
+        self.assertTrue(User.objects.get(pk=self.member.pk).has_app_permission('test_view'))
+
+        for change in (lambda: self.role.users.remove(self.member), lambda: self.role.users.clear()):
+            self.member.roles.add(self.role)
+            self.warm()
+            change()
+            self.assertInvalidated(self.member)
+        self.assertFalse(User.objects.get(pk=self.member.pk).has_app_permission('test_view'))
+
+    def test_role_permission_changes_from_the_role(self):
+        for change in (
+            lambda: self.role.permissions.add(self.edit),
+            lambda: self.role.permissions.remove(self.edit),
+            lambda: self.role.permissions.clear(),
+        ):
+            self.warm()
+            change()
+            self.assertInvalidated(self.member)
+        self.assertFalse(User.objects.get(pk=self.member.pk).has_app_permission('test_view'))
+
+    def test_role_permission_changes_from_the_permission(self):
+        for change in (
+            lambda: self.edit.roles.add(self.role),
+            lambda: self.edit.roles.remove(self.role),
+            lambda: self.view.roles.clear(),
+        ):
+            self.warm()
+            change()
+            self.assertInvalidated(self.member)
+        self.assertFalse(User.objects.get(pk=self.member.pk).has_app_permission('test_view'))
+
+    def test_app_permission_rename_and_delete(self):
+        self.warm()
+        self.view.codename = 'test_read'
+        self.view.save()
+        self.assertInvalidated(self.member)
+        self.assertTrue(User.objects.get(pk=self.member.pk).has_app_permission('test_read'))
+
+        self.warm()
+        self.view.delete()
+        self.assertInvalidated(self.member)
+        self.assertFalse(User.objects.get(pk=self.member.pk).has_app_permission('test_read'))
+
+    def test_role_rename_and_delete(self):
+        self.warm()
+        self.role.name = 'Staff senior'
+        self.role.save()
+        self.assertInvalidated(self.member)
+
+        self.warm()
+        self.role.delete()
+        self.assertInvalidated(self.member)
+
+    def test_change_during_a_load_is_not_cached(self):
+        stamps = permission_cache.load_stamps(self.member.pk)
+        # Another role changes between the roles query and the cache write.
+        permission_cache.bump_roles([self.other_role.pk])
+        self.assertFalse(permission_cache.set_user_permissions(
+            self.member.pk, [self.role.pk], ['Staff'], ['test_view'], stamps,
+        ))
+        self.assertIsNone(permission_cache.get_user_permissions(self.member.pk))
+
+        stamps = permission_cache.load_stamps(self.member.pk)
+        self.assertTrue(permission_cache.set_user_permissions(
+            self.member.pk, [self.role.pk], ['Staff'], ['test_view'], stamps,
+        ))
+
+
+class InventoryTests(TestCase):
+    def test_reserve_and_release(self):
+        category = make_category(total_quantity=3)
+        inventory.reserve(category.id, 2)
+        with self.assertRaises(inventory.OutOfStock):
+            inventory.reserve(category.id, 2)
+        inventory.reserve(category.id, 1)
+        inventory.release(category.id, 1)
+        category.refresh_from_db()
+        self.assertEqual(category.allocated_quantity, 2)
+        self.assertEqual(category.remaining_quantity, 1)
+
+    def test_reserve_is_a_single_query(self):
+        category = make_category(total_quantity=3)
+        with self.assertNumQueries(1):
+            inventory.reserve(category.id)
+
+
+class BulkPurchaseTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.buyer = make_user('buyer')
+        self.client.force_authenticate(self.buyer)
+
+    def test_group_order_is_created_in_one_request(self):
+        first = make_category(total_quantity=10)
+        second = TicketCategory.objects.create(event=first.event, name='VIP', total_quantity=2)
+        response = self.client.post(reverse('ticket-purchase-bulk'), {'lines': [
+            {'category': first.id, 'quantity': 6},
+            {'category': second.id, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 8)
+        self.assertEqual(Ticket.objects.filter(owner=self.buyer).count(), 8)
+
+    def test_group_order_is_all_or_nothing(self):
+        first = make_category(total_quantity=10)
+        second = TicketCategory.objects.create(event=first.event, name='VIP', total_quantity=1)
+        response = self.client.post(reverse('ticket-purchase-bulk'), {'lines': [
+            {'category': first.id, 'quantity': 3},
+            {'category': second.id, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        first.refresh_from_db()
+        self.assertEqual(first.allocated_quantity, 0)
+        self.assertFalse(Ticket.objects.exists())
+
+
+class TicketCounterTests(TestCase):
+    def test_refund_and_reconcile(self):
+        category = make_category(total_quantity=5)
+        buyer = make_user('buyer')
+        inventory.purchase(category.id, 2)
+        first, second = [Ticket.objects.create(category=category, owner=buyer) for _ in range(2)]
+        Ticket.objects.filter(pk=first.pk).update(is_checked_in=True)
+        inventory.record_check_ins({category.id: 1})
+        first.refresh_from_db()
+
+        self.assertTrue(inventory.refund(first))
+        self.assertFalse(inventory.refund(first))
+        category.refresh_from_db()
+        self.assertEqual(
+            (category.allocated_quantity, category.sold_count, category.checked_in_count), (1, 1, 0),
+        )
+
+        TicketCategory.objects.filter(pk=category.pk).update(sold_count=9, checked_in_count=4)
+        reservations.hold(category.id, buyer, 2)
+        call_command('reconcile_ticket_counters', stdout=StringIO())
+        category.refresh_from_db()
+        self.assertEqual(
+            (category.allocated_quantity, category.sold_count, category.checked_in_count), (3, 1, 0),
+        )
+
+
+class EventSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        organizer = make_user('organizer')
+
+        def event(title, status='PUBLISHED', **fields):
+            return Event.objects.create(title=title, organizer=organizer, status=status, **fields)
+
+        self.jazz = event('Notte Jazz', location='Bologna', description='Concerto all\'aperto')
+        self.rock = event('Rock in Piazza', location='Milano', description='Jazz e rock fino a tardi')
+        self.cinema = event('Cinema sotto le stelle', location='Città di Castello')
+        self.draft = event('Jazz Club', status='DRAFT')
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('event-public-search'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.json()]
+
+    def test_title_matches_rank_first_and_drafts_are_hidden(self):
+        self.assertEqual(self.search('jazz'), [self.jazz.id, self.rock.id])
+
+    def test_every_word_matches_as_a_prefix(self):
+        self.assertEqual(self.search('conc'), [self.jazz.id])
+        self.assertEqual(self.search('roc mil'), [self.rock.id])
+        self.assertEqual(self.search('roc bologna'), [])
+        self.assertEqual(self.search('citta'), [self.cinema.id])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.jazz.title = 'Notte Blues'
+        self.jazz.save()
+        self.assertEqual(self.search('jazz'), [self.rock.id])
+        self.assertEqual(self.search('blu'), [self.jazz.id])
+
+        self.draft.status = 'PUBLISHED'
+        self.draft.save(update_fields=['status'])
+        self.assertEqual(self.search('club'), [self.draft.id])
+
+        self.rock.delete()
+        self.assertEqual(self.search('jazz'), [self.draft.id])
+
+    def test_missing_query_is_rejected(self):
+        response = self.client.get(reverse('event-public-search'), {'q': '  '})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rebuild_restores_bulk_updates(self):
+        Event.objects.filter(pk=self.cinema.pk).update(title='Teatro sotto le stelle')
+        call_command('rebuild_event_search', stdout=StringIO())
+        self.assertEqual(self.search('teatro'), [self.cinema.id])
+
+
+class NearbyEventsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        organizer = make_user('organizer')
+
+        def event(title, lat, lng, status='PUBLISHED'):
+            return Event.objects.create(title=title, organizer=organizer, status=status, latitude=lat, longitude=lng)
+
+        self.duomo = event('Duomo', '45.464211', '9.191383')
+        self.monza = event('Monza', '45.584560', '9.274449')        # ~15 km
+        self.bergamo = event('Bergamo', '45.698264', '9.677270')    # ~45 km
+        self.roma = event('Roma', '41.902782', '12.496366')
+        event('Bozza', '45.465000', '9.190000', status='DRAFT')
+        Event.objects.create(title='Senza coordinate', organizer=organizer, status='PUBLISHED')
+
+    def nearby(self, **params):
+        response = self.client.get(reverse('event-public-nearby'), params)
+        self.assertEqual(response.status_code, 200)
+        return [(item['id'], item['distance_km']) for item in response.json()]
+
+    def test_events_within_radius_sorted_by_distance(self):
+        results = self.nearby(lat=45.4642, lng=9.19, radius=25)
+        self.assertEqual([pk for pk, _ in results], [self.duomo.id, self.monza.id])
+        self.assertLess(results[0][1], 0.2)
+        self.assertAlmostEqual(results[1][1], 15.0, delta=0.5)
+
+        results = self.nearby(lat=45.4642, lng=9.19, radius=60)
+        self.assertEqual([pk for pk, _ in results], [self.duomo.id, self.monza.id, self.bergamo.id])
+
+    def test_bounding_box_is_the_prefilter(self):
+        # The corner of the box is farther than the radius: only haversine rejects it.
+        corner = Event.objects.create(
+            title='Angolo', organizer=self.duomo.organizer, status='PUBLISHED',
+            latitude='45.680000', longitude='9.500000',
+        )
+        box = Event.objects.filter(nearby.bounding_box(45.4642, 9.19, 25))
+        self.assertIn(corner, box)
+        self.assertNotIn(self.roma, box)
+        self.assertNotIn(corner.id, [pk for pk, _ in self.nearby(lat=45.4642, lng=9.19, radius=25)])
+
+    def test_box_wraps_across_the_antimeridian(self):
+        fiji = Event.objects.create(
+            title='Fiji', organizer=self.duomo.organizer, status='PUBLISHED',
+            latitude='-17.800000', longitude='-179.900000',
+        )
+        self.assertEqual([pk for pk, _ in self.nearby(lat=-17.8, lng=179.9, radius=50)], [fiji.id])
+
+    def test_invalid_parameters_are_rejected(self):
+        url = reverse('event-public-nearby')
+        for params in ({'lat': 45}, {'lat': 'x', 'lng': 9}, {'lat': 91, 'lng': 9}, {'lat': 45, 'lng': 9, 'radius': 10000}):
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+class EventFacetsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.organizer = make_user('organizer')
+        self.url = reverse('event-public')
+
+    def publish(self, title, date, country, prices, stock=5):
+        with self.captureOnCommitCallbacks(execute=True):
+            event = Event.objects.create(
+                title=title, organizer=self.organizer, status='PUBLISHED', date=date, country_code=country,
+            )
+            for price in prices:
+                TicketCategory.objects.create(event=event, name=f'{price}', price=price, total_quantity=stock)
+        return event
+
+    def listed(self, **params):
+        response = self.client.get(self.url, {'facets': 1, **params})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        return [item['id'] for item in body['results']], body['facets']
+
+    def test_filters_and_counts(self):
+        today = timezone.now().date()
+        milan = self.publish('Milano', today + timedelta(days=3), 'IT', ['0.00', '15.00'])
+        paris = self.publish('Parigi', today + timedelta(days=40), 'FR', ['35.00'])
+        rome = self.publish('Roma', today + timedelta(days=60), 'IT', ['80.00'])
+
+        ids, facets = self.listed()
+        self.assertEqual(ids, [milan.id, paris.id, rome.id])
+        self.assertEqual(facets['country'], {'FR': 1, 'IT': 2})
+        self.assertEqual(facets['price'], {'20_50': 1, 'free': 1, 'over_50': 1})
+        self.assertEqual(facets['availability'], {'available': 3})
+        self.assertEqual(sum(facets['month'].values()), 3)
+
+        self.assertEqual(self.listed(country='it')[0], [milan.id, rome.id])
+        self.assertEqual(self.listed(price='20_50')[0], [paris.id])
+        self.assertEqual(self.listed(date_from=str(today + timedelta(days=30)), country='IT')[0], [rome.id])
+        self.assertEqual(self.listed(date_to=str(today + timedelta(days=50)))[0], [milan.id, paris.id])
+
+    def test_counts_follow_changes_incrementally(self):
+        event = self.publish('Milano', None, 'IT', ['30.00'], stock=1)
+        category = event.ticket_categories.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.purchase(category.id)
+        self.assertEqual(event_facets.counts()['availability'], {'sold_out': 1})
+        self.assertEqual(self.listed(available=1)[0], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TicketCategory.objects.create(event=event, name='Ridotto', price='10.00', total_quantity=5)
+        counts = event_facets.counts()
+        self.assertEqual((counts['availability'], counts['price']), ({'available': 1}, {'under_20': 1}))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            event.status = 'DRAFT'
+            event.save(update_fields=['status'])
+        self.assertEqual(event_facets.counts(), {'month': {}, 'country': {}, 'price': {}, 'availability': {}})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            event.status = 'PUBLISHED'
+            event.save(update_fields=['status'])
+            event.delete()
+        self.assertFalse(EventFacets.objects.exists())
+        self.assertEqual(event_facets.counts()['country'], {})
+
+    def test_only_sell_outs_and_restocks_refresh_availability(self):
+        event = self.publish('Milano', None, 'IT', ['30.00'], stock=2)
+        category = event.ticket_categories.get()
+        buyer = make_user('buyer')
+        steps = [
+            (lambda: inventory.purchase(category.id), 0, 'available'),
+            (lambda: inventory.purchase(category.id), 1, 'sold_out'),
+            (lambda: inventory.release(category.id), 1, 'available'),
+            (lambda: inventory.release(category.id), 0, 'available'),
+            (lambda: reservations.hold(category.id, buyer, 2), 1, 'sold_out'),
+        ]
+        for step, refreshes, availability in steps:
+            with mock.patch.object(event_facets, 'refresh', wraps=event_facets.refresh) as refresh, \
+                    self.captureOnCommitCallbacks(execute=True):
+                step()
+            self.assertEqual((refresh.call_count, event_facets.counts()['availability']), (refreshes, {availability: 1}))
+
+        TicketReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=5))
+        with self.captureOnCommitCallbacks(execute=True):
+            reservations.release_expired()
+        self.assertEqual(event_facets.counts()['availability'], {'available': 1})
+
+    def test_scheduler_catches_missed_availability_flips(self):
+        event = self.publish('Milano', None, 'IT', ['30.00'], stock=1)
+        TicketCategory.objects.filter(event=event).update(allocated_quantity=1)
+        self.assertEqual(event_facets.refresh_availability(), 1)
+        self.assertEqual(event_facets.counts()['availability'], {'sold_out': 1})
+        self.assertEqual(event_facets.refresh_availability(), 0)
+
+    def test_rebuild_matches_incremental_counts(self):
+        self.publish('Milano', timezone.now().date(), 'IT', ['0.00'])
+        self.publish('Parigi', None, 'FR', [])
+        incremental = event_facets.counts()
+        self.assertEqual(event_facets.rebuild(), 2)
+        self.assertEqual(event_facets.counts(), incremental)
+
+    def test_invalid_filters_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'date_from': '31/12/2026'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'price': 'cheap'}).status_code, 400)
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(feed, '_local', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        organizer = make_user('organizer')
+        OrganizerProfile.objects.filter(user=organizer).update(event_types=['Concerti'])
+        self.user = make_user('guest')
+        self.user.music_preferences = ['Jazz', 'Rock']
+        self.user.location = 'Bologna, BO, Italia'
+        self.user.save()
+
+        day = timezone.now().date() + timedelta(days=10)
+
+        def event(title, location, date=day, status='PUBLISHED'):
+            return Event.objects.create(title=title, location=location, date=date, status=status, organizer=organizer)
+
+        self.jazz = event('Notte Jazz', 'Piazza Maggiore, Bologna')
+        self.rock = event('Rock night', 'Milano')
+        self.market = event('Mercatino', 'Via Zamboni, Bologna')
+        self.far = event('Mostra', 'Torino')
+        event('Jazz passato', 'Bologna', date=timezone.now().date() - timedelta(days=1))
+        event('Jazz in bozza', 'Bologna', status='DRAFT')
+        feed.rebuild()
+
+    def test_ranks_by_preferences_location_and_date(self):
+        self.assertEqual(feed.for_user(self.user), [self.jazz.id, self.rock.id, self.market.id, self.far.id])
+
+    def test_organizer_event_types_tag_their_events(self):
+        self.user.music_preferences = ['concerti']
+        self.user.location = ''
+        self.assertEqual(set(feed.for_user(self.user)), {self.jazz.id, self.rock.id, self.market.id, self.far.id})
+        self.assertEqual(feed.current_matrix().tags[:, feed.current_matrix().vocabulary.index('concerti')].tolist(), [1, 1, 1, 1])
+
+    def test_repeat_feeds_are_a_cache_lookup(self):
+        feed.for_user(self.user)
+        with self.assertNumQueries(0):
+            feed.for_user(self.user)
+
+        # Changing preferences is not served from the old entry.
+        self.user.music_preferences = ['Rock']
+        self.assertEqual(feed.for_user(self.user)[0], self.rock.id)
+
+    def test_rebuild_featurises_only_changed_events(self):
+        # Sales, scans and unrelated edits leave the matrix alone, without a query.
+        catalogue.bump()
+        Event.objects.get(pk=self.far.pk).save(update_fields=['country_code'])
+        with self.assertNumQueries(0):
+            self.assertFalse(feed.rebuild())
+
+        self.market.title = 'Mercatino rock'
+        self.market.save()
+        with mock.patch.object(feed, '_tag_row', wraps=feed._tag_row) as featurise:
+            self.assertTrue(feed.rebuild())
+        self.assertEqual(featurise.call_count, 1)
+        self.assertEqual(feed.for_user(self.user, limit=3), [self.jazz.id, self.market.id, self.rock.id])
+
+    def test_vocabulary_is_rescanned_only_after_a_preference_change(self):
+        with self.assertNumQueries(0):
+            feed.vocabulary()
+        self.user.music_preferences = ['Mercatino']
+        self.user.save()
+        self.assertIn('mercatino', feed.vocabulary())
+        self.assertTrue(feed.rebuild())
+        self.assertEqual(feed.for_user(self.user)[0], self.market.id)
+
+    def test_cold_cache_serves_popular_events_without_building(self):
+        TicketCategory.objects.create(event=self.far, name='Ingresso', total_quantity=10, sold_count=4)
+        cache.clear()
+        with mock.patch.object(feed, 'build') as build:
+            ids = feed.for_user(self.user)
+        build.assert_not_called()
+        self.assertEqual(ids[0], self.far.id)
+        self.assertEqual(set(ids), {self.jazz.id, self.rock.id, self.market.id, self.far.id})
+
+    def test_endpoint_serialises_the_feed(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('event-feed'), {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data], [self.jazz.id, self.rock.id])
+
+
+class ReservationTests(TestCase):
+    def test_confirm_turns_hold_into_tickets(self):
+        category = make_category(total_quantity=5)
+        buyer = make_user('buyer')
+        reservation = reservations.hold(category.id, buyer, 3)
+        tickets = reservations.confirm(reservation)
+        self.assertEqual(len(tickets), 3)
+        category.refresh_from_db()
+        self.assertEqual((category.allocated_quantity, category.sold_count), (3, 3))
+        with self.assertRaises(reservations.ReservationExpired):
+            reservations.confirm(reservation)
+
+    def test_sweeper_releases_expired_holds_in_bulk(self):
+        category = make_category(total_quantity=10)
+        other = make_category(total_quantity=10)
+        buyer = make_user('buyer')
+        for target in (category, category, other):
+            reservations.hold(target.id, buyer, 2)
+        live = reservations.hold(category.id, buyer, 1)
+        TicketReservation.objects.exclude(pk=live.pk).update(expires_at=timezone.now() - timedelta(minutes=5))
+
+        # claim + UPDATE + DELETE, wrapped in a savepoint
+        with self.assertNumQueries(5):
+            self.assertEqual(reservations.release_expired(), 3)
+
+        category.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(category.allocated_quantity, 1)
+        self.assertEqual(other.allocated_quantity, 0)
+        self.assertEqual(list(TicketReservation.objects.all()), [live])
+
+        # A second sweeper finds nothing left to release.
+        self.assertEqual(reservations.release_expired(), 0)
+        category.refresh_from_db()
+        self.assertEqual(category.allocated_quantity, 1)
+
+    def test_sweeper_works_through_a_backlog_in_batches(self):
+        category = make_category(total_quantity=10)
+        buyer = make_user('buyer')
+        for _ in range(5):
+            reservations.hold(category.id, buyer, 1)
+        TicketReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=5))
+
+        with mock.patch.object(reservations, 'SWEEP_BATCH', 2), \
+                mock.patch.object(reservations, '_release_batch', wraps=reservations._release_batch) as batches:
+            self.assertEqual(reservations.release_expired(), 5)
+        self.assertEqual(batches.call_count, 3)
+        category.refresh_from_db()
+        self.assertEqual(category.allocated_quantity, 0)
+
+
+class AdmissionQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = make_category(total_quantity=100)
+        self.category.admission_rate = 2
+        self.category.save()
+        # Freeze the queue clock so password hashing in make_user doesn't admit anyone.
+        patcher = mock.patch('api.services.admission.time.time', return_value=time.time())
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def join(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client, client.post(reverse('ticket-queue-join', args=[self.category.id])).data
+
+    def test_buyers_are_admitted_at_the_configured_rate(self):
+        buyers = [make_user(f'buyer{i}') for i in range(5)]
+        self.assertEqual([self.join(buyer)[1]['position'] for buyer in buyers], [0, 1, 2, 3, 4])
+        self.clock.return_value += 1
+        self.assertEqual([self.join(buyer)[1]['position'] for buyer in buyers[:2]], [3, 4])
+
+    def test_polling_does_not_touch_the_database(self):
+        first, second = make_user('first'), make_user('second')
+        self.join(first)
+        _, queued = self.join(second)
+        with self.assertNumQueries(0):
+            response = APIClient().get(reverse('ticket-queue-status'), {'token': queued['token']})
+        self.assertFalse(response.data['admitted'])
+        self.assertEqual(response.data['position'], 1)
+
+        self.clock.return_value += 1
+        response = APIClient().get(reverse('ticket-queue-status'), {'token': queued['token']})
+        self.assertTrue(response.data['admitted'])
+
+    def test_purchase_requires_an_admitted_token(self):
+        first, second = make_user('first'), make_user('second')
+        client, joined = self.join(first)
+        other, queued = self.join(second)
+        url = reverse('ticket-purchase')
+
+        self.assertEqual(client.post(url, {'category': self.category.id}).status_code, 403)
+        response = other.post(url, {'category': self.category.id, 'queue_token': queued['token']})
+        self.assertEqual(response.status_code, 403)
+        response = other.post(url, {'category': self.category.id, 'queue_token': joined['token']})
+        self.assertEqual(response.status_code, 403)
+        response = client.post(url, {'category': self.category.id, 'queue_token': joined['token']})
+        self.assertEqual(response.status_code, 201)
+
+    def test_an_admission_buys_once(self):
+        client, joined = self.join(make_user('first'))
+        url = reverse('ticket-purchase')
+        response = client.post(url, {'category': self.category.id, 'queue_token': joined['token']})
+        self.assertEqual(response.status_code, 201)
+        response = client.post(url, {'category': self.category.id, 'queue_token': joined['token']})
+        self.assertEqual(response.status_code, 403)
+
+    def test_failed_purchase_gives_the_admission_back(self):
+        client, joined = self.join(make_user('first'))
+        url = reverse('ticket-purchase')
+        TicketCategory.objects.filter(pk=self.category.pk).update(allocated_quantity=100)
+        response = client.post(url, {'category': self.category.id, 'queue_token': joined['token']})
+        self.assertEqual(response.status_code, 400)
+
+        TicketCategory.objects.filter(pk=self.category.pk).update(allocated_quantity=0)
+        response = client.post(url, {'category': self.category.id, 'queue_token': joined['token']})
+        self.assertEqual(response.status_code, 201)
+
+    def test_one_joiner_starts_the_next_burst(self):
+        now = self.clock.return_value
+        self.assertEqual(admission._burst(self.category, 1, now), (now, 1))
+        drained = cache.get(admission._burst_key(self.category.id))
+
+        later = now + 60
+        self.assertEqual(admission._burst(self.category, 5, later), (later, 5))
+        # A concurrent joiner that read the drained burst joins the new one.
+        cache.set(admission._burst_key(self.category.id), drained, None)
+        self.assertEqual(admission._burst(self.category, 6, later + 0.1), (later, 5))
+
+
+class ListQueryCountTests(TestCase):
+    """List endpoints run a fixed number of queries whatever the page size."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@example.com')
+        self.buyer = make_user('buyer')
+
+    def add_events(self, count):
+        for _ in range(count):
+            category = make_category(total_quantity=10, status='PUBLISHED')
+            TicketCategory.objects.create(event=category.event, name='VIP', total_quantity=5)
+            Ticket.objects.create(category=category, owner=self.buyer)
+
+    def assertConstantQueries(self, url, user, num):
+        self.client.force_authenticate(user)
+        self.client.get(url)   # warm the permission caches
+        for events in (2, 5):
+            self.add_events(events)
+            with self.assertNumQueries(num):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_public_event_list(self):
+        # events + organizers, categories
+        self.assertConstantQueries(reverse('event-public'), None, 2)
+
+    def test_admin_event_list(self):
+        self.assertConstantQueries(reverse('event-list'), self.admin, 2)
+
+    def test_user_tickets(self):
+        # tickets + categories + events + owners
+        self.assertConstantQueries(reverse('user-tickets'), self.buyer, 1)
+
+    def test_event_tickets(self):
+        self.add_events(1)
+        event = Event.objects.latest('id')
+        for _ in range(3):
+            Ticket.objects.create(category=event.ticket_categories.first(), owner=self.buyer)
+        self.client.force_authenticate(self.admin)
+        # event lookup, tickets + categories + events + owners
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('event-tickets', args=[event.id]))
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_user_list(self):
+        # users + affiliated_to + profile, roles, permissions
+        self.assertConstantQueries(reverse('user-list'), self.admin, 3)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def collect(self, url, **params):
+        ids, pages = [], 0
+        data = self.client.get(url, params).json()
+        while True:
+            pages += 1
+            ids.extend(row['id'] for row in data['results'])
+            if not data['next']:
+                return ids, pages
+            data = self.client.get(data['next']).json()
+
+    def test_ticket_pages_follow_purchase_order(self):
+        category = make_category(total_quantity=20)
+        buyer = make_user('buyer')
+        tickets = [Ticket.objects.create(category=category, owner=buyer) for _ in range(7)]
+        # Ties on purchase_date are broken by id.
+        Ticket.objects.filter(pk__in=[t.pk for t in tickets[2:5]]).update(purchase_date=tickets[2].purchase_date)
+        self.client.force_authenticate(buyer)
+
+        ids, pages = self.collect(reverse('user-tickets'), page_size=3)
+        expected = list(Ticket.objects.order_by('-purchase_date', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_event_pages_put_undated_events_last(self):
+        for day in (3, 1, None, 2, None):
+            category = make_category(status='PUBLISHED', date=None if day is None else f'2030-01-0{day}')
+
+        ids, _ = self.collect(reverse('event-public'), page_size=2)
+        dates = [Event.objects.get(pk=pk).date for pk in ids]
+        self.assertEqual([d.day if d else None for d in dates], [1, 2, 3, None, None])
+
+    def test_event_ticket_pages_seek_on_the_event_index(self):
+        category = make_category(total_quantity=20)
+        other = TicketCategory.objects.create(event=category.event, name='VIP', total_quantity=5)
+        buyer = make_user('buyer')
+        for target in (category, other, category, other, category):
+            Ticket.objects.create(category=target, owner=buyer)
+        self.client.force_authenticate(category.event.organizer)
+
+        first = self.client.get(reverse('event-tickets', args=[category.event_id]), {'page_size': 2}).json()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first['next'])
+        sql = next(q['sql'] for q in queries if 'ORDER BY "api_ticket"."purchase_date"' in q['sql'])
+        # No join to the categories, the leading bound, and the index's own order.
+        self.assertIn('"api_ticket"."event_id" =', sql)
+        self.assertNotIn('JOIN "api_ticketcategory"', sql.split('ORDER BY')[0].split('WHERE')[1])
+        self.assertIn('"api_ticket"."purchase_date" <=', sql)
+        self.assertNotIn('NULLS LAST', sql)
+
+        ids, _ = self.collect(reverse('event-tickets', args=[category.event_id]), page_size=2)
+        self.assertEqual(ids, list(Ticket.objects.order_by('-purchase_date', '-id').values_list('id', flat=True)))
+
+    def test_lists_are_paged_by_default(self):
+        for _ in range(3):
+            make_category(status='PUBLISHED')
+        with mock.patch.object(EventDatePagination, 'page_size', 2):
+            ids, pages = self.collect(reverse('event-public'))
+        self.assertEqual((len(ids), pages), (3, 2))
+
+
+class CatalogueCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = make_category(total_quantity=5, status='PUBLISHED')
+        self.url = reverse('event-public')
+
+    def test_repeat_hits_skip_the_database(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_conditional_request_gets_304_without_queries(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_invalidate_the_catalogue(self):
+        etag = self.client.get(self.url)['ETag']
+        inventory.purchase(self.category.id)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['ticket_categories'][0]['remaining_quantity'], 4)
+
+        etag = response['ETag']
+        Event.objects.filter(pk=self.category.event_id).update(date='2000-01-01')
+        conclude_past_events()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_counter_changes_bump_at_most_once_per_lag(self):
+        etag = self.client.get(self.url)['ETag']
+        inventory.purchase(self.category.id)
+        response = self.client.get(self.url)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+
+        # Within COUNTER_LAG more sales and scans keep the cached payload...
+        inventory.purchase(self.category.id)
+        inventory.record_check_ins({self.category.id: 1})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['ticket_categories'][0]['remaining_quantity'], 4)
+
+        # ...and the next read once it is over shows them.
+        cache.delete('catalogue:counters:throttle')
+        response = self.client.get(self.url)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['ticket_categories'][0]['remaining_quantity'], 3)
+
+    def test_unknown_parameters_share_the_cache_entry(self):
+        self.client.get(self.url, {'page_size': 10, 'utm_source': 'a'})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'junk': 'b', 'page_size': 10})
+        self.assertEqual(response.status_code, 200)
+
+        event = self.category.event
+        event.title = 'Rock night'
+        event.save()
+        url = reverse('event-public-search')
+        self.assertEqual(len(self.client.get(url, {'q': 'Rock '}).json()), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.client.get(url, {'q': 'rock', 'x': '1'}).json()), 1)
+
+    def test_detail_is_cached_and_404_is_not(self):
+        url = reverse('event-public-detail', args=[self.category.event_id])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        missing = reverse('event-public-detail', args=[self.category.event_id + 1])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+class CheckInTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = make_category(total_quantity=5)
+        self.organizer = self.category.event.organizer
+        self.ticket = Ticket.objects.create(category=self.category, owner=make_user('guest'))
+        self.url = reverse('ticket-validate')
+
+    def test_first_scan_validates_and_counts(self):
+        self.organizer.permission_snapshot   # loaded once per request in practice
+        with self.assertNumQueries(4):       # savepoint, UPDATE ... RETURNING, counter, release
+            result = checkin.check_in(self.organizer, ticket_code=str(self.ticket.ticket_code))
+        self.assertEqual(result.outcome, checkin.CHECKED_IN)
+        self.assertEqual(result.owner_name, 'guest')
+        self.assertEqual(result.category_name, self.category.name)
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.checked_in_count, 1)
+
+    def test_second_scan_is_rejected(self):
+        self.client.force_authenticate(self.organizer)
+        payload = {'ticket_code': str(self.ticket.ticket_code)}
+        self.assertEqual(self.client.post(self.url, payload).status_code, 200)
+        response = self.client.post(self.url, payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['owner_name'], 'guest')
+        self.assertIsNotNone(response.data['checked_in_at'])
+
+    def test_other_users_and_unknown_codes(self):
+        self.client.force_authenticate(make_user('stranger'))
+        response = self.client.post(self.url, {'ticket_id': self.ticket.id})
+        self.assertEqual(response.status_code, 403)
+        for payload in ({'ticket_code': 'not-a-uuid'}, {'ticket_id': self.ticket.id + 1}):
+            self.assertEqual(self.client.post(self.url, payload).status_code, 404)
+        self.ticket.refresh_from_db()
+        self.assertFalse(self.ticket.is_checked_in)
+
+
+class BatchCheckInTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = make_category(total_quantity=10)
+        self.organizer = self.category.event.organizer
+        guest = make_user('guest')
+        self.fresh, self.used = [Ticket.objects.create(category=self.category, owner=guest) for _ in range(2)]
+        checkin.check_in(self.organizer, ticket_id=self.used.id)
+        self.used.refresh_from_db()
+        other = make_category(total_quantity=1)
+        self.foreign = Ticket.objects.create(category=other, owner=guest)
+
+    def test_per_scan_results(self):
+        early = timezone.now() - timedelta(minutes=5)
+        scans = [
+            {'ticket_code': str(self.fresh.ticket_code), 'scanned_at': (early + timedelta(minutes=1)).isoformat()},
+            {'ticket_code': str(self.fresh.ticket_code), 'scanned_at': early.isoformat()},
+            {'ticket_code': str(self.used.ticket_code)},
+            {'ticket_code': str(self.foreign.ticket_code)},
+            {'ticket_code': 'garbage'},
+        ]
+        self.client.force_authenticate(self.organizer)
+        response = self.client.post(reverse('ticket-validate-batch'), {'scans': scans}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], [
+            checkin.ALREADY_CHECKED_IN, checkin.CHECKED_IN, checkin.ALREADY_CHECKED_IN,
+            checkin.FORBIDDEN, checkin.NOT_FOUND,
+        ])
+        # The earliest scan wins and its gate time is kept.
+        self.assertEqual(results[0]['checked_in_at'], early)
+        self.assertEqual(results[2]['checked_in_at'], self.used.checked_in_at)
+        self.assertEqual(response.data['checked_in'], 1)
+
+        self.fresh.refresh_from_db()
+        self.assertEqual(self.fresh.checked_in_at, early)
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.checked_in_count, 2)
+
+
+class ManifestTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = make_category(total_quantity=10)
+        self.guest = make_user('guest')
+        self.client.force_authenticate(self.category.event.organizer)
+        self.url = reverse('event-ticket-manifest', args=[self.category.event_id])
+
+    def download(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content)
+        magic, version, since = manifest.HEADER.unpack_from(body)
+        self.assertEqual(magic, manifest.MAGIC)
+        codes = body[manifest.HEADER.size:]
+        return version, since, [codes[i:i + 16] for i in range(0, len(codes), 16)]
+
+    def test_full_manifest_then_delta(self):
+        first = [Ticket.objects.create(category=self.category, owner=self.guest) for _ in range(5)]
+        make_category(total_quantity=1).tickets.create(owner=self.guest)   # another event
+
+        version, since, codes = self.download()
+        self.assertEqual((version, since), (5, 0))
+        self.assertEqual(codes, sorted(t.ticket_code.bytes for t in first))
+
+        later = [Ticket.objects.create(category=self.category, owner=self.guest) for _ in range(2)]
+        version, since, codes = self.download(since=version)
+        self.assertEqual((version, since), (7, 5))
+        self.assertEqual(codes, sorted(t.ticket_code.bytes for t in later))
+
+    def test_tickets_are_numbered_per_event(self):
+        other = make_category(total_quantity=5)
+        Ticket.objects.create(category=self.category, owner=self.guest)
+        Ticket.objects.bulk_create([
+            Ticket(category=target, owner=self.guest) for target in (self.category, other, self.category)
+        ])
+        numbers = Ticket.objects.order_by('event_id', 'sequence').values_list('event_id', 'sequence')
+        self.assertEqual(list(numbers), [
+            (self.category.event_id, 1), (self.category.event_id, 2), (self.category.event_id, 3),
+            (other.event_id, 1),
+        ])
+
+    def test_delta_follows_the_sequence_not_the_id(self):
+        Ticket.objects.create(id=1000, category=self.category, owner=self.guest)
+        version, _, _ = self.download()
+        # A purchase whose id was taken before the download but committed after it.
+        late = Ticket.objects.create(id=500, category=self.category, owner=self.guest)
+        _, _, codes = self.download(since=version)
+        self.assertEqual(codes, [late.ticket_code.bytes])
+
+    def test_only_ticket_managers_may_download(self):
+        self.client.force_authenticate(make_user('stranger'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    async def test_asgi_streams_without_buffering(self):
+        tickets = await sync_to_async(lambda: [
+            Ticket.objects.create(category=self.category, owner=self.guest) for _ in range(3)
+        ])()
+        token = str(RefreshToken.for_user(self.category.event.organizer).access_token)
+        response = await self.async_client.get(self.url, headers={'Authorization': f'Bearer {token}'})
+        # An async body: the ASGI handler sends it chunk by chunk instead of list()-ing it first.
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(manifest.HEADER.unpack_from(body)[1], 3)
+        self.assertEqual(len(body) - manifest.HEADER.size, 16 * len(tickets))
+
+
+class LiveCheckInStreamTests(TestCase):
+    def setUp(self):
+        self.category = make_category(total_quantity=10)
+        self.organizer = self.category.event.organizer
+        self.ticket = Ticket.objects.create(category=self.category, owner=make_user('guest'))
+        self.url = reverse('event-checkin-stream', args=[self.category.event_id])
+
+    def scan(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            checkin.check_in(self.organizer, ticket_id=self.ticket.id)
+
+    def stream_ticket(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(reverse('event-checkin-stream-ticket', args=[self.category.event_id]))
+        return response.status_code, response.data.get('ticket')
+
+    async def test_snapshot_then_scans(self):
+        _, ticket = await sync_to_async(self.stream_ticket)(self.organizer)
+        response = await self.async_client.get(self.url, {'ticket': ticket})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+
+        first = await anext(stream)
+        self.assertTrue(first.startswith(b'event: snapshot'))
+        snapshot = json.loads(first.split(b'data: ')[1])
+        self.assertEqual((snapshot['checked_in'], snapshot['categories'][0]['id']), (0, self.category.id))
+
+        await sync_to_async(self.scan)()
+        second = await anext(stream)
+        self.assertTrue(second.startswith(b'event: scan'))
+        message = json.loads(second.split(b'data: ')[1])
+        self.assertEqual(message['checked_in'], 1)
+        self.assertEqual(message['scan']['owner_name'], 'guest')
+
+        # A client disconnect cancels the pending read: the subscription goes away.
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(live_checkins.hub._boards, {})
+
+    async def test_stream_ticket_is_single_use(self):
+        _, ticket = await sync_to_async(self.stream_ticket)(self.organizer)
+        with mock.patch.object(live_checkins, 'STREAM_LIFETIME', 0.01):
+            response = await self.async_client.get(self.url, {'ticket': ticket})
+            events = [chunk.split(b'\n')[0] async for chunk in response.streaming_content]
+        self.assertEqual(events, [b'event: snapshot', b'event: reconnect'])
+        self.assertEqual(live_checkins.hub._boards, {})
+
+        response = await self.async_client.get(self.url, {'ticket': ticket})
+        self.assertEqual(response.status_code, 401)
+
+    def test_wsgi_sends_the_snapshot_and_ends(self):
+        _, ticket = self.stream_ticket(self.organizer)
+        response = self.client.get(self.url, {'ticket': ticket})
+        events = [chunk.split(b'\n')[0] for chunk in response.streaming_content]
+        self.assertEqual(events, [b'event: snapshot', b'event: reconnect'])
+
+    async def test_requires_a_ticket_manager(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        token = str(RefreshToken.for_user(self.organizer).access_token)
+        response = await self.async_client.get(self.url, {'token': token})
+        self.assertEqual(response.status_code, 401)   # no JWT in the query string
+
+        stranger = await sync_to_async(make_user)('stranger')
+        status, _ = await sync_to_async(self.stream_ticket)(stranger)
+        self.assertEqual(status, 403)
+        token = str(RefreshToken.for_user(stranger).access_token)
+        response = await self.async_client.get(self.url, headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 403)
+
+        other = await sync_to_async(make_category)()
+        _, ticket = await sync_to_async(self.stream_ticket)(self.organizer)
+        response = await self.async_client.get(
+            reverse('event-checkin-stream', args=[other.event_id]), {'ticket': ticket},
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class TicketPdfCacheTests(TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        patcher = mock.patch.object(ticket_pdf_cache, 'CACHE_DIR', cache_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache_dir = cache_dir.name
+
+        self.category = make_category(total_quantity=5)
+        self.owner = make_user('guest')
+        self.ticket = Ticket.objects.create(category=self.category, owner=self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.url = reverse('ticket-download-pdf', args=[self.ticket.id])
+
+    def download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+        return content
+
+    def generate(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Retry-After'], '2')
+        job_queue.run_pending()
+
+    def cached_files(self):
+        return [name for _, _, names in os.walk(self.cache_dir) for name in names]
+
+    def test_repeat_downloads_are_served_from_disk(self):
+        render = mock.patch.object(
+            ticket_pdf_cache, 'generate_ticket_pdf', wraps=ticket_pdf_cache.generate_ticket_pdf,
+        )
+        with render as generate:
+            self.generate()
+            first = self.download()
+            self.assertEqual(self.download(), first)
+        self.assertEqual(generate.call_count, 1)
+
+    async def test_asgi_reads_the_file_chunk_by_chunk(self):
+        await sync_to_async(self.generate)()
+        token = str(RefreshToken.for_user(self.owner).access_token)
+        response = await self.async_client.get(self.url, headers={'Authorization': f'Bearer {token}'})
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertEqual(len(content), int(response['Content-Length']))
+        response.close()
+
+    def test_edits_render_a_new_file_and_drop_the_old_one(self):
+        self.generate()
+        self.download()
+        old = self.cached_files()
+        TicketCategory.objects.filter(pk=self.category.pk).update(name='Platea')
+        self.generate()
+        self.download()
+        new = self.cached_files()
+        self.assertEqual(len(new), 1)
+        self.assertNotEqual(old, new)
+
+    def test_image_replaced_under_the_same_name_changes_the_address(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        with self.settings(MEDIA_ROOT=media.name):
+            logo = os.path.join(media.name, 'logo.png')
+            Image.new('RGB', (40, 40), 'navy').save(logo)
+            TicketCategory.objects.filter(pk=self.category.pk).update(logo='logo.png')
+            ticket = Ticket.objects.select_related('category__event', 'owner').get(pk=self.ticket.pk)
+            before = ticket_pdf_cache.fingerprint(ticket)
+            Image.new('RGB', (60, 60), 'red').save(logo)
+            os.utime(logo, ns=(time.time_ns() + 10 ** 9,) * 2)
+            self.assertNotEqual(ticket_pdf_cache.fingerprint(ticket), before)
+
+    def test_prune_removes_least_recently_served(self):
+        tickets = [Ticket.objects.create(category=self.category, owner=self.owner) for _ in range(3)]
+        paths = []
+        for age, ticket in enumerate(reversed(tickets)):
+            ticket = Ticket.objects.select_related('category__event', 'owner').get(pk=ticket.pk)
+            with ticket_pdf_cache.open_pdf(ticket):
+                pass
+            path = ticket_pdf_cache.path_for(ticket)
+            os.utime(path, (time.time() - 100 * (age + 1),) * 2)
+            paths.append(path)
+        size = os.path.getsize(paths[0])
+
+        removed = ticket_pdf_cache.prune(max_bytes=size * 2)
+        # Oldest first, down to 90% of the budget.
+        self.assertEqual(removed, 2)
+        self.assertEqual([os.path.exists(p) for p in paths], [True, False, False])
+
+
+class SchedulerStartTests(TestCase):
+    def test_only_server_processes_run_the_scheduler(self):
+        from .apps import serves_requests
+        cases = [
+            (['gunicorn', 'backend.asgi:application'], {}, True),
+            (['manage.py', 'test', 'api'], {}, False),
+            (['manage.py', 'run_jobs'], {}, False),
+            (['manage.py', 'runserver'], {}, False),
+            (['manage.py', 'runserver'], {'RUN_MAIN': 'true'}, True),
+            (['manage.py', 'runserver', '--noreload'], {}, True),
+        ]
+        for argv, env, expected in cases:
+            with self.subTest(argv=argv, env=env), mock.patch('sys.argv', argv), \
+                    mock.patch.dict(os.environ, env):
+                if not env:
+                    os.environ.pop('RUN_MAIN', None)
+                self.assertIs(serves_requests(), expected)
+
+    def test_several_workers_need_a_shared_cache(self):
+        from .apps import check_shared_cache
+        argv = ['gunicorn', 'backend.asgi:application', '-w', '4']
+        with mock.patch('sys.argv', argv), self.assertRaisesMessage(ImproperlyConfigured, 'REDIS_URL'):
+            check_shared_cache()
+        with mock.patch('sys.argv', argv[:2]), mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '2'}), \
+                self.assertRaises(ImproperlyConfigured):
+            check_shared_cache()
+        with mock.patch('sys.argv', argv), self.settings(SHARED_CACHE=True):
+            check_shared_cache()
+        with mock.patch('sys.argv', argv[:2]), mock.patch.dict(os.environ, {'WEB_CONCURRENCY': ''}):
+            check_shared_cache()
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        patcher = mock.patch.object(ticket_pdf_cache, 'CACHE_DIR', cache_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.category = make_category(total_quantity=5)
+        self.owner = make_user('guest')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def buy(self):
+        response = self.client.post(reverse('ticket-purchase'), {'category': self.category.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def test_purchase_queues_pdf_and_wallet_jobs(self):
+        ticket_id = self.buy()
+        jobs = BackgroundJob.objects.order_by('kind')
+        self.assertEqual([job.kind for job in jobs], ['ticket_pdf', 'ticket_wallet'])
+        self.assertTrue(all(job.payload['ticket'] == ticket_id for job in jobs))
+
+        with mock.patch('api.services.ticket_artifacts.generate_google_wallet_url', return_value='https://pay.google.com/gp/v/save/x'):
+            self.assertEqual(job_queue.run_pending(), 2)
+        response = self.client.get(reverse('ticket-download-pdf', args=[ticket_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        response = self.client.get(reverse('ticket-download-google', args=[ticket_id]))
+        self.assertEqual(response.data, {'url': 'https://pay.google.com/gp/v/save/x'})
+
+    def test_separate_worker_requires_a_shared_cache(self):
+        self.buy()
+        with self.assertRaisesMessage(CommandError, 'REDIS_URL'):
+            call_command('run_jobs', '--once', stdout=StringIO())
+        self.assertEqual(BackgroundJob.objects.filter(status='PENDING').count(), 2)
+
+        with self.settings(SHARED_CACHE=True), \
+                mock.patch('api.services.ticket_artifacts.generate_google_wallet_url', return_value='https://pay.google.com/gp/v/save/x'):
+            call_command('run_jobs', '--once', stdout=StringIO())
+        self.assertFalse(BackgroundJob.objects.filter(status='PENDING').exists())
+
+    def test_web_process_drains_the_queue_without_a_worker(self):
+        for _ in range(3):
+            self.buy()
+        run_pending = job_queue.run_pending
+        with mock.patch('api.services.ticket_artifacts.generate_google_wallet_url', return_value='https://pay.google.com/gp/v/save/x'), \
+                mock.patch.object(job_queue, 'run_pending', side_effect=lambda: run_pending(2)) as batches:
+            run_queued_jobs()
+        self.assertEqual(batches.call_count, 4)   # 6 jobs in batches of 2, then an empty round
+        self.assertEqual(set(BackgroundJob.objects.values_list('status', flat=True)), {'DONE'})
+
+    def test_pending_wallet_link_answers_202(self):
+        ticket_id = self.buy()
+        url = reverse('ticket-download-google', args=[ticket_id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Retry-After'], '2')
+        # Polling does not queue the job twice.
+        self.client.get(url)
+        self.assertEqual(BackgroundJob.objects.filter(kind='ticket_wallet').count(), 1)
+
+    def test_failures_back_off_then_fail_and_requeue_after_a_while(self):
+        ticket_id = self.buy()
+        url = reverse('ticket-download-google', args=[ticket_id])
+        broken = mock.patch('api.services.ticket_artifacts.generate_google_wallet_url', side_effect=RuntimeError('chiave mancante'))
+        with broken:
+            for attempt in range(job_queue.MAX_ATTEMPTS):
+                BackgroundJob.objects.update(run_after=timezone.now())
+                job_queue.run_pending()
+                job = BackgroundJob.objects.get(kind='ticket_wallet')
+                self.assertEqual(job.attempts, attempt + 1)
+                if attempt + 1 < job_queue.MAX_ATTEMPTS:
+                    self.assertEqual(job.status, 'PENDING')
+                    self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(job.status, 'FAILED')
+
+        # The stored failure is reported, without queueing the job again on every download...
+        for _ in range(2):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.data, {'error': 'chiave mancante'})
+            self.assertEqual(int(response['Retry-After']), ticket_artifacts.FAILED_RETRY_AFTER.total_seconds())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('FAILED', job_queue.MAX_ATTEMPTS))
+
+        # ...until the back-off has passed.
+        BackgroundJob.objects.update(finished_at=timezone.now() - ticket_artifacts.FAILED_RETRY_AFTER)
+        self.assertEqual(self.client.get(url).status_code, 202)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('PENDING', 0))
+
+    def test_expired_lease_is_claimed_again(self):
+        self.buy()
+        claimed = job_queue.claim()
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(job_queue.claim(), [])
+        BackgroundJob.objects.update(locked_at=timezone.now() - job_queue.LEASE - timedelta(seconds=1))
+        self.assertEqual(len(job_queue.claim()), 2)
+
+
+class TicketQrTests(TestCase):
+    def test_rectangles_cover_exactly_the_dark_modules(self):
+        code = '6f1c2a0e-8d4b-4c7e-9a55-0b3e2f6d7c81'
+        qr = qrcode.QRCode(border=ticket_qr.BORDER)
+        qr.add_data(code)
+        qr.make(fit=True)
+        matrix = qr.get_matrix()
+
+        size, rects = ticket_qr.modules(code)
+        covered = [[False] * size for _ in range(size)]
+        for x, y, width, height in rects:
+            for row in range(y, y + height):
+                for col in range(x, x + width):
+                    self.assertFalse(covered[row][col])
+                    covered[row][col] = True
+        self.assertEqual(covered, matrix)
+        # Run-length merging: far fewer shapes than dark modules.
+        self.assertLess(len(rects), sum(map(sum, matrix)) / 2)
+
+    def test_matrix_is_cached_per_code(self):
+        ticket_qr.modules.cache_clear()
+        category = make_category(total_quantity=5)
+        ticket = Ticket.objects.select_related('category__event', 'owner').get(
+            pk=Ticket.objects.create(category=category, owner=make_user('guest')).pk,
+        )
+        ticket_pdf.generate_ticket_pdf(ticket)
+        pdf = ticket_pdf.generate_ticket_pdf(ticket).getvalue()
+        info = ticket_qr.modules.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 1))
+        # No raster image is embedded for the QR code any more.
+        self.assertNotIn(b'/Subtype /Image', pdf)
+
+
+class GoogleWalletSignerTests(TestCase):
+    def setUp(self):
+        self.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        pem = self.key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+        ).decode()
+        creds = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        json.dump({'client_email': 'wallet@example.iam.gserviceaccount.com', 'private_key': pem}, creds)
+        creds.close()
+        self.addCleanup(os.unlink, creds.name)
+
+        for patcher in (
+            mock.patch.object(google_wallet, 'CREDENTIALS_FILE', creds.name),
+            mock.patch.dict(os.environ, {'GOOGLE_WALLET_ISSUER_ID': '3388000000012345'}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        google_wallet.refresh_signer()
+        self.addCleanup(google_wallet.refresh_signer)
+
+        category = make_category(total_quantity=5)
+        self.ticket = Ticket.objects.select_related('category__event', 'owner').get(
+            pk=Ticket.objects.create(category=category, owner=make_user('guest')).pk,
+        )
+
+    def claims(self, url):
+        token = url.rsplit('/', 1)[1]
+        return jwt.decode(token, self.key.public_key(), algorithms=['RS256'], audience='google')
+
+    def test_credentials_are_loaded_once_and_reused(self):
+        with mock.patch.object(google_wallet, '_load_signer', wraps=google_wallet._load_signer) as load:
+            urls = [google_wallet.generate_google_wallet_url(self.ticket, 'https://getinvolved.it/') for _ in range(3)]
+        self.assertEqual(load.call_count, 1)
+
+        claims = self.claims(urls[0])
+        self.assertEqual(claims['iss'], 'wallet@example.iam.gserviceaccount.com')
+        self.assertEqual(claims['origins'], ['https://getinvolved.it'])
+        ticket_object = claims['payload']['eventTicketObjects'][0]
+        self.assertEqual(ticket_object['id'], f"3388000000012345.t_{self.ticket.ticket_code.hex}")
+
+    def test_signer_expires_after_ttl_and_on_refresh(self):
+        signer = google_wallet.get_signer()
+        self.assertIs(google_wallet.get_signer(), signer)
+
+        later = time.monotonic() + google_wallet.CREDENTIALS_TTL + 1
+        with mock.patch('api.services.google_wallet.time.monotonic', return_value=later):
+            renewed = google_wallet.get_signer()
+        self.assertIsNot(renewed, signer)
+
+        google_wallet.refresh_signer()
+        self.assertIsNot(google_wallet.get_signer(), renewed)
+
+    def test_missing_issuer_is_not_cached(self):
+        with mock.patch.dict(os.environ, {'GOOGLE_WALLET_ISSUER_ID': ''}):
+            with self.assertRaisesMessage(ValueError, 'GOOGLE_WALLET_ISSUER_ID assente.'):
+                google_wallet.get_signer()
+        self.assertEqual(google_wallet.get_signer().issuer_id, '3388000000012345')
+
+
+class TicketRenderTemplateTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = self.settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        patcher = mock.patch.object(ticket_pdf, 'ASSETS_DIR', os.path.join(media.name, 'ticket_render'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ticket_pdf._build_template.cache_clear()
+
+        Image.new('RGB', (3000, 2000), 'navy').save(os.path.join(media.name, 'hero.jpg'))
+        self.category = make_category(total_quantity=5)
+        Event.objects.filter(pk=self.category.event_id).update(hero_image='hero.jpg')
+        self.owner = make_user('guest')
+
+    def load(self, ticket):
+        return Ticket.objects.select_related('category__event', 'owner').get(pk=ticket.pk)
+
+    def test_assets_are_scaled_once_per_category(self):
+        tickets = [Ticket.objects.create(category=self.category, owner=self.owner) for _ in range(3)]
+        with mock.patch.object(ticket_pdf, '_prescaled', wraps=ticket_pdf._prescaled) as prescale:
+            for ticket in tickets:
+                self.assertTrue(ticket_pdf.generate_ticket_pdf(self.load(ticket)).getvalue().startswith(b'%PDF'))
+        self.assertEqual(prescale.call_count, 3)   # hero, poster, logo of the one template
+
+        template = ticket_pdf.render_template(self.load(tickets[0]).category)
+        with Image.open(template.hero) as hero:
+            # 19 x 8 cm at RENDER_DPI
+            self.assertEqual(hero.size, (1122, 472))
+        self.assertIsNone(template.poster)
+
+    def test_image_replaced_in_place_is_picked_up(self):
+        ticket = Ticket.objects.create(category=self.category, owner=self.owner)
+        first = ticket_pdf.render_template(self.load(ticket).category)
+        hero = os.path.join(settings.MEDIA_ROOT, 'hero.jpg')
+        Image.new('RGB', (300, 200), 'red').save(hero)
+        os.utime(hero, ns=(time.time_ns() + 10 ** 9,) * 2)
+        second = ticket_pdf.render_template(self.load(ticket).category)
+        self.assertNotEqual(first.hero, second.hero)
+        with Image.open(second.hero) as scaled:
+            self.assertGreater(scaled.getpixel((0, 0))[0], 200)   # red now, navy before
+
+    def test_binary_streams_leave_the_global_flag_alone(self):
+        ticket = Ticket.objects.create(category=self.category, owner=self.owner)
+        self.assertEqual(rl_config.useA85, 1)
+        pdf = ticket_pdf.generate_ticket_pdf(self.load(ticket)).getvalue()
+        self.assertNotIn(b'ASCII85Decode', pdf)
+        self.assertEqual(rl_config.useA85, 1)
+
+    def test_unused_assets_are_pruned_and_rebuilt(self):
+        ticket = Ticket.objects.create(category=self.category, owner=self.owner)
+        template = ticket_pdf.render_template(self.load(ticket).category)
+        self.assertEqual(ticket_pdf.prune_assets(), 0)
+        os.utime(template.hero, (time.time() - ticket_pdf.ASSETS_MAX_AGE - 60,) * 2)
+
+        with mock.patch.object(ticket_pdf_cache, 'prune', return_value=0):
+            prune_ticket_pdf_cache()
+        self.assertFalse(os.path.exists(template.hero))
+        self.assertTrue(os.path.exists(ticket_pdf.render_template(self.load(ticket).category).hero))
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = self.settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.media = media.name
+        self.event = make_category(total_quantity=5).event
+
+    def upload(self, name, size):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new('RGBA', size, (200, 30, 30, 128)).save(path)
+        return name
+
+    def test_upload_is_rendered_by_the_worker(self):
+        self.event.poster_image = self.upload('events/posters/poster.png', (1600, 900))
+        self.event.save()
+        self.assertIsNone(EventSerializer(self.event).data['poster_image_srcset'])
+
+        job_queue.run_pending()
+        self.event.refresh_from_db()
+        variants = self.event.poster_image_variants
+        self.assertEqual(variants['source'], 'events/posters/poster.png')
+        self.assertEqual(list(variants['srcset']), list(image_derivatives.FORMATS))
+        for fmt, entries in variants['srcset'].items():
+            self.assertEqual([width for width, _ in entries], [320, 640, 1280])
+            for width, name in entries:
+                with Image.open(os.path.join(self.media, name)) as image:
+                    self.assertEqual(image.size, (width, round(900 * width / 1600)))
+
+        srcset = EventSerializer(self.event).data['poster_image_srcset']
+        self.assertEqual((srcset['width'], srcset['height']), (1600, 900))
+        self.assertEqual(srcset['webp'], '/media/derived/events/posters/poster.png.320w.webp 320w, '
+                                         '/media/derived/events/posters/poster.png.640w.webp 640w, '
+                                         '/media/derived/events/posters/poster.png.1280w.webp 1280w')
+        self.assertIn('/media/derived/events/posters/poster.png.640w.jpg 640w', srcset['jpeg'])
+
+    def test_small_images_are_not_upscaled(self):
+        self.event.hero_image = self.upload('events/heroes/hero.png', (500, 250))
+        self.event.save()
+        job_queue.run_pending()
+        self.event.refresh_from_db()
+        entries = self.event.hero_image_variants['srcset']['jpeg']
+        self.assertEqual([width for width, _ in entries], [320, 500])
+
+    def test_replaced_image_hides_and_removes_the_old_variants(self):
+        self.event.poster_image = self.upload('events/posters/old.png', (800, 800))
+        self.event.save()
+        job_queue.run_pending()
+        self.event.refresh_from_db()
+        old_files = [name for entries in self.event.poster_image_variants['srcset'].values() for _, name in entries]
+
+        self.event.poster_image = self.upload('events/posters/new.png', (800, 800))
+        self.event.save()
+        self.assertIsNone(EventSerializer(self.event).data['poster_image_srcset'])
+
+        job_queue.run_pending()
+        self.event.refresh_from_db()
+        self.assertIn('new.png.320w', EventSerializer(self.event).data['poster_image_srcset']['jpeg'])
+        self.assertFalse(any(os.path.exists(os.path.join(self.media, name)) for name in old_files))
+
+    def test_same_stem_in_another_format_keeps_its_variants(self):
+        os.makedirs(os.path.join(self.media, 'events/posters'))
+        Image.new('RGB', (800, 600), 'navy').save(os.path.join(self.media, 'events/posters/photo.jpg'))
+        self.event.poster_image = 'events/posters/photo.jpg'
+        self.event.save()
+        other = make_category().event
+        other.poster_image = self.upload('events/posters/photo.png', (800, 600))
+        other.save()
+        job_queue.run_pending()
+
+        self.event.refresh_from_db()
+        other.refresh_from_db()
+        # photo.png's copies must not overwrite photo.jpg's.
+        ours = self.event.poster_image_variants['srcset']['jpeg'][0][1]
+        self.assertNotEqual(ours, other.poster_image_variants['srcset']['jpeg'][0][1])
+        with Image.open(os.path.join(self.media, ours)) as image:
+            self.assertLess(image.getpixel((0, 0))[0], 50)   # navy, not the other poster's red
+
+    def test_unrelated_saves_queue_nothing(self):
+        user = make_user('avatar')
+        user.avatar = self.upload('avatars/me.png', (400, 400))
+        user.save(update_fields=['last_login'])
+        self.event.save()
+        self.assertFalse(BackgroundJob.objects.filter(kind='image_derivatives').exists())
+
+    def test_backfill_queues_existing_media(self):
+        user = make_user('avatar')
+        User.objects.filter(pk=user.pk).update(avatar=self.upload('avatars/me.png', (400, 400)))
+        TicketCategory.objects.filter(event=self.event).update(logo=self.upload('tickets/logos/l.png', (100, 100)))
+
+        call_command('backfill_image_derivatives', stdout=StringIO())
+        self.assertEqual(BackgroundJob.objects.filter(kind='image_derivatives', status='PENDING').count(), 2)
+        job_queue.run_pending()
+
+        user.refresh_from_db()
+        self.assertIn('/media/derived/avatars/me.png.320w.webp 320w', UserSerializer(user).data['avatar_srcset']['webp'])
+        category = TicketCategory.objects.get(event=self.event)
+        self.assertEqual(category.logo_variants['srcset']['jpeg'], [[100, 'derived/tickets/logos/l.png.100w.jpg']])
+
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('backfill_image_derivatives', '--sync', stdout=out)
+        with self.settings(SHARED_CACHE=True):
+            call_command('backfill_image_derivatives', '--sync', stdout=out)
+        self.assertIn('0 image(s)', out.getvalue())
+
+
+class TicketExportTests(TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        for patcher in (
+            mock.patch.object(ticket_pdf_cache, 'CACHE_DIR', cache_dir.name),
+            mock.patch.object(ticket_export, 'EXPORT_DIR', os.path.join(cache_dir.name, 'exports')),
+            mock.patch.object(ticket_export, 'WORKERS', 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.category = make_category(total_quantity=10)
+        guest = make_user('guest')
+        self.tickets = [Ticket.objects.create(category=self.category, owner=guest) for _ in range(3)]
+        other = TicketCategory.objects.create(event=self.category.event, name='VIP', total_quantity=5)
+        self.vip = Ticket.objects.create(category=other, owner=guest)
+        self.client = APIClient()
+        self.client.force_authenticate(self.category.event.organizer)
+        self.url = reverse('event-ticket-export', args=[self.category.event_id])
+
+    def test_zip_holds_one_pdf_per_ticket(self):
+        response = self.client.get(self.url, {'category': self.category.id})
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), [ticket_export.entry_name(t) for t in self.tickets])
+        self.assertTrue(all(archive.read(name).startswith(b'%PDF') for name in archive.namelist()))
+
+    async def test_asgi_streams_the_zip_as_it_renders(self):
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.category.event.organizer).access_token))()
+        response = await self.async_client.get(self.url, headers={'Authorization': f'Bearer {token}'})
+        self.assertTrue(response.is_async)
+        archive = zipfile.ZipFile(BytesIO(b''.join([chunk async for chunk in response.streaming_content])))
+        self.assertEqual(len(archive.namelist()), 4)
+
+    def test_multi_page_pdf_is_built_by_a_worker(self):
+        response = self.client.get(self.url, {'output': 'pdf'})
+        self.assertEqual(response.status_code, 202)
+        poll = response['Location']
+        self.assertEqual(self.client.get(poll).status_code, 202)
+
+        job_queue.run_pending()
+        response = self.client.get(poll)
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertIn(b'/Count 4', content)
+
+        # Other events' jobs are not reachable through this URL, and old files expire.
+        other = Event.objects.create(title='Altro', organizer=self.category.event.organizer)
+        other_url = reverse('event-ticket-export', args=[other.id])
+        self.assertEqual(self.client.get(other_url, {'output': 'pdf', 'job': poll.rsplit('=', 1)[1]}).status_code, 404)
+        self.assertEqual(ticket_export.prune(max_age=-1), 1)
+        self.assertEqual(self.client.get(poll).status_code, 410)
+
+    def test_selects_by_the_tickets_own_event_column(self):
+        sql = str(ticket_export.export_queryset(self.category.event).query)
+        self.assertIn('"api_ticket"."event_id" =', sql)
+        self.assertEqual(ticket_export.export_queryset(self.category.event).count(), 4)
+
+    def test_rejects_unknown_output_and_category(self):
+        self.assertEqual(self.client.get(self.url, {'output': 'docx'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'category': 'x'}).status_code, 404)
+
+
+class InventoryConcurrencyTests(TransactionTestCase):
+    THREADS = 12
+    ATTEMPTS_PER_THREAD = 10
+    STOCK = 40
+
+    def test_concurrent_purchases_never_oversell(self):
+        category = make_category(total_quantity=self.STOCK)
+        buyers = [make_user(f'buyer{i}') for i in range(self.THREADS)]
+        sold, errors = [], []
+        start = threading.Barrier(self.THREADS)
+
+        def buy(buyer):
+            try:
+                start.wait()
+                for _ in range(self.ATTEMPTS_PER_THREAD):
+                    try:
+                        with transaction.atomic():
+                            inventory.purchase(category.id)
+                            Ticket.objects.create(category_id=category.id, owner=buyer)
+                        sold.append(buyer.id)
+                    except inventory.OutOfStock:
+                        pass
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(buyer,)) for buyer in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        category.refresh_from_db()
+        self.assertEqual(len(sold), self.STOCK)
+        self.assertEqual(category.allocated_quantity, self.STOCK)
+        self.assertEqual(category.sold_count, self.STOCK)
+        self.assertEqual(Ticket.objects.filter(category=category).count(), self.STOCK)
+
+
+class CheckInLoadTests(TransactionTestCase):
+    """Several gates scan the same crowd at once, including duplicate scans."""
+    GATES = 6
+    TICKETS = 120
+
+    def test_each_ticket_is_admitted_exactly_once(self):
+        category = make_category(total_quantity=self.TICKETS)
+        organizer = category.event.organizer
+        guest = make_user('guest')
+        Ticket.objects.bulk_create([Ticket(category=category, owner=guest) for _ in range(self.TICKETS)])
+        codes = [str(code) for code in Ticket.objects.values_list('ticket_code', flat=True)]
+        outcomes, errors = [], []
+        start = threading.Barrier(self.GATES)
+        organizer.permission_snapshot   # loaded once per request in practice
+
+        def gate(offset):
+            try:
+                start.wait()
+                # Every gate walks the whole list from a different point, so
+                # each code is scanned once per gate, often simultaneously.
+                for code in codes[offset:] + codes[:offset]:
+                    with CaptureQueriesContext(connection) as queries:
+                        outcome = checkin.check_in(organizer, ticket_code=code).outcome
+                    outcomes.append((code, outcome, len(queries)))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=gate, args=(i * self.TICKETS // self.GATES,))
+            for i in range(self.GATES)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        admitted = [code for code, outcome, _ in outcomes if outcome == checkin.CHECKED_IN]
+        self.assertEqual(sorted(admitted), sorted(codes))
+        self.assertEqual(len(outcomes), self.GATES * self.TICKETS)
+        category.refresh_from_db()
+        self.assertEqual(category.checked_in_count, self.TICKETS)
+        self.assertFalse(Ticket.objects.filter(is_checked_in=False).exists())
+        # Savepoint, UPDATE ... RETURNING, then the counter (admitted) or the
+        # explaining SELECT (duplicate), release.  Throughput: benchmark_check_in.
+        self.assertEqual({count for _, _, count in outcomes}, {4})
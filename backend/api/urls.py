@@ -5,6 +5,9 @@ from . import views
 urlpatterns = [
     path("event/", views.EventListCreate.as_view(), name="event-list"),
     path("event/public/", views.PublicEventListView.as_view(), name="event-public"),
+    path("event/feed/", views.EventFeedView.as_view(), name="event-feed"),
+    path("event/public/nearby/", views.PublicEventNearbyView.as_view(), name="event-public-nearby"),
+    path("event/public/search/", views.PublicEventSearchView.as_view(), name="event-public-search"),
     path("event/public/<int:pk>/", views.PublicEventDetailView.as_view(), name="event-public-detail"),
     path("event/<int:pk>/", views.EventDetail.as_view(), name="event-detail"),
     path("event/delete/<int:pk>/", views.EventDelete.as_view(), name="event-delete"),
@@ -21,12 +24,24 @@ urlpatterns = [
     path("tickets/categories/", views.TicketCategoryCreateView.as_view(), name="ticket-category-create"),
     path("tickets/categories/<int:pk>/", views.TicketCategoryUpdateView.as_view(), name="ticket-category-update"),
     path("tickets/categories/delete/<int:pk>/", views.TicketCategoryDeleteView.as_view(), name="ticket-category-delete"),
+    path("tickets/queue/<int:category_id>/join/", views.AdmissionQueueJoinView.as_view(), name="ticket-queue-join"),
+    path("tickets/queue/status/", views.AdmissionQueueStatusView.as_view(), name="ticket-queue-status"),
     path("tickets/purchase/", views.TicketPurchaseView.as_view(), name="ticket-purchase"),
+    path("tickets/purchase/bulk/", views.TicketBulkPurchaseView.as_view(), name="ticket-purchase-bulk"),
+    path("tickets/reservations/", views.TicketReservationCreateView.as_view(), name="ticket-reservation-create"),
+    path("tickets/reservations/<int:pk>/", views.TicketReservationDetailView.as_view(), name="ticket-reservation-detail"),
+    path("tickets/reservations/<int:pk>/confirm/", views.TicketReservationConfirmView.as_view(), name="ticket-reservation-confirm"),
     path("tickets/my/", views.UserTicketsListView.as_view(), name="user-tickets"),
     path("tickets/event/<int:event_id>/", views.EventTicketsListView.as_view(), name="event-tickets"),
+    path("tickets/event/<int:event_id>/manifest/", views.EventTicketManifestView.as_view(), name="event-ticket-manifest"),
+    path("tickets/event/<int:event_id>/export/", views.EventTicketExportView.as_view(), name="event-ticket-export"),
+    path("tickets/event/<int:event_id>/live/", views.EventCheckInStreamView.as_view(), name="event-checkin-stream"),
+    path("tickets/event/<int:event_id>/live/ticket/", views.EventCheckInStreamTicketView.as_view(), name="event-checkin-stream-ticket"),
+    path("tickets/<int:pk>/refund/", views.TicketRefundView.as_view(), name="ticket-refund"),
     path("tickets/<int:pk>/download/pdf/", views.TicketDownloadPDFView.as_view(), name="ticket-download-pdf"),
     path("tickets/<int:pk>/download/google/", views.TicketDownloadGoogleWalletView.as_view(), name="ticket-download-google"),
     path("tickets/validate/", views.TicketValidationView.as_view(), name="ticket-validate"),
+    path("tickets/validate/batch/", views.TicketBatchValidationView.as_view(), name="ticket-validate-batch"),
     path("user/admin-onboarding/", views.AdminOnboardingView.as_view(), name="admin-onboarding"),
 ]
 
@@ -1,37 +1,56 @@
-import traceback
+import asyncio
+import json
+from contextlib import contextmanager
+from urllib.parse import urlencode
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views import View
 from rest_framework import generics, filters, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
 
-from .models import Event, Role, AppPermission, PermissionCategory, Ticket, TicketCategory
+from . import streaming
+from .catalogue import CachedCatalogueMixin
+from .models import Event, Role, AppPermission, PermissionCategory, BackgroundJob, Ticket, TicketCategory, TicketReservation
 from .permissions import HasAppPermission, EventPermission, IsEventOwnerOrHasPermission, can_manage_event_tickets, can_access_ticket
 from .permission_registry import Perms
+from .pagination import EventCreatedPagination, EventDatePagination, TicketPurchasePagination, UserPagination
+from .serializers.query_plan import OptimizedQuerysetMixin
 from .serializers import (
     UserSerializer, EventSerializer, RoleSerializer,
     PermissionCategorySerializer, AppPermissionSerializer,
     RegisterSerializer, AffiliateSerializer, TicketCategorySerializer,
     TicketSerializer, OnboardingSerializer, AdminOnboardingSerializer,
+    TicketBulkPurchaseSerializer, TicketReservationSerializer, TicketScanBatchSerializer,
+    NearbyEventSerializer,
 )
-from .services.ticket_pdf import generate_ticket_pdf
-from .services.google_wallet import generate_google_wallet_url
+from .services import admission, checkin, event_facets, event_search, feed, inventory, live_checkins, manifest, nearby, reservations, ticket_artifacts, ticket_export
 
 User = get_user_model()
 
+# Seconds clients should wait before polling a pending download again.
+ARTIFACT_RETRY_AFTER = 2
+
 
 # ---------------------------------------------------------------------------
 # Event views
 # ---------------------------------------------------------------------------
 
-class EventListCreate(generics.ListCreateAPIView):
+class EventListCreate(OptimizedQuerysetMixin, generics.ListCreateAPIView):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
     permission_classes = [EventPermission]
+    pagination_class = EventCreatedPagination
 
     def perform_create(self, serializer):
         serializer.save(organizer=self.request.user)
@@ -45,14 +64,106 @@ class EventListCreate(generics.ListCreateAPIView):
         return Event.objects.none()
 
 
-class PublicEventListView(generics.ListAPIView):
-    """Public read-only event list for the client home page. Only PUBLISHED events."""
+class PublicEventListView(CachedCatalogueMixin, OptimizedQuerysetMixin, generics.ListAPIView):
+    """
+    Public read-only event list for the client home page. Only PUBLISHED events.
+    Accepts the filters of `event_facets.filter_events`; with `?facets=1` the
+    list comes as `{"results": [...], "facets": {...}}` with the catalogue-wide
+    facet counts.
+    """
+    serializer_class = EventSerializer
+    permission_classes = [AllowAny]
+    pagination_class = EventDatePagination
+    catalogue_params = (
+        'page_size', 'cursor', 'facets', 'date_from', 'date_to', 'country', 'price', 'available',
+    )
+
+    def get_queryset(self):
+        events = Event.objects.filter(status='PUBLISHED')
+        try:
+            return event_facets.filter_events(events, self.request.query_params)
+        except ValueError as exc:
+            raise ValidationError(str(exc))
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets') in ('1', 'true'):
+            response.data['facets'] = event_facets.counts()
+        return response
+
+
+class PublicEventSearchView(CachedCatalogueMixin, OptimizedQuerysetMixin, generics.ListAPIView):
+    """Ranked full-text search over the PUBLISHED events; every word of `q` matches as a prefix."""
     serializer_class = EventSerializer
     permission_classes = [AllowAny]
+    pagination_class = None
+    catalogue_params = ('q', 'limit')
+
+    def catalogue_query(self, params):
+        # Typeahead variants of the same words ("Rock ", "rock") share an entry.
+        query = super().catalogue_query(params)
+        return [(name, ' '.join(event_search.terms(value)) if name == 'q' else value) for name, value in query]
 
     def get_queryset(self):
         return Event.objects.filter(status='PUBLISHED')
 
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '')
+        if not event_search.terms(query):
+            return Response({"error": "Parametro di ricerca 'q' mancante."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', event_search.MAX_RESULTS)), 1), event_search.MAX_RESULTS)
+        except ValueError:
+            return Response({"error": "Parametro 'limit' non valido."}, status=status.HTTP_400_BAD_REQUEST)
+
+        ids = event_search.search(query, limit)
+        events = self.filter_queryset(self.get_queryset()).in_bulk(ids)
+        ranked = [events[pk] for pk in ids if pk in events]
+        return Response(self.get_serializer(ranked, many=True).data)
+
+
+class PublicEventNearbyView(OptimizedQuerysetMixin, generics.ListAPIView):
+    """PUBLISHED events within `radius` km of `lat`/`lng`, nearest first."""
+    serializer_class = NearbyEventSerializer
+    permission_classes = [AllowAny]
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            lat = float(params['lat'])
+            lng = float(params['lng'])
+            radius = float(params.get('radius', nearby.DEFAULT_RADIUS_KM))
+        except (KeyError, ValueError):
+            return Response({"error": "Parametri 'lat' e 'lng' obbligatori e numerici."}, status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return Response({"error": "Coordinate non valide."}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < radius <= nearby.MAX_RADIUS_KM:
+            return Response(
+                {"error": f"Il raggio deve essere compreso tra 0 e {nearby.MAX_RADIUS_KM} km."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        events = nearby.events_near(lat, lng, radius, queryset=self.filter_queryset(Event.objects.all()))
+        return Response(self.get_serializer(events, many=True).data)
+
+
+class EventFeedView(OptimizedQuerysetMixin, generics.ListAPIView):
+    """Events recommended to the current user from their preferences and location, best first."""
+    serializer_class = EventSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        try:
+            limit = min(max(int(request.query_params.get('limit', feed.MAX_RESULTS)), 1), feed.MAX_RESULTS)
+        except ValueError:
+            return Response({"error": "Parametro 'limit' non valido."}, status=status.HTTP_400_BAD_REQUEST)
+
+        ids = feed.for_user(request.user, limit)
+        events = self.filter_queryset(Event.objects.filter(status='PUBLISHED')).in_bulk(ids)
+        return Response(self.get_serializer([events[pk] for pk in ids if pk in events], many=True).data)
+
 
 class EventDelete(generics.DestroyAPIView):
     serializer_class = EventSerializer
@@ -73,7 +184,7 @@ class EventDelete(generics.DestroyAPIView):
         super().perform_destroy(instance)
 
 
-class EventUpdate(generics.UpdateAPIView):
+class EventUpdate(OptimizedQuerysetMixin, generics.UpdateAPIView):
     serializer_class = EventSerializer
     permission_classes = [EventPermission]
 
@@ -86,13 +197,13 @@ class EventUpdate(generics.UpdateAPIView):
         return Event.objects.none()
 
 
-class EventDetail(generics.RetrieveAPIView):
+class EventDetail(OptimizedQuerysetMixin, generics.RetrieveAPIView):
     serializer_class = EventSerializer
     permission_classes = [EventPermission]
     queryset = Event.objects.all()
 
 
-class PublicEventDetailView(generics.RetrieveAPIView):
+class PublicEventDetailView(CachedCatalogueMixin, OptimizedQuerysetMixin, generics.RetrieveAPIView):
     """Public read-only event detail for the client. Only PUBLISHED."""
     serializer_class = EventSerializer
     permission_classes = [AllowAny]
@@ -211,16 +322,17 @@ class PermissionCategoryList(generics.ListAPIView):
 # User management views
 # ---------------------------------------------------------------------------
 
-class UserList(generics.ListAPIView):
+class UserList(OptimizedQuerysetMixin, generics.ListAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [HasAppPermission]
+    pagination_class = UserPagination
     required_permission = Perms.USERS_VIEW
     filter_backends = [filters.SearchFilter]
     search_fields = ['username', 'email']
 
 
-class UserUpdate(generics.UpdateAPIView):
+class UserUpdate(OptimizedQuerysetMixin, generics.UpdateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [HasAppPermission]
@@ -275,7 +387,7 @@ class TicketCategoryDeleteView(generics.DestroyAPIView):
     permission_classes = [IsEventOwnerOrHasPermission]
 
     def perform_destroy(self, instance):
-        if instance.tickets.count() > 0:
+        if instance.tickets.exists():
             from rest_framework.exceptions import ValidationError
             raise ValidationError("Impossibile eliminare una categoria che ha già venduto biglietti.")
         instance.delete()
@@ -285,6 +397,71 @@ class TicketCategoryDeleteView(generics.DestroyAPIView):
 # Ticket views
 # ---------------------------------------------------------------------------
 
+@contextmanager
+def require_admission(request, categories):
+    """
+    Reject purchases on queued categories unless the buyer's turn has come.
+    Each admission is used up by the purchase in the `with` block, and given
+    back if the block raises.
+    """
+    tokens = request.data.get('queue_token')
+    if not isinstance(tokens, list):
+        tokens = [tokens]
+
+    claims = []
+    try:
+        for category in categories:
+            if not category.admission_rate:
+                continue
+            for token in tokens:
+                try:
+                    claims.append(admission.claim(token, category.id, request.user))
+                    break
+                except admission.NotAdmitted:
+                    continue
+            else:
+                from rest_framework.exceptions import PermissionDenied
+                raise PermissionDenied("Sei in coda: attendi il tuo turno per acquistare.")
+        yield
+    except BaseException:
+        for claim in claims:
+            admission.release(claim)
+        raise
+
+
+class AdmissionQueueJoinView(APIView):
+    """Take a place in the waiting room of a high-demand category."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, category_id):
+        category = get_object_or_404(TicketCategory, pk=category_id)
+        if not category.admission_rate:
+            return Response({"token": None, "admitted": True, "position": 0, "retry_after": 0})
+
+        token = admission.join(category, request.user)
+        return Response({"token": token, **admission.status(token)}, status=status.HTTP_201_CREATED)
+
+
+class AdmissionQueueStatusView(APIView):
+    """
+    Cheap polling endpoint: the position is derived from the signed token,
+    so neither authentication nor any database/cache lookup is needed.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        try:
+            data = admission.status(request.query_params.get('token', ''))
+        except admission.NotAdmitted:
+            return Response({"error": "Token coda non valido"}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = Response(data)
+        if data['retry_after']:
+            response['Retry-After'] = str(data['retry_after'])
+        return response
+
+
 class TicketPurchaseView(generics.CreateAPIView):
     serializer_class = TicketSerializer
     permission_classes = [IsAuthenticated]
@@ -292,27 +469,114 @@ class TicketPurchaseView(generics.CreateAPIView):
     def perform_create(self, serializer):
         category_id = self.request.data.get('category')
         try:
-            category = TicketCategory.objects.get(id=category_id)
-            if category.remaining_quantity <= 0:
+            category = TicketCategory.objects.select_related('event').get(id=category_id)
+        except TicketCategory.DoesNotExist:
+            from rest_framework.exceptions import ValidationError
+            raise ValidationError("Categoria biglietto non trovata.")
+
+        with require_admission(self.request, [category]), transaction.atomic():
+            try:
+                inventory.purchase(category.id)
+            except inventory.OutOfStock:
                 from rest_framework.exceptions import ValidationError
                 raise ValidationError("I biglietti per questa categoria sono esauriti.")
-            serializer.save(owner=self.request.user, category=category)
-        except TicketCategory.DoesNotExist:
+            ticket = serializer.save(owner=self.request.user, category=category)
+            ticket_artifacts.schedule([ticket], self.request.build_absolute_uri('/'))
+
+
+class TicketBulkPurchaseView(APIView):
+    """Buy several tickets, possibly across categories, in one transaction."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = TicketBulkPurchaseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        quantities = serializer.validated_data['lines']
+
+        categories = TicketCategory.objects.select_related('event').in_bulk(list(quantities))
+        if len(categories) != len(quantities):
             from rest_framework.exceptions import ValidationError
             raise ValidationError("Categoria biglietto non trovata.")
 
+        with require_admission(request, categories.values()), transaction.atomic():
+            try:
+                inventory.purchase_many(quantities)
+            except inventory.OutOfStock as exc:
+                from rest_framework.exceptions import ValidationError
+                raise ValidationError(
+                    f"Biglietti insufficienti per la categoria {categories[exc.category_id].name}."
+                )
+            tickets = Ticket.objects.bulk_create([
+                Ticket(category=categories[category_id], owner=request.user)
+                for category_id, quantity in quantities.items()
+                for _ in range(quantity)
+            ])
+            ticket_artifacts.schedule(tickets, request.build_absolute_uri('/'))
+
+        data = TicketSerializer(tickets, many=True, context={'request': request}).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class TicketReservationCreateView(generics.CreateAPIView):
+    """Hold stock for the checkout screen; expires after reservations.HOLD_TTL."""
+    serializer_class = TicketReservationSerializer
+    permission_classes = [IsAuthenticated]
 
-class UserTicketsListView(generics.ListAPIView):
+    def perform_create(self, serializer):
+        category = serializer.validated_data['category']
+        with require_admission(self.request, [category]):
+            try:
+                reservation = reservations.hold(
+                    category.id, self.request.user, serializer.validated_data['quantity'],
+                )
+            except inventory.OutOfStock:
+                from rest_framework.exceptions import ValidationError
+                raise ValidationError("I biglietti per questa categoria sono esauriti.")
+        serializer.instance = reservation
+
+
+class TicketReservationDetailView(generics.RetrieveDestroyAPIView):
+    serializer_class = TicketReservationSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return TicketReservation.objects.filter(owner=self.request.user)
+
+    def perform_destroy(self, instance):
+        reservations.cancel(instance)
+
+
+class TicketReservationConfirmView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        reservation = get_object_or_404(
+            TicketReservation.objects.select_related('category__event', 'owner'), pk=pk, owner=request.user,
+        )
+        try:
+            with transaction.atomic():
+                tickets = reservations.confirm(reservation)
+                ticket_artifacts.schedule(tickets, request.build_absolute_uri('/'))
+        except reservations.ReservationExpired:
+            return Response({"error": "Prenotazione scaduta"}, status=status.HTTP_410_GONE)
+
+        data = TicketSerializer(tickets, many=True, context={'request': request}).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class UserTicketsListView(OptimizedQuerysetMixin, generics.ListAPIView):
     serializer_class = TicketSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = TicketPurchasePagination
 
     def get_queryset(self):
         return Ticket.objects.filter(owner=self.request.user).order_by('-purchase_date')
 
 
-class EventTicketsListView(generics.ListAPIView):
+class EventTicketsListView(OptimizedQuerysetMixin, generics.ListAPIView):
     serializer_class = TicketSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = TicketPurchasePagination
 
     def get_queryset(self):
         event_id = self.kwargs.get('event_id')
@@ -320,89 +584,313 @@ class EventTicketsListView(generics.ListAPIView):
             event = Event.objects.get(id=event_id)
             if not can_manage_event_tickets(self.request.user, event):
                 return Ticket.objects.none()
-            return Ticket.objects.filter(category__event=event).order_by('-purchase_date')
+            return Ticket.objects.filter(event=event).order_by('-purchase_date')
         except Event.DoesNotExist:
             return Ticket.objects.none()
 
 
+class EventTicketManifestView(APIView):
+    """Packed, sorted ticket codes of an event for offline gates (see services.manifest)."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, event_id):
+        event = get_object_or_404(Event, pk=event_id)
+        if not can_manage_event_tickets(request.user, event):
+            return Response({"error": "Permesso negato"}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            since = -1
+        if since < 0:
+            return Response({"error": "Parametro 'since' non valido"}, status=status.HTTP_400_BAD_REQUEST)
+
+        snapshot = manifest.Manifest(event, since=since)
+        response = StreamingHttpResponse(streaming.stream(request, snapshot), content_type=manifest.CONTENT_TYPE)
+        response['Content-Disposition'] = f'attachment; filename="event_{event.id}_manifest.bin"'
+        response['X-Manifest-Version'] = str(snapshot.version)
+        return response
+
+
+class EventTicketExportView(APIView):
+    """
+    All tickets of an event (or `?category=`) for printing: `?output=zip`
+    (default), streamed as it is rendered, or `pdf`, built by a worker: the
+    202 names the `?job=` URL to poll for the file.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, event_id):
+        event = get_object_or_404(Event, pk=event_id)
+        if not can_manage_event_tickets(request.user, event):
+            return Response({"error": "Permesso negato"}, status=status.HTTP_403_FORBIDDEN)
+
+        output = request.query_params.get('output', 'zip')
+        if output not in ticket_export.FORMATS:
+            return Response(
+                {"error": f"Formato non valido. Valori ammessi: {list(ticket_export.FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        category_id = request.query_params.get('category')
+        if category_id is not None and not (
+            category_id.isdigit() and event.ticket_categories.filter(pk=category_id).exists()
+        ):
+            return Response({"error": "Categoria biglietto non trovata"}, status=status.HTTP_404_NOT_FOUND)
+
+        if output == 'pdf':
+            return self.pdf(request, event, category_id)
+        tickets = ticket_export.export_queryset(event, category_id).iterator(chunk_size=ticket_export.CHUNK)
+        response = StreamingHttpResponse(
+            streaming.stream(request, ticket_export.stream_zip(tickets)), content_type='application/zip',
+        )
+        response['Content-Disposition'] = f'attachment; filename="Tickets_event_{event.id}.zip"'
+        return response
+
+    def pdf(self, request, event, category_id):
+        job_id = request.query_params.get('job')
+        if job_id is None:
+            job = ticket_export.schedule_pdf(event, category_id)
+        else:
+            job = BackgroundJob.objects.filter(
+                pk=job_id if job_id.isdigit() else None, kind='ticket_export', payload__event=event.id,
+            ).first()
+            if job is None:
+                return Response({"error": "Esportazione non trovata"}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            pdf = ticket_export.open_pdf(job)
+        except ticket_export.ExportFailed:
+            return Response({"error": "Errore generazione PDF"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except FileNotFoundError:
+            return Response({"error": "Esportazione scaduta, richiedila di nuovo"}, status=status.HTTP_410_GONE)
+        if pdf is None:
+            return artifact_pending(f"{request.path}?{urlencode({'output': 'pdf', 'job': job.pk})}")
+        return streaming.stream_file(request, FileResponse(
+            pdf, as_attachment=True, filename=f"Tickets_event_{event.id}.pdf", content_type='application/pdf',
+        ))
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def _event_stream(body):
+    response = StreamingHttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _authorize_dashboard(request, event_id):
+    """Resolve the viewer (JWT header or `?ticket=`) and check they may watch the event."""
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    if header:
+        raw_token = auth.get_raw_token(header)
+        if not raw_token:
+            return JsonResponse({"error": "Autenticazione richiesta"}, status=401)
+        try:
+            user = auth.get_user(auth.get_validated_token(raw_token))
+        except (InvalidToken, AuthenticationFailed):
+            return JsonResponse({"error": "Token non valido"}, status=401)
+    elif request.GET.get('ticket'):
+        user_id = live_checkins.redeem_ticket(request.GET['ticket'], event_id)
+        user = User.objects.filter(pk=user_id, is_active=True).first() if user_id else None
+        if user is None:
+            return JsonResponse({"error": "Ticket di accesso non valido o scaduto"}, status=401)
+    else:
+        return JsonResponse({"error": "Autenticazione richiesta"}, status=401)
+
+    event = Event.objects.filter(pk=event_id).select_related('organizer').first()
+    if event is None:
+        return JsonResponse({"error": "Evento non trovato"}, status=404)
+    if not can_manage_event_tickets(user, event):
+        return JsonResponse({"error": "Permesso negato"}, status=403)
+    return None
+
+
+class EventCheckInStreamTicketView(APIView):
+    """Issues the single-use ticket that opens one check-in stream (see services.live_checkins)."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, event_id):
+        event = get_object_or_404(Event, pk=event_id)
+        if not can_manage_event_tickets(request.user, event):
+            return Response({"error": "Permesso negato"}, status=status.HTTP_403_FORBIDDEN)
+        return Response(
+            {"ticket": live_checkins.issue_ticket(request.user, event.id), "expires_in": live_checkins.TICKET_TTL},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class EventCheckInStreamView(View):
+    """
+    Server-sent events feed of an event's check-ins for the organizer
+    dashboard: a `snapshot` on connect and every RESYNC_INTERVAL seconds,
+    a `scan` per check-in in between, and a `reconnect` once the stream has
+    been open for STREAM_LIFETIME seconds.  EventSource cannot set headers,
+    so it authenticates with `?ticket=` from EventCheckInStreamTicketView.
+    Served under WSGI, where an open stream would pin a worker, the feed
+    sends the snapshot and ends straight away.
+    """
+
+    async def get(self, request, event_id):
+        denied = await sync_to_async(_authorize_dashboard)(request, event_id)
+        if denied is not None:
+            return denied
+
+        hub = live_checkins.hub
+        if not streaming.is_asgi(request):
+            snapshot = await sync_to_async(hub.resync)(event_id)
+            return _event_stream([_sse('snapshot', snapshot), _sse('reconnect', {'event': event_id})])
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        snapshot = await sync_to_async(hub.subscribe)(event_id, loop, queue)
+        deadline = loop.time() + live_checkins.STREAM_LIFETIME
+
+        async def stream():
+            try:
+                yield _sse('snapshot', snapshot)
+                while (remaining := deadline - loop.time()) > 0:
+                    try:
+                        message = await asyncio.wait_for(queue.get(), min(remaining, live_checkins.RESYNC_INTERVAL))
+                    except asyncio.TimeoutError:
+                        if deadline > loop.time():
+                            yield _sse('snapshot', await sync_to_async(hub.resync)(event_id))
+                    else:
+                        yield _sse('scan', message)
+                yield _sse('reconnect', {'event': event_id})
+            finally:
+                hub.unsubscribe(event_id, loop, queue)
+
+        return _event_stream(stream())
+
+
 class TicketValidationView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         ticket_code = request.data.get('ticket_code')
         ticket_id = request.data.get('ticket_id')
-        from django.utils import timezone
+        if not ticket_code and not ticket_id:
+            return Response({"error": "Identificativo biglietto mancante"}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            if ticket_code:
-                ticket = Ticket.objects.get(ticket_code=ticket_code)
-            elif ticket_id:
-                ticket = Ticket.objects.get(id=ticket_id)
-            else:
-                return Response({"error": "Identificativo biglietto mancante"}, status=status.HTTP_400_BAD_REQUEST)
+        result = checkin.check_in(request.user, ticket_code=ticket_code, ticket_id=ticket_id)
 
-            if not can_manage_event_tickets(request.user, ticket.category.event):
-                return Response({"error": "Permesso negato"}, status=status.HTTP_403_FORBIDDEN)
+        if result.outcome == checkin.NOT_FOUND:
+            return Response({"error": "Biglietto non trovato"}, status=status.HTTP_404_NOT_FOUND)
+        if result.outcome == checkin.FORBIDDEN:
+            return Response({"error": "Permesso negato"}, status=status.HTTP_403_FORBIDDEN)
+        if result.outcome == checkin.ALREADY_CHECKED_IN:
+            return Response({
+                "error": "Biglietto già validato",
+                "checked_in_at": result.checked_in_at,
+                "owner_name": result.owner_name,
+            }, status=status.HTTP_400_BAD_REQUEST)
 
-            if ticket.is_checked_in:
-                return Response({
-                    "error": "Biglietto già validato",
-                    "checked_in_at": ticket.checked_in_at,
-                    "owner_name": f"{ticket.owner.first_name} {ticket.owner.last_name}".strip() or ticket.owner.username,
-                }, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "message": "Biglietto validato con successo",
+            "owner_name": result.owner_name,
+            "category": result.category_name,
+        }, status=status.HTTP_200_OK)
 
-            ticket.is_checked_in = True
-            ticket.checked_in_at = timezone.now()
-            ticket.save()
 
-            return Response({
-                "message": "Biglietto validato con successo",
-                "owner_name": f"{ticket.owner.first_name} {ticket.owner.last_name}".strip() or ticket.owner.username,
-                "category": ticket.category.name,
-            }, status=status.HTTP_200_OK)
+class TicketBatchValidationView(APIView):
+    """Sync the scans an offline gate queued; one result per scan, in order."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = TicketScanBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        scans = serializer.validated_data['scans']
+
+        results = checkin.check_in_many(request.user, scans)
+        return Response({
+            "results": [
+                {
+                    "ticket_code": scan['ticket_code'],
+                    "status": result.outcome,
+                    "checked_in_at": result.checked_in_at,
+                    "owner_name": result.owner_name,
+                    "category": result.category_name,
+                }
+                for scan, result in zip(scans, results)
+            ],
+            "checked_in": sum(result.outcome == checkin.CHECKED_IN for result in results),
+        }, status=status.HTTP_200_OK)
+
+
+class TicketRefundView(APIView):
+    """Cancel a sold ticket and put it back on sale (organizer / ticket managers)."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        ticket = get_object_or_404(Ticket.objects.select_related('category__event'), pk=pk)
+        if not can_manage_event_tickets(request.user, ticket.category.event):
+            return Response({"error": "Permesso negato"}, status=status.HTTP_403_FORBIDDEN)
 
-        except Ticket.DoesNotExist:
+        if not inventory.refund(ticket):
             return Response({"error": "Biglietto non trovato"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def artifact_pending(location=None):
+    """202 for a download whose artifact a worker is still generating, polled again at `location` if given."""
+    headers = {"Retry-After": str(ARTIFACT_RETRY_AFTER)}
+    if location:
+        headers["Location"] = location
+    return Response(
+        {"status": "pending", "message": "Il file è in preparazione, riprova tra poco."},
+        status=status.HTTP_202_ACCEPTED,
+        headers=headers,
+    )
+
+
+def artifact_failed(exc, fallback):
+    """503 with the stored error of an artifact whose job failed, until it may be retried."""
+    return Response(
+        {"error": str(exc) or fallback},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
 class TicketDownloadPDFView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
-        ticket = get_object_or_404(Ticket, pk=pk)
+        ticket = get_object_or_404(Ticket.objects.select_related('category__event', 'owner'), pk=pk)
 
         if not can_access_ticket(request.user, ticket):
             return Response({"error": "Accesso negato"}, status=status.HTTP_403_FORBIDDEN)
 
         try:
-            buffer = generate_ticket_pdf(ticket)
-        except Exception:
-            traceback.print_exc()
-            return Response({"error": "Errore generazione PDF"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            pdf = ticket_artifacts.open_pdf(ticket)
+        except ticket_artifacts.ArtifactFailed as exc:
+            return artifact_failed(exc, "Errore generazione PDF")
+        if pdf is None:
+            return artifact_pending()
 
-        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="Ticket_{ticket.ticket_code}.pdf"'
-        return response
+        return streaming.stream_file(request, FileResponse(
+            pdf, as_attachment=True, filename=f"Ticket_{ticket.ticket_code}.pdf", content_type='application/pdf',
+        ))
 
 
 class TicketDownloadGoogleWalletView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
-        ticket = get_object_or_404(Ticket, pk=pk)
+        ticket = get_object_or_404(Ticket.objects.select_related('category__event', 'owner'), pk=pk)
 
         if not can_access_ticket(request.user, ticket):
             return Response({"error": "Accesso negato"}, status=status.HTTP_403_FORBIDDEN)
 
         try:
-            url = generate_google_wallet_url(ticket, request)
-        except ValueError as exc:
-            return Response({"error": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        except RuntimeError as exc:
-            return Response({"error": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        except Exception:
-            traceback.print_exc()
-            return Response({"error": "Errore generazione Google Wallet"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            url = ticket_artifacts.wallet_url(ticket, request.build_absolute_uri('/'))
+        except ticket_artifacts.ArtifactFailed as exc:
+            return artifact_failed(exc, "Errore generazione Google Wallet")
+        if url is None:
+            return artifact_pending()
 
         return Response({"url": url}, status=status.HTTP_200_OK)
 
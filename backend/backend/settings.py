@@ -130,6 +130,17 @@ else:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            "OPTIONS": {
+                # Take the write lock at BEGIN and wait for it, so concurrent
+                # purchases queue up instead of failing with "database is locked".
+                "transaction_mode": "IMMEDIATE",
+                "timeout": 20,
+            },
+            # A file-backed test database honours the busy timeout above
+            # (shared-cache in-memory databases fail fast on table locks).
+            "TEST": {
+                "NAME": BASE_DIR / "test_db.sqlite3",
+            },
         }
     }
 
@@ -181,4 +192,33 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'api.User'
 
 CORS_ALLOW_ALL_ORIGINS = True
-CORS_ALLOW_CREDENTIALS = True
\ No newline at end of file
+CORS_ALLOW_CREDENTIALS = True
+# Cache
+# Process-local by default; set REDIS_URL to share caches (permissions,
+# catalogue, ...) across workers and instances.
+REDIS_URL = os.getenv("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "getinvolved",
+        }
+    }
+# Whether every process sees the same cache: version bumps, admission
+# claims and permission invalidations only reach other processes if so.
+SHARED_CACHE = bool(REDIS_URL)
+
+# Background jobs
+# The scheduler of each web process drains the job queue, unless the
+# deployment runs dedicated `run_jobs` workers and sets JOB_QUEUE_WORKER=1
+# (Procfile, docker-compose).
+JOB_QUEUE_WORKER = os.getenv("JOB_QUEUE_WORKER") == "1"
+JOB_QUEUE_IN_PROCESS = not JOB_QUEUE_WORKER
@@ -23,13 +23,26 @@ const getContrastColor = (hex: string) => {
     return (r * 0.299 + g * 0.587 + b * 0.114) > 186 ? '#000000' : '#FFFFFF';
 };
 
+// Ticket files are generated in the background: the API answers 202 until they are ready.
+const MAX_PENDING_POLLS = 15;
+
+const getTicketArtifact = async (url: string, config: Record<string, any> = {}) => {
+    for (let attempt = 0; ; attempt++) {
+        const res = await api.get(url, config);
+        if (res.status !== 202) return res;
+        if (attempt >= MAX_PENDING_POLLS) throw new Error('Artifact still pending');
+        const retryAfter = Number(res.headers['retry-after']) || 2;
+        await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+    }
+};
+
 function TicketCard({ ticket, compact = false }: TicketCardProps) {
     const [appleWalletOpen, setAppleWalletOpen] = useState(false);
     const [abuseOpen, setAbuseOpen] = useState(false);
 
     const handleDownloadPDF = async () => {
         try {
-            const res = await api.get(`/api/tickets/${ticket.id}/download/pdf/`, { responseType: 'blob' });
+            const res = await getTicketArtifact(`/api/tickets/${ticket.id}/download/pdf/`, { responseType: 'blob' });
             const url = window.URL.createObjectURL(new Blob([res.data]));
             const link = document.createElement('a');
             link.href = url;
@@ -45,7 +58,7 @@ function TicketCard({ ticket, compact = false }: TicketCardProps) {
 
     const handleGoogleWallet = async () => {
         try {
-            const res = await api.get(`/api/tickets/${ticket.id}/download/google/`);
+            const res = await getTicketArtifact(`/api/tickets/${ticket.id}/download/google/`);
             if (res.data.url) {
                 window.open(res.data.url, '_blank');
             }
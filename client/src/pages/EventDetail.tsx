@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import api from '../api';
+import api, { fetchAllPages } from '../api';
 import { ACCESS_TOKEN } from '../constants';
 import {
     Container, Typography, Box, Button, Grid, Paper, Stack, Chip, Card, CardContent,
@@ -140,8 +140,7 @@ function EventDetail() {
         const fetchMyTickets = async () => {
             if (!isLoggedIn) return;
             try {
-                const res = await api.get('/api/tickets/my/');
-                setMyTickets(res.data);
+                setMyTickets(await fetchAllPages('/api/tickets/my/'));
             } catch (err) {
                 console.error("Errore nel caricamento dei biglietti", err);
             }
@@ -159,8 +158,7 @@ function EventDetail() {
             setSnackbar({ open: true, message: 'Biglietto acquistato con successo! 🎉', severity: 'success' });
             const res = await api.get(`/api/event/public/${id}/`);
             setEvent(res.data);
-            const ticketsRes = await api.get('/api/tickets/my/');
-            setMyTickets(ticketsRes.data);
+            setMyTickets(await fetchAllPages('/api/tickets/my/'));
         } catch (err: any) {
             setSnackbar({ open: true, message: err.response?.data?.error || 'Errore nell\'acquisto', severity: 'error' });
         }
@@ -101,11 +101,11 @@ function Home() {
 
     useEffect(() => {
         api.get('/api/event/public/')
-            .then(res => setEvents(res.data))
+            .then(res => setEvents(res.data.results))
             .catch(() => {
                 // fallback: try the normal events endpoint
                 api.get('/api/event/')
-                    .then(res => setEvents(res.data))
+                    .then(res => setEvents(res.data.results))
                     .catch(console.error);
             })
             .finally(() => setLoading(false));
@@ -2,7 +2,7 @@ import { useState, useEffect } from 'react';
 import { Box, Typography, Grid, CircularProgress } from '@mui/material';
 import ConfirmationNumberIcon from '@mui/icons-material/ConfirmationNumber';
 import TicketCard from '../../components/TicketCard';
-import api from '../../api';
+import { fetchAllPages } from '../../api';
 
 export default function MyTickets() {
     const [myTickets, setMyTickets] = useState<any[]>([]);
@@ -14,8 +14,8 @@ export default function MyTickets() {
 
     const getMyTickets = () => {
         setTicketsLoading(true);
-        api.get('/api/tickets/my/').then(res => {
-            setMyTickets(Array.isArray(res.data) ? res.data : []);
+        fetchAllPages('/api/tickets/my/').then(tickets => {
+            setMyTickets(tickets);
         }).catch(console.error).finally(() => setTicketsLoading(false));
     };
 
@@ -99,4 +99,25 @@ apiClient.interceptors.response.use(
     }
 );
 
+/** One page of a list endpoint: its rows and the URL of the next page, null after the last. */
+export interface Page<T> {
+    next: string | null;
+    results: T[];
+}
+
+// Largest page the API serves, so whole lists take as few requests as possible.
+const MAX_PAGE_SIZE = 200;
+
+/** Every row of a paginated list endpoint, following the `next` links. */
+export async function fetchAllPages<T>(url: string, params: Record<string, unknown> = {}): Promise<T[]> {
+    const rows: T[] = [];
+    let res = await apiClient.get<Page<T>>(url, { params: { page_size: MAX_PAGE_SIZE, ...params } });
+    rows.push(...res.data.results);
+    while (res.data.next) {
+        res = await apiClient.get<Page<T>>(res.data.next);
+        rows.push(...res.data.results);
+    }
+    return rows;
+}
+
 export default apiClient;